@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserProfile, Client, Invoice, InvoiceItem, ContactMessage
+from .models import UserProfile, Client, CatalogItem, Invoice, InvoiceItem, ContactMessage, PdfRenderJob
 
 
 class InvoiceItemInline(admin.TabularInline):
@@ -12,6 +12,7 @@ class InvoiceItemInline(admin.TabularInline):
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'company_name', 'city', 'siret', 'is_ei', 'created_at']
+    list_select_related = ['user']
     search_fields = ['user__username', 'company_name', 'siret']
     list_filter = ['is_ei', 'created_at']
 
@@ -19,13 +20,23 @@ class UserProfileAdmin(admin.ModelAdmin):
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'city', 'email', 'phone', 'created_at']
+    list_select_related = ['user']
     search_fields = ['name', 'email', 'user__username']
     list_filter = ['created_at', 'user']
 
 
+@admin.register(CatalogItem)
+class CatalogItemAdmin(admin.ModelAdmin):
+    list_display = ['description', 'user', 'unit_price', 'updated_at']
+    list_select_related = ['user']
+    search_fields = ['description', 'user__username']
+    list_filter = ['user']
+
+
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
     list_display = ['invoice_number', 'user', 'to_name', 'invoice_date', 'due_date', 'total', 'status', 'created_at']
+    list_select_related = ['user']
     search_fields = ['invoice_number', 'to_name', 'from_name', 'user__username']
     list_filter = ['status', 'invoice_date', 'created_at', 'is_vat_exempt']
     inlines = [InvoiceItemInline]
@@ -58,6 +69,8 @@ class InvoiceAdmin(admin.ModelAdmin):
 @admin.register(InvoiceItem)
 class InvoiceItemAdmin(admin.ModelAdmin):
     list_display = ['invoice', 'description', 'quantity', 'unit_price', 'line_total', 'order']
+    # Facture affichée par son __str__ sur chaque ligne
+    list_select_related = ['invoice']
     search_fields = ['description', 'invoice__invoice_number']
     list_filter = ['invoice__user']
 
@@ -68,3 +81,11 @@ class ContactMessageAdmin(admin.ModelAdmin):
     search_fields = ['first_name', 'last_name', 'email', 'phone', 'message']
     list_filter = ['is_read', 'created_at']
     readonly_fields = ['created_at']
+
+
+@admin.register(PdfRenderJob)
+class PdfRenderJobAdmin(admin.ModelAdmin):
+    list_display = ['invoice', 'status', 'attempts', 'created_at', 'started_at', 'finished_at']
+    list_select_related = ['invoice']
+    list_filter = ['status', 'created_at']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
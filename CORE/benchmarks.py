@@ -0,0 +1,223 @@
+"""
+Mesures de bout en bout des pages principales (``manage.py benchmark``).
+
+Chaque scénario enchaîne des requêtes HTTP par le client de test de Django
+(toute la pile : middlewares, vues, templates, SQL) au nom d'un utilisateur
+du jeu de données de ``CORE.seeding``. Pour chaque scénario sont relevés la
+latence (p50, p95, moyenne, maximum) et le nombre de requêtes SQL.
+
+Les résultats sont un dict sérialisable en JSON ; ``compare`` les confronte à
+une référence enregistrée et signale les régressions de latence au-delà d'un
+seuil relatif, ainsi que toute requête SQL supplémentaire.
+"""
+import logging
+import math
+import platform
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+from itertools import count
+from pathlib import Path
+from time import perf_counter
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client as HttpClient, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import pdf
+from .models import Invoice
+
+SCENARIOS = ['dashboard', 'invoice_list', 'invoice_detail', 'invoice_create', 'invoice_pdf']
+# Factures parcourues par invoice_detail (les plus récentes) : le cache de fragments se remplit comme en usage réel
+DETAIL_INVOICES = 50
+PDF_INVOICES = 1000
+CREATED_NUMBER_PREFIX = 'BENCH-RUN-'
+ITEMS_PER_CREATED_INVOICE = 3
+
+
+def percentile(values, fraction):
+    """Percentile par rang le plus proche (``fraction`` entre 0 et 1)"""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(len(ordered) * fraction)) - 1]
+
+
+def summarize(timings, queries, statuses):
+    milliseconds = [timing * 1000 for timing in timings]
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(milliseconds, 0.5), 2),
+        'p95_ms': round(percentile(milliseconds, 0.95), 2),
+        'mean_ms': round(sum(milliseconds) / len(milliseconds), 2),
+        'max_ms': round(max(milliseconds), 2),
+        'queries': max(queries),
+        'statuses': sorted(set(statuses)),
+    }
+
+
+def invoice_form_data(number, items):
+    """Données POST du formulaire de création d'une facture de ``items`` lignes"""
+    today = date.today()
+    data = {
+        'from_name': 'Benchmark', 'from_address': '1 rue de Paris',
+        'to_name': 'Client benchmark', 'to_address': '2 avenue de Lyon',
+        'invoice_number': number,
+        'invoice_date': today.isoformat(), 'due_date': (today + timedelta(days=30)).isoformat(),
+        'vat_rate': '20', 'recovery_fee': 'on',
+        'items-TOTAL_FORMS': items, 'items-INITIAL_FORMS': 0,
+    }
+    for line in range(items):
+        data.update({f'items-{line}-description': f'Prestation {line + 1}',
+                     f'items-{line}-quantity': str(line + 1), f'items-{line}-unit_price': '125.50'})
+    return data
+
+
+class Benchmark:
+    """Scénarios de mesure pour ``user`` ; ``cold_cache`` vide le cache avant chaque requête"""
+
+    def __init__(self, user, cold_cache=False):
+        self.user = user
+        self.cold_cache = cold_cache
+        self.client = HttpClient()
+        self.client.force_login(user)
+        self.numbers = count(1)
+        self.run_id = timezone.now().strftime('%Y%m%d%H%M%S')
+        invoices = Invoice.objects.filter(user=user).order_by('-invoice_date', '-created_at', '-id')
+        self.detail_ids = list(invoices.values_list('id', flat=True)[:DETAIL_INVOICES])
+        # Une facture différente à chaque téléchargement : rendu PDF réel, pas une lecture du cache disque
+        self.pdf_ids = list(invoices.values_list('id', flat=True)[:PDF_INVOICES])
+
+    # Chaque scénario retourne (méthode, URL, données) de la i-ème requête
+
+    def dashboard(self, index):
+        return 'get', reverse('CORE:dashboard'), None
+
+    def invoice_list(self, index):
+        return 'get', reverse('CORE:invoice_list'), None
+
+    def invoice_detail(self, index):
+        return 'get', reverse('CORE:invoice_detail', args=[self.detail_ids[index % len(self.detail_ids)]]), None
+
+    def invoice_create(self, index):
+        number = f'{CREATED_NUMBER_PREFIX}{self.run_id}-{next(self.numbers)}'
+        return 'post', reverse('CORE:generate_invoice'), invoice_form_data(number, ITEMS_PER_CREATED_INVOICE)
+
+    def invoice_pdf(self, index):
+        return 'get', reverse('CORE:invoice_download_pdf', args=[self.pdf_ids[index % len(self.pdf_ids)]]), None
+
+    def available(self, name):
+        """Raison pour laquelle le scénario ne peut pas tourner, ou None"""
+        if name in ('invoice_detail', 'invoice_pdf') and not self.detail_ids:
+            return "aucune facture"
+        if name == 'invoice_pdf':
+            try:
+                # Chargé ici pour que l'import de WeasyPrint ne compte pas dans la première mesure
+                pdf._load_weasyprint()
+            except pdf.PdfUnavailable as e:
+                return str(e)
+        return None
+
+    def request(self, method, url, data):
+        if self.cold_cache:
+            cache.clear()
+        queries = []
+        # Compteur plutôt que CaptureQueriesContext : pas de journal des requêtes à tenir pendant la mesure
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            start = perf_counter()
+            response = getattr(self.client, method)(url, data)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elapsed = perf_counter() - start
+        # Les messages flash non affichés s'accumuleraient dans le cookie d'une requête à l'autre
+        self.client.cookies.pop('messages', None)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method.upper()} {url} : HTTP {response.status_code}")
+        return elapsed, len(queries), response.status_code
+
+    def run_scenario(self, name, iterations, warmup):
+        scenario = getattr(self, name)
+        for index in range(warmup):
+            self.request(*scenario(index))
+        timings, queries, statuses = [], [], []
+        for index in range(warmup, warmup + iterations):
+            elapsed, query_count, status = self.request(*scenario(index))
+            timings.append(elapsed)
+            queries.append(query_count)
+            statuses.append(status)
+        return summarize(timings, queries, statuses)
+
+    def cleanup(self):
+        """Supprime les factures créées par invoice_create"""
+        for invoice in Invoice.objects.filter(user=self.user, invoice_number__startswith=CREATED_NUMBER_PREFIX):
+            invoice.delete()
+
+
+def run(user, scenarios=SCENARIOS, iterations=50, warmup=3, cold_cache=False, progress=None):
+    """Exécute ``scenarios`` pour ``user`` ; retourne les résultats (voir le docstring du module)"""
+    results = {
+        'meta': {
+            'date': timezone.now().isoformat(timespec='seconds'),
+            'user': user.username,
+            'invoices': Invoice.objects.filter(user=user).count(),
+            'iterations': iterations,
+            'warmup': warmup,
+            'cold_cache': cold_cache,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'sqlite': sqlite3.sqlite_version,
+            'cache': settings.CACHES['default']['BACKEND'],
+        },
+        'scenarios': {},
+        'skipped': {},
+    }
+    # Cache PDF vide et propre à la mesure ; rendu synchrone pour mesurer la génération elle-même.
+    # Le journal par requête de ServerTimingMiddleware (INFO) est coupé : il noierait la sortie.
+    request_log = logging.getLogger('CORE.timing')
+    level = request_log.level
+    request_log.setLevel(max(level, logging.WARNING))
+    with tempfile.TemporaryDirectory() as pdf_cache, override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            PDF_CACHE_DIR=Path(pdf_cache), PDF_ASYNC_RENDERING=False):
+        benchmark = Benchmark(user, cold_cache)
+        try:
+            for name in scenarios:
+                reason = benchmark.available(name)
+                if reason:
+                    results['skipped'][name] = reason
+                    continue
+                results['scenarios'][name] = benchmark.run_scenario(name, iterations, warmup)
+                if progress:
+                    progress(name, results['scenarios'][name])
+        finally:
+            benchmark.cleanup()
+            request_log.setLevel(level)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2, min_delta_ms=5):
+    """
+    Lignes ``(scénario, mesure, référence, actuel, écart relatif, régression)``
+    pour les scénarios présents des deux côtés. Une latence (p50, p95) est en
+    régression au-delà de ``tolerance`` (0.2 = +20 %) et d'au moins
+    ``min_delta_ms`` (le bruit de mesure des pages rapides dépasse vite 20 %),
+    le nombre de requêtes SQL dès qu'il augmente.
+    """
+    rows = []
+    for name, current in results['scenarios'].items():
+        reference = baseline.get('scenarios', {}).get(name)
+        if reference is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'queries'):
+            before, after = reference[metric], current[metric]
+            change = (after - before) / before if before else 0.0
+            if metric == 'queries':
+                regression = after > before
+            else:
+                regression = change > tolerance and after - before >= min_delta_ms
+            rows.append((name, metric, before, after, change, regression))
+    return rows
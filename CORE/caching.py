@@ -0,0 +1,65 @@
+"""
+Compteurs de génération pour les fragments mis en cache.
+
+Chaque utilisateur a un compteur par espace de noms (``clients``,
+``catalog``, ``invoices``) qui entre dans les clés de cache de ses fragments.
+Une écriture incrémente le compteur : toutes les entrées précédentes
+deviennent inaccessibles d'un coup, sans avoir à les énumérer, et expirent
+d'elles-mêmes.
+
+Les fragments de factures des templates (``{% cache %}``) sont en plus
+versionnés par ``Invoice.updated_at`` ; le compteur ``invoices`` couvre les
+écritures qui ne le modifient pas (lignes, UPDATE en masse).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _counter_key(namespace, user_id):
+    return f'gen:{namespace}:{user_id}'
+
+
+def _initial_generation():
+    # Un compteur évincé du cache ne doit pas retomber sur une valeur déjà servie
+    return time.time_ns()
+
+
+def generation(namespace, user_id):
+    """Génération courante de ``namespace`` pour l'utilisateur"""
+    key = _counter_key(namespace, user_id)
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, _initial_generation(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump(namespace, user_id):
+    """Invalide tous les fragments de ``namespace`` de l'utilisateur"""
+    key = _counter_key(namespace, user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_generation(), timeout=None)
+
+
+def fragment_key(namespace, user_id, *parts):
+    """Clé d'un fragment, valable jusqu'au prochain ``bump``"""
+    digest = hashlib.sha1('\x1f'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'frag:{namespace}:{user_id}:{generation(namespace, user_id)}:{digest}'
+
+
+def cached_fragment(key, render):
+    """HTML en cache sous ``key``, produit par ``render()`` en cas d'absence"""
+    return cache.get_or_set(key, render, settings.FRAGMENT_CACHE_TIMEOUT)
+
+
+def template_fragments(user):
+    """Contexte des templates utilisant ``{% cache fragment_timeout ... fragment_generation %}``"""
+    return {
+        'fragment_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        'fragment_generation': generation('invoices', user.pk),
+    }
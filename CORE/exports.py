@@ -0,0 +1,284 @@
+"""
+Exports en flux : archive ZIP des PDF de factures, grand livre CSV / XLSX.
+
+Les PDF sont lus depuis le cache disque ou rendus en parallèle par un pool de
+processus, puis ajoutés un par un à l'archive ; le générateur ne garde en
+mémoire qu'une fenêtre bornée de rendus en cours et le morceau d'archive
+courant, quel que soit le nombre de factures.
+
+Le grand livre (une ligne par ligne de facture, en-tête de facture répété)
+est lu par ``values_list(...).iterator()`` et écrit au fil de l'eau : la
+mémoire reste constante et l'en-tête du fichier part avant la requête. Ses
+colonnes reprennent les noms attendus par ``CORE.importers``.
+"""
+import csv
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date
+from decimal import Decimal
+from xml.sax.saxutils import escape
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+import django
+from django.conf import settings
+
+from .pagination import INVOICE_ORDERING
+from .pdf import PdfCache, get_invoice_pdf, invoice_pdf_key
+from .pdf_jobs import render_invoice_job
+
+CHUNK_SIZE = 64 * 1024
+LEDGER_ITERATOR_CHUNK = 2000
+LEDGER_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+LEDGER_COLUMNS = [
+    ('invoice_number', 'invoice_number'),
+    ('invoice_date', 'invoice_date'),
+    ('due_date', 'due_date'),
+    ('status', 'status'),
+    ('to_name', 'to_name'),
+    ('to_address', 'to_address'),
+    ('to_city', 'to_city'),
+    ('to_email', 'to_email'),
+    ('vat_rate', 'vat_rate'),
+    ('is_vat_exempt', 'is_vat_exempt'),
+    ('subtotal', 'subtotal'),
+    ('vat_amount', 'vat_amount'),
+    ('total', 'total'),
+    ('description', 'items__description'),
+    ('quantity', 'items__quantity'),
+    ('unit_price', 'items__unit_price'),
+    ('line_total', 'items__line_total'),
+]
+
+
+class _StreamBuffer:
+    """Fichier en écriture seule dont le contenu est récupéré au fil de l'eau (texte encodé en UTF-8)"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.pending = 0
+
+    def write(self, data):
+        chunk = data.encode('utf-8') if isinstance(data, str) else bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        self.pending += len(chunk)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.pending = 0
+        return data
+
+
+def _render_pool(workers):
+    """Pool de processus de rendu ; spawn : aucun état Django (connexions) hérité du parent"""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=django.setup)
+
+
+def iter_invoice_pdfs(invoices, workers=None):
+    """
+    Produit ``(facture, chemin du PDF)`` dans l'ordre du queryset. Les absents
+    du cache sont rendus par au plus ``workers`` processus (PDF_EXPORT_WORKERS),
+    avec au plus ``2 × workers`` rendus en cours ; une erreur de rendu est
+    relevée à la place de sa facture et arrête le pool. Le pool n'est démarré
+    qu'au premier PDF absent du cache, pour chaque export (requête web comprise).
+    """
+    workers = settings.PDF_EXPORT_WORKERS if workers is None else workers
+    window = max(1, workers) * 2
+    cache = PdfCache()
+    pending = deque()
+    pool = None
+    try:
+        for invoice in invoices:
+            _, key = invoice_pdf_key(invoice)
+            path = cache.get(invoice.id, key)
+            if path is None and workers > 1:
+                if pool is None:
+                    pool = _render_pool(workers)
+                path = pool.submit(render_invoice_job, invoice.id)
+            elif path is None:
+                path = get_invoice_pdf(invoice)
+            pending.append((invoice, path))
+            while len(pending) >= window or (pending and not _is_running(pending[0][1])):
+                yield _resolve(*pending.popleft())
+        while pending:
+            yield _resolve(*pending.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def _is_running(path):
+    return isinstance(path, Future) and not path.done()
+
+
+def _resolve(invoice, path):
+    if isinstance(path, Future):
+        path = path.result()
+    return invoice, path
+
+
+def _archive_name(invoice):
+    number = invoice.invoice_number.replace('/', '-').replace('\\', '-')
+    return f"facture_{number}.pdf"
+
+
+def stream_invoices_zip(invoices, workers=None, archive_name=_archive_name):
+    """Générateur de morceaux d'une archive ZIP contenant le PDF de chaque facture"""
+    buffer = _StreamBuffer()
+    with ZipFile(buffer, 'w', compression=ZIP_STORED) as archive:
+        for invoice, path in iter_invoice_pdfs(invoices, workers):
+            try:
+                source = open(path, 'rb')
+            except FileNotFoundError:
+                # Évincé du cache entre-temps : rendu immédiat
+                source = open(get_invoice_pdf(invoice), 'rb')
+            with source, archive.open(archive_name(invoice), 'w', force_zip64=True) as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    target.write(chunk)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            data = buffer.pop()
+            if data:
+                yield data
+    yield buffer.pop()
+
+
+def ledger_rows(invoices):
+    """
+    Tuples du grand livre pour ``invoices`` (une ligne par ligne de facture,
+    une ligne vide de détail pour une facture sans lignes), dans l'ordre de la liste.
+    """
+    return (invoices
+            .order_by(*INVOICE_ORDERING, 'items__order', 'items__id')
+            .values_list(*[lookup for _, lookup in LEDGER_COLUMNS])
+            .iterator(chunk_size=LEDGER_ITERATOR_CHUNK))
+
+
+def stream_ledger_csv(rows):
+    """Générateur de morceaux d'un CSV UTF-8 (avec BOM pour les tableurs)"""
+    buffer = _StreamBuffer()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff'.encode('utf-8'))
+    writer.writerow([name for name, _ in LEDGER_COLUMNS])
+    yield buffer.pop()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.pending >= CHUNK_SIZE:
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+_XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Factures" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '<Relationship Id="rId2" Target="styles.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+        '</Relationships>'),
+    # Style 1 : date (format intégré 14), style 2 : montant à deux décimales (format intégré 2)
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="2" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'),
+}
+_EXCEL_EPOCH = date(1899, 12, 30)
+_XML_ILLEGAL = dict.fromkeys(c for c in range(32) if c not in (9, 10, 13))
+
+
+def _xlsx_cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, date):
+        return f'<c s="1"><v>{(value - _EXCEL_EPOCH).days}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, Decimal):
+        return f'<c s="2"><v>{value}</v></c>'
+    text = escape(str(value).translate(_XML_ILLEGAL))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def stream_ledger_xlsx(rows):
+    """
+    Générateur de morceaux d'un classeur XLSX minimal (une feuille, chaînes en
+    ligne) écrit directement en SpreadsheetML : pas de dépendance, mémoire constante.
+    """
+    buffer = _StreamBuffer()
+    with ZipFile(buffer, 'w', compression=ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_STATIC.items():
+            workbook.writestr(name, content)
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            header = ''.join(_xlsx_cell(name) for name, _ in LEDGER_COLUMNS)
+            sheet.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                         f'<sheetData><row>{header}</row>').encode('utf-8'))
+            yield buffer.pop()
+            pending = []
+            size = 0
+            for row in rows:
+                xml = f"<row>{''.join(_xlsx_cell(value) for value in row)}</row>"
+                pending.append(xml)
+                size += len(xml)
+                if size >= CHUNK_SIZE:
+                    sheet.write(''.join(pending).encode('utf-8'))
+                    pending, size = [], 0
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            sheet.write((''.join(pending) + '</sheetData></worksheet>').encode('utf-8'))
+    yield buffer.pop()
+
+
+def stream_ledger(invoices, fmt):
+    """Morceaux du grand livre de ``invoices`` au format ``fmt`` ('csv' ou 'xlsx')"""
+    rows = ledger_rows(invoices)
+    return stream_ledger_xlsx(rows) if fmt == 'xlsx' else stream_ledger_csv(rows)
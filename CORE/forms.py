@@ -1,5 +1,6 @@
 from django import forms
-from .models import ContactMessage
+from .importers import detect_format
+from .models import ContactMessage, Invoice
 
 
 class InvoiceForm(forms.Form):
@@ -73,10 +74,11 @@ class InvoiceForm(forms.Form):
         required=True,
         widget=forms.TextInput(attrs={
             'class': 'form-control',
-            'placeholder': 'Nom du client'
+            'placeholder': 'Nom du client',
+            'autocomplete': 'off',
         })
     )
-    
+
     to_address = forms.CharField(
         label='Adresse',
         max_length=200,
@@ -100,7 +102,10 @@ class InvoiceForm(forms.Form):
         required=False,
         widget=forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'email@domaine.com'})
     )
-    
+
+    # Client choisi dans l'autocomplétion (la facture lui est rattachée)
+    client_id = forms.IntegerField(required=False, widget=forms.HiddenInput)
+
     # Informations de la facture
     invoice_number = forms.CharField(
         label='Numéro de facture',
@@ -241,7 +246,7 @@ class InvoiceForm(forms.Form):
 class ItemForm(forms.Form):
     description = forms.CharField(
         label='Description', max_length=500, required=True,
-        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Désignation'}))
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Désignation', 'autocomplete': 'off'}))
     quantity = forms.DecimalField(
         label='Qté', max_digits=10, decimal_places=2, required=True,
         initial=1, widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}))
@@ -351,6 +356,131 @@ class ClientForm(forms.Form):
         return client
 
 
+class CatalogItemForm(forms.Form):
+    """Formulaire pour ajouter un article au catalogue"""
+    description = forms.CharField(
+        label='Description',
+        max_length=500,
+        required=True,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ex: Heure de conseil'})
+    )
+    unit_price = forms.DecimalField(
+        label='Prix unitaire HT',
+        max_digits=10,
+        decimal_places=2,
+        min_value=0,
+        required=True,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'})
+    )
+
+    def save(self, user):
+        """Crée l'article dans le catalogue de ``user``"""
+        from .models import CatalogItem
+        return CatalogItem.objects.create(
+            user=user,
+            description=self.cleaned_data['description'],
+            unit_price=self.cleaned_data['unit_price'],
+        )
+
+
+class CatalogRepriceForm(forms.Form):
+    """Révision des prix du catalogue en pourcentage"""
+    percent = forms.DecimalField(
+        label='Variation (%)',
+        max_digits=5,
+        decimal_places=2,
+        min_value=-99,
+        max_value=999,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'placeholder': 'Ex: 3 ou -5'})
+    )
+    prefix = forms.CharField(
+        label='Descriptions commençant par',
+        max_length=500,
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Tout le catalogue'})
+    )
+
+
+class InvoiceExportForm(forms.Form):
+    """Sélection des factures à exporter (période d'émission et statut)"""
+    date_from = forms.DateField(
+        label='Du',
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    date_to = forms.DateField(
+        label='Au',
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    status = forms.ChoiceField(
+        label='Statut',
+        choices=[('', 'Tous')] + Invoice.STATUS_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
+    def filter(self, invoices):
+        """Applique les filtres validés à un queryset de factures"""
+        data = self.cleaned_data
+        if data.get('date_from'):
+            invoices = invoices.filter(invoice_date__gte=data['date_from'])
+        if data.get('date_to'):
+            invoices = invoices.filter(invoice_date__lte=data['date_to'])
+        if data.get('status'):
+            invoices = invoices.filter(status=data['status'])
+        return invoices
+
+
+class InvoiceFilterForm(InvoiceExportForm):
+    """Filtres de la liste des factures (statut, client, période, montant TTC)"""
+    client = forms.IntegerField(required=False, widget=forms.HiddenInput)
+    amount_min = forms.DecimalField(
+        label='Montant min.',
+        max_digits=12,
+        decimal_places=2,
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'})
+    )
+    amount_max = forms.DecimalField(
+        label='Montant max.',
+        max_digits=12,
+        decimal_places=2,
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'})
+    )
+
+    def filter(self, invoices):
+        invoices = super().filter(invoices)
+        data = self.cleaned_data
+        if data.get('client'):
+            invoices = invoices.filter(client_id=data['client'])
+        if data.get('amount_min') is not None:
+            invoices = invoices.filter(total__gte=data['amount_min'])
+        if data.get('amount_max') is not None:
+            invoices = invoices.filter(total__lte=data['amount_max'])
+        return invoices
+
+
+class InvoiceImportForm(forms.Form):
+    """Import d'un fichier de factures (CSV ou JSON Lines)"""
+    file = forms.FileField(
+        label='Fichier (.csv, .jsonl)',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.jsonl,.ndjson'})
+    )
+    dry_run = forms.BooleanField(
+        label='Vérifier seulement (aucune facture enregistrée)',
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if detect_format(upload.name) is None:
+            raise forms.ValidationError("Format non reconnu : fichier .csv ou .jsonl attendu.")
+        return upload
+
+
 class ContactForm(forms.ModelForm):
     class Meta:
         model = ContactMessage
@@ -0,0 +1,346 @@
+"""
+Test de charge HTTP contre un serveur gunicorn local (``manage.py loadtest``).
+
+Des utilisateurs virtuels (un thread chacun, une connexion HTTP et un jeu de
+cookies propres) se connectent avec les comptes de ``CORE.seeding`` par le
+vrai formulaire de connexion (cookie et jeton CSRF, session), puis enchaînent
+jusqu'à l'échéance des requêtes tirées au hasard selon un mélange pondéré :
+tableau de bord, liste, détail, création d'une facture de N lignes,
+téléchargement du PDF. Chaque requête est chronométrée côté client ; un statut
+inattendu ou une erreur réseau compte comme erreur.
+
+``run_server`` démarre ``gunicorn EasInvoice.wsgi`` (le ``Procfile``, avec
+``gunicorn.conf.py``) sur un port libre pour une combinaison workers/threads :
+la commande mesure ainsi plusieurs configurations d'une même machine. Le
+générateur n'utilise que la bibliothèque standard ; il tourne dans le même
+processus Python que la commande, qui doit donc rester loin de la saturation
+CPU pour ne pas fausser les latences (voir ``client_cpu`` dans les résultats).
+"""
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import seeding
+from .benchmarks import invoice_form_data, percentile
+from .models import Invoice
+
+SCENARIOS = ['dashboard', 'invoice_list', 'invoice_detail', 'invoice_create', 'invoice_pdf']
+DEFAULT_MIX = {'dashboard': 3, 'invoice_list': 2, 'invoice_detail': 2, 'invoice_create': 2, 'invoice_pdf': 1}
+# Statuts attendus ; 202 : rendu PDF délégué au worker (PDF_ASYNC_RENDERING)
+EXPECTED_STATUSES = {'invoice_create': {302}, 'invoice_pdf': {200, 202}}
+CREATED_NUMBER_PREFIX = 'LOAD-'
+INVOICES_PER_USER = 200
+MAX_ERROR_SAMPLES = 10
+SERVER_START_TIMEOUT = 30
+
+
+class LoadTestError(RuntimeError):
+    pass
+
+
+def parse_mix(value):
+    """``'dashboard=3,invoice_pdf=1'`` -> ``{'dashboard': 3, 'invoice_pdf': 1}``"""
+    mix = {}
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise ValueError(f"Scénario inconnu : {name} (choix : {', '.join(SCENARIOS)})")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise ValueError(f"Poids invalide pour {name} : {weight}")
+        if mix[name] < 0:
+            raise ValueError(f"Poids négatif pour {name}")
+    if not any(mix.values()):
+        raise ValueError("Le mélange de scénarios est vide.")
+    return mix
+
+
+class Session:
+    """Connexion HTTP persistante et cookies d'un utilisateur virtuel"""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+        self.cookies = {}
+        self.expires = {}
+
+    def request(self, method, path, data=None):
+        headers = {}
+        # Cookies à durée de vie courte (épinglage sur la base principale, voir CORE.replica)
+        now = time.monotonic()
+        for name in [name for name, deadline in self.expires.items() if deadline <= now]:
+            self.cookies.pop(name, None)
+            del self.expires[name]
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            if 'csrftoken' in self.cookies:
+                headers['X-CSRFToken'] = self.cookies['csrftoken']
+        # Connexion gardée ouverte fermée entre-temps par le serveur (keep-alive expiré) :
+        # nouvel essai sur une connexion neuve, comme un navigateur
+        for attempt in (1, 2):
+            reused = self.connection.sock is not None
+            try:
+                self.connection.request(method, path, body, headers)
+                response = self.connection.getresponse()
+                content = response.read()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                self.connection.close()
+                stale = isinstance(e, (BrokenPipeError, ConnectionResetError, http.client.RemoteDisconnected))
+                if attempt == 2 or not (reused and stale):
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel['max-age'] == '0':
+                    self.cookies.pop(name, None)
+                    self.expires.pop(name, None)
+                    continue
+                self.cookies[name] = morsel.value
+                if morsel['max-age']:
+                    self.expires[name] = time.monotonic() + int(morsel['max-age'])
+                else:
+                    self.expires.pop(name, None)
+        return response.status, content
+
+    def login(self, username, password):
+        login_url = reverse('CORE:login')
+        self.request('GET', login_url)
+        status, _ = self.request('POST', login_url, {'username': username, 'password': password})
+        if status != 302 or 'sessionid' not in self.cookies:
+            raise LoadTestError(f"Connexion impossible pour {username} (HTTP {status})")
+
+    def close(self):
+        self.connection.close()
+
+
+class VirtualUser(threading.Thread):
+    """Enchaîne les scénarios tirés de ``mix`` jusqu'à ``deadline``"""
+
+    def __init__(self, test, index, username, invoice_ids):
+        super().__init__(name=f'vu-{index}', daemon=True)
+        self.test = test
+        self.index = index
+        self.username = username
+        self.invoice_ids = invoice_ids
+        self.random = random.Random(index)
+        self.created = 0
+        self.samples = []
+        self.errors = []
+        self.login_error = None
+
+    def scenario(self, name):
+        """(méthode, chemin, données) d'une requête du scénario ``name``"""
+        if name == 'dashboard':
+            return 'GET', reverse('CORE:dashboard'), None
+        if name == 'invoice_list':
+            return 'GET', reverse('CORE:invoice_list'), None
+        if name == 'invoice_detail':
+            return 'GET', reverse('CORE:invoice_detail', args=[self.random.choice(self.invoice_ids)]), None
+        if name == 'invoice_pdf':
+            return 'GET', reverse('CORE:invoice_download_pdf', args=[self.random.choice(self.invoice_ids)]), None
+        self.created += 1
+        number = f'{CREATED_NUMBER_PREFIX}{self.test.run_id}-{self.index}-{self.created}'
+        return 'POST', reverse('CORE:generate_invoice'), invoice_form_data(number, self.test.items)
+
+    def run(self):
+        session = Session(self.test.base_url, self.test.timeout)
+        try:
+            session.login(self.username, self.test.password)
+        except (LoadTestError, OSError, http.client.HTTPException) as e:
+            self.login_error = f"{self.username} : {e}"
+        # Les connexions ne sont pas mesurées : le chronomètre part quand tous les utilisateurs sont prêts
+        self.test.start_line.wait()
+        if self.login_error:
+            session.close()
+            return
+        names, weights = zip(*self.test.mix.items())
+        try:
+            while time.monotonic() < self.test.deadline:
+                name = self.random.choices(names, weights)[0]
+                if name in ('invoice_detail', 'invoice_pdf') and not self.invoice_ids:
+                    continue
+                method, path, data = self.scenario(name)
+                start = time.perf_counter()
+                try:
+                    status, _ = session.request(method, path, data)
+                except (OSError, http.client.HTTPException) as e:
+                    status, error = None, f"{type(e).__name__}: {e}"
+                else:
+                    error = None if status in EXPECTED_STATUSES.get(name, {200}) else f"HTTP {status}"
+                self.samples.append((name, time.perf_counter() - start, status, error is not None))
+                if error and len(self.errors) < MAX_ERROR_SAMPLES:
+                    self.errors.append(f"{method} {path} : {error}")
+                if self.test.think_time:
+                    time.sleep(self.random.expovariate(1 / self.test.think_time))
+        finally:
+            session.close()
+
+
+class LoadTest:
+    """
+    Paramètres d'un tir : ``concurrency`` utilisateurs virtuels pendant
+    ``duration`` secondes contre ``base_url``, requêtes tirées de ``mix``,
+    factures créées de ``items`` lignes, pause moyenne ``think_time`` (s).
+    """
+
+    def __init__(self, base_url, concurrency=10, duration=30, mix=None, items=3, think_time=0,
+                 prefix=seeding.DEFAULT_PREFIX, password=seeding.DEFAULT_PASSWORD, timeout=30):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.duration = duration
+        self.mix = mix or DEFAULT_MIX
+        self.items = items
+        self.think_time = think_time
+        self.prefix = prefix
+        self.password = password
+        self.timeout = timeout
+        self.run_id = timezone.now().strftime('%Y%m%d%H%M%S')
+        self.start_line = threading.Barrier(concurrency + 1, action=self._start_clock)
+        self.started = self.deadline = self.cpu_start = None
+
+    def _start_clock(self):
+        self.cpu_start, self.started = time.process_time(), time.monotonic()
+        self.deadline = self.started + self.duration
+
+    def accounts(self):
+        """(nom d'utilisateur, factures) des comptes du jeu de données, un par utilisateur virtuel"""
+        users = list(seeding.existing_users(self.prefix).order_by('username')[:self.concurrency])
+        if not users:
+            raise LoadTestError(f"Aucun utilisateur '{self.prefix}-*' : lancer d'abord seed_benchmark.")
+        invoices = {
+            user.pk: list(Invoice.objects.filter(user=user).order_by('-invoice_date', '-id')
+                          .values_list('id', flat=True)[:INVOICES_PER_USER])
+            for user in users
+        }
+        return [(users[index % len(users)].username, invoices[users[index % len(users)].pk])
+                for index in range(self.concurrency)]
+
+    def run(self):
+        """Exécute le tir ; retourne le rapport (voir ``report``)"""
+        virtual_users = [VirtualUser(self, index, username, invoice_ids)
+                         for index, (username, invoice_ids) in enumerate(self.accounts())]
+        for virtual_user in virtual_users:
+            virtual_user.start()
+        self.start_line.wait()
+        for virtual_user in virtual_users:
+            virtual_user.join()
+        elapsed = time.monotonic() - self.started
+        cpu = time.process_time() - self.cpu_start
+        self.cleanup()
+        return self.report(virtual_users, elapsed, cpu)
+
+    def report(self, virtual_users, elapsed, cpu):
+        """
+        Débit (requêtes/s), percentiles de latence (ms) et taux d'erreur, au
+        total et par scénario ; ``client_cpu`` est la part de CPU consommée par
+        le générateur lui-même.
+        """
+        samples = [sample for vu in virtual_users for sample in vu.samples]
+        login_errors = [vu.login_error for vu in virtual_users if vu.login_error]
+        result = {
+            'concurrency': self.concurrency,
+            'duration_s': round(elapsed, 2),
+            'login_errors': len(login_errors),
+            'client_cpu': round(cpu / elapsed, 2) if elapsed else 0,
+            **summarize(samples, elapsed),
+            'scenarios': {},
+            'error_samples': (login_errors + [error for vu in virtual_users for error in vu.errors])[
+                :MAX_ERROR_SAMPLES],
+        }
+        for name in self.mix:
+            scenario_samples = [sample for sample in samples if sample[0] == name]
+            if scenario_samples:
+                result['scenarios'][name] = summarize(scenario_samples, elapsed)
+        return result
+
+    def cleanup(self):
+        """Supprime les factures créées pendant le tir"""
+        for invoice in Invoice.objects.filter(invoice_number__startswith=f'{CREATED_NUMBER_PREFIX}{self.run_id}-'):
+            invoice.delete()
+
+
+def summarize(samples, elapsed):
+    milliseconds = [duration * 1000 for _, duration, _, _ in samples]
+    errors = sum(error for _, _, _, error in samples)
+    statuses = {}
+    for _, _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    result = {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0,
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0,
+        'statuses': statuses,
+    }
+    if milliseconds:
+        result.update({f'p{int(fraction * 100)}_ms': round(percentile(milliseconds, fraction), 1)
+                       for fraction in (0.5, 0.95, 0.99)})
+        result['max_ms'] = round(max(milliseconds), 1)
+    return result
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(base_url, process, timeout=SERVER_START_TIMEOUT):
+    parts = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise LoadTestError(f"gunicorn s'est arrêté au démarrage (code {process.returncode})")
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=2)
+        try:
+            connection.request('GET', reverse('CORE:login'))
+            if connection.getresponse().status < 500:
+                return
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.2)
+        finally:
+            connection.close()
+    raise LoadTestError(f"gunicorn ne répond pas après {timeout} s")
+
+
+@contextmanager
+def run_server(workers, threads, log_path, extra_args=()):
+    """
+    Démarre ``gunicorn EasInvoice.wsgi`` sur un port libre de 127.0.0.1 et
+    produit son URL ; la sortie du serveur va dans ``log_path``.
+    """
+    port = _free_port()
+    env = {**os.environ, 'ALLOWED_HOSTS': ','.join([*settings.ALLOWED_HOSTS, '127.0.0.1'])}
+    command = [sys.executable, '-m', 'gunicorn', 'EasInvoice.wsgi', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--threads', str(threads), *extra_args]
+    with open(log_path, 'ab') as log:
+        process = subprocess.Popen(command, cwd=Path(settings.BASE_DIR), env=env, stdout=log, stderr=log)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        _wait_until_up(base_url, process)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
@@ -0,0 +1,80 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE import benchmarks, seeding
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = ("Mesure la latence (p50/p95) et le nombre de requêtes SQL des pages principales "
+            "et compare à une référence")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default=f'{seeding.DEFAULT_PREFIX}-0001',
+                            help="Utilisateur mesuré (défaut : premier utilisateur de seed_benchmark)")
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=benchmarks.SCENARIOS,
+                            help="Scénario à exécuter (option répétable, défaut : tous)")
+        parser.add_argument('--iterations', type=int, default=50, help="Requêtes mesurées par scénario (défaut : 50)")
+        parser.add_argument('--warmup', type=int, default=3, help="Requêtes à blanc par scénario (défaut : 3)")
+        parser.add_argument('--cold-cache', action='store_true', help="Vide le cache avant chaque requête")
+        parser.add_argument('--output', help="Fichier JSON des résultats")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE),
+                            help="Référence à laquelle comparer (défaut : benchmarks/baseline.json)")
+        parser.add_argument('--save-baseline', action='store_true', help="Enregistre les résultats comme référence")
+        parser.add_argument('--tolerance', type=float, default=20,
+                            help="Hausse de latence tolérée avant de signaler une régression, en %% (défaut : 20)")
+        parser.add_argument('--min-delta', type=float, default=5,
+                            help="Hausse de latence minimale signalée, en ms (défaut : 5)")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['warmup'] < 0:
+            raise CommandError("--iterations doit être positif et --warmup positif ou nul.")
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Utilisateur inconnu : {options['user']} (lancer d'abord seed_benchmark)")
+
+        def progress(name, result):
+            self.stdout.write(f"{name:>15}: p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  "
+                              f"{result['queries']:3d} requêtes SQL")
+
+        try:
+            results = benchmarks.run(user, options['scenarios'] or benchmarks.SCENARIOS, options['iterations'],
+                                     options['warmup'], options['cold_cache'], progress)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        for name, reason in results['skipped'].items():
+            self.stdout.write(self.style.WARNING(f"{name:>15}: ignoré ({reason})"))
+
+        if options['output']:
+            self._write(options['output'], results)
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            self._write(baseline_path, results)
+            self.stdout.write(self.style.SUCCESS(f"Référence enregistrée : {baseline_path}"))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(f"Pas de référence ({baseline_path}) : --save-baseline pour en créer une.")
+            return
+
+        rows = benchmarks.compare(results, json.loads(baseline_path.read_text()), options['tolerance'] / 100,
+                                   options['min_delta'])
+        self.stdout.write(f"\nComparaison avec {baseline_path} :")
+        for name, metric, before, after, change, regression in rows:
+            line = f"{name:>15} {metric:>8}: {before:>9} -> {after:>9} ({change:+.0%})"
+            self.stdout.write(self.style.ERROR(line + "  RÉGRESSION") if regression else line)
+        regressions = sum(row[-1] for row in rows)
+        if regressions:
+            raise CommandError(f"{regressions} régression(s) par rapport à la référence.")
+        self.stdout.write(self.style.SUCCESS("Aucune régression."))
+
+    @staticmethod
+    def _write(path, results):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2, ensure_ascii=False) + '\n')
@@ -0,0 +1,63 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE.models import Invoice
+from CORE.pdf import (
+    InvoicePdfRenderer, build_invoice_context, render_invoice_pdf, render_invoices_batch_pdf, weasyprint_available,
+)
+
+
+class Command(BaseCommand):
+    help = ("Compare le rendu groupé (un seul PDF) à N rendus individuels, avec un moteur neuf par "
+            "facture (feuille de style et polices analysées à chaque appel) ou le moteur partagé")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Nom d'utilisateur dont les factures sont rendues (défaut: toutes)")
+        parser.add_argument('--count', type=int, default=20, help="Nombre de factures (défaut: 20)")
+        parser.add_argument('--repeat', type=int, default=3, help="Répétitions, le meilleur temps est retenu")
+
+    def handle(self, *args, **options):
+        if not weasyprint_available():
+            raise CommandError("WeasyPrint n'est pas installé.")
+
+        invoices = Invoice.objects.prefetch_related('items')
+        if options['user']:
+            try:
+                invoices = invoices.filter(user=User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"Utilisateur inconnu: {options['user']}")
+        invoices = list(invoices[:options['count']])
+        if not invoices:
+            raise CommandError("Aucune facture à rendre.")
+        count = len(invoices)
+
+        def separate():
+            # Référence sans moteur partagé : CSS et polices analysées pour chaque facture
+            for invoice in invoices:
+                InvoicePdfRenderer().write_pdf(build_invoice_context(invoice))
+
+        def shared():
+            for invoice in invoices:
+                render_invoice_pdf(build_invoice_context(invoice))
+
+        def batch():
+            render_invoices_batch_pdf(invoices)
+
+        # Un rendu à blanc pour exclure les imports et l'initialisation de WeasyPrint
+        render_invoices_batch_pdf(invoices[:1])
+        results = {}
+        for name, func in (('separate', separate), ('shared', shared), ('batch', batch)):
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+            results[name] = min(timings)
+            self.stdout.write(f"{name:>8}: {results[name]:.3f} s au total, "
+                              f"{results[name] / count * 1000:.1f} ms par facture")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} factures : rendu groupé {results['separate'] / results['batch']:.2f}x plus rapide "
+            f"que des rendus séparés, {results['shared'] / results['batch']:.2f}x que le moteur partagé"))
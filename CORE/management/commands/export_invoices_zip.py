@@ -0,0 +1,56 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE import replica
+from CORE.exports import stream_invoices_zip
+from CORE.forms import InvoiceExportForm
+from CORE.models import Invoice
+
+
+class Command(BaseCommand):
+    help = "Exporte dans une archive ZIP les PDF des factures d'une période"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Chemin de l'archive ZIP à écrire")
+        parser.add_argument('--user', help="Nom d'utilisateur (défaut: tous les utilisateurs)")
+        parser.add_argument('--from', dest='date_from', help="Date d'émission minimale (AAAA-MM-JJ)")
+        parser.add_argument('--to', dest='date_to', help="Date d'émission maximale (AAAA-MM-JJ)")
+        parser.add_argument('--status', choices=[code for code, _ in Invoice.STATUS_CHOICES])
+        parser.add_argument('--workers', type=int, help="Processus de rendu (défaut: PDF_EXPORT_WORKERS)")
+
+    def handle(self, *args, **options):
+        form = InvoiceExportForm({
+            'date_from': options['date_from'],
+            'date_to': options['date_to'],
+            'status': options['status'],
+        })
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+
+        invoices = Invoice.objects.all()
+        stream_kwargs = {'workers': options['workers']}
+        if options['user']:
+            try:
+                invoices = invoices.filter(user=User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"Utilisateur inconnu: {options['user']}")
+        else:
+            # Plusieurs comptes : un dossier par utilisateur pour éviter les collisions de numéros
+            stream_kwargs['archive_name'] = self._archive_name
+        invoices = form.filter(invoices).order_by('user_id', 'invoice_date', 'id').prefetch_related('items')
+
+        # Lecture longue : sur la réplique si elle est configurée
+        with replica.use_replica(), open(options['output'], 'wb') as output:
+            for chunk in stream_invoices_zip(self._counted(invoices.iterator(chunk_size=100)), **stream_kwargs):
+                output.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"{self.count} facture(s) exportée(s) dans {options['output']}"))
+
+    @staticmethod
+    def _archive_name(invoice):
+        return f"{invoice.user_id}/facture_{invoice.invoice_number.replace('/', '-')}.pdf"
+
+    def _counted(self, invoices):
+        self.count = 0
+        for invoice in invoices:
+            self.count += 1
+            yield invoice
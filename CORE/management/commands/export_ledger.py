@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE import replica
+from CORE.exports import LEDGER_FORMATS, stream_ledger
+from CORE.forms import InvoiceFilterForm
+from CORE.models import Invoice
+
+
+class Command(BaseCommand):
+    help = "Exporte le grand livre des factures et de leurs lignes (CSV ou XLSX, en flux)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Chemin du fichier à écrire")
+        parser.add_argument('--user', help="Nom d'utilisateur (défaut: tous les utilisateurs)")
+        parser.add_argument('--format', choices=list(LEDGER_FORMATS),
+                            help="Format du fichier (défaut : d'après l'extension, sinon csv)")
+        parser.add_argument('--from', dest='date_from', help="Date d'émission minimale (AAAA-MM-JJ)")
+        parser.add_argument('--to', dest='date_to', help="Date d'émission maximale (AAAA-MM-JJ)")
+        parser.add_argument('--status', choices=[code for code, _ in Invoice.STATUS_CHOICES])
+        parser.add_argument('--client', help="Identifiant du client (comme le filtre client de la liste)")
+        parser.add_argument('--amount-min', help="Montant TTC minimal")
+        parser.add_argument('--amount-max', help="Montant TTC maximal")
+
+    def handle(self, *args, **options):
+        form = InvoiceFilterForm({
+            'date_from': options['date_from'],
+            'date_to': options['date_to'],
+            'status': options['status'],
+            'client': options['client'],
+            'amount_min': options['amount_min'],
+            'amount_max': options['amount_max'],
+        })
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+        fmt = options['format'] or ('xlsx' if options['output'].lower().endswith('.xlsx') else 'csv')
+
+        invoices = Invoice.objects.all()
+        if options['user']:
+            try:
+                invoices = invoices.filter(user=User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"Utilisateur inconnu: {options['user']}")
+
+        # Lecture longue : sur la réplique si elle est configurée
+        size = 0
+        with replica.use_replica(), open(options['output'], 'wb') as output:
+            for chunk in stream_ledger(form.filter(invoices), fmt):
+                output.write(chunk)
+                size += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Grand livre écrit dans {options['output']} ({size} octets)"))
@@ -0,0 +1,47 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE.importers import FORMATS, IMPORT_CHUNK_SIZE, detect_format, import_invoices
+
+
+class Command(BaseCommand):
+    help = "Importe des factures (et leurs clients) depuis un fichier CSV ou JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier à importer (.csv, .jsonl)")
+        parser.add_argument('--user', required=True, help="Utilisateur propriétaire des factures")
+        parser.add_argument('--format', choices=FORMATS, help="Format du fichier (défaut : d'après l'extension)")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help=f"Factures enregistrées par transaction (défaut : {IMPORT_CHUNK_SIZE})")
+        parser.add_argument('--dry-run', action='store_true', help="Valide le fichier sans rien enregistrer")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Utilisateur inconnu : {options['user']}")
+        fmt = options['format'] or detect_format(options['path'])
+        if fmt is None:
+            raise CommandError("Format non reconnu, préciser --format.")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size doit être positif.")
+
+        started = time.monotonic()
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                report = import_invoices(user, stream, fmt, options['dry_run'], options['chunk_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+
+        for line, number, message in report.errors:
+            self.stdout.write(f"ligne {line} {number}: {message}")
+        if report.error_count > len(report.errors):
+            self.stdout.write(f"... et {report.error_count - len(report.errors)} autre(s) erreur(s)")
+        verb = "importables" if options['dry_run'] else "importées"
+        self.stdout.write(self.style.SUCCESS(
+            f"{report.invoices} facture(s) {verb} ({report.items} lignes, {report.clients} nouveau(x) client(s)), "
+            f"{report.error_count} rejetée(s) en {elapsed:.1f} s "
+            f"({report.invoices / elapsed if elapsed else 0:.0f} factures/s)."))
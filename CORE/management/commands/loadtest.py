@@ -0,0 +1,102 @@
+import importlib.util
+import json
+import tempfile
+from itertools import product
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE import loadtest, seeding
+
+
+def _counts(value):
+    try:
+        counts = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        counts = []
+    if not counts or min(counts) < 1:
+        raise ValueError(value)
+    return counts
+
+
+class Command(BaseCommand):
+    help = ("Test de charge HTTP (connexion, tableau de bord, création de factures, PDF) contre gunicorn, "
+            "pour une ou plusieurs combinaisons workers/threads")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Serveur déjà démarré à tester (défaut : gunicorn local lancé par la commande)")
+        parser.add_argument('--workers', default='1,2,4',
+                            help="Nombres de workers gunicorn à essayer, séparés par des virgules (défaut : 1,2,4)")
+        parser.add_argument('--threads', default='1,4',
+                            help="Nombres de threads par worker à essayer (défaut : 1,4)")
+        parser.add_argument('--concurrency', type=int, default=10, help="Utilisateurs virtuels simultanés (défaut : 10)")
+        parser.add_argument('--duration', type=float, default=30, help="Durée de chaque tir en secondes (défaut : 30)")
+        parser.add_argument('--mix', default=','.join(f'{name}={weight}' for name, weight in loadtest.DEFAULT_MIX.items()),
+                            help="Poids des scénarios, ex. dashboard=3,invoice_create=2,invoice_pdf=1")
+        parser.add_argument('--items', type=int, default=3, help="Lignes par facture créée (défaut : 3)")
+        parser.add_argument('--think-time', type=float, default=0,
+                            help="Pause moyenne entre deux requêtes d'un utilisateur, en secondes (défaut : 0)")
+        parser.add_argument('--prefix', default=seeding.DEFAULT_PREFIX, help="Préfixe des comptes de seed_benchmark")
+        parser.add_argument('--password', default=seeding.DEFAULT_PASSWORD, help="Mot de passe des comptes")
+        parser.add_argument('--timeout', type=float, default=30, help="Délai maximal d'une requête en secondes")
+        parser.add_argument('--output', help="Fichier JSON des résultats")
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+            workers, threads = _counts(options['workers']), _counts(options['threads'])
+        except ValueError as e:
+            raise CommandError(f"Paramètre invalide : {e}")
+        if options['concurrency'] < 1 or options['duration'] <= 0 or options['items'] < 1:
+            raise CommandError("--concurrency, --duration et --items doivent être positifs.")
+        if not options['url'] and importlib.util.find_spec('gunicorn') is None:
+            raise CommandError("gunicorn n'est pas installé : l'installer ou viser un serveur avec --url.")
+
+        def shoot(base_url):
+            test = loadtest.LoadTest(
+                base_url, options['concurrency'], options['duration'], mix, options['items'],
+                options['think_time'], options['prefix'], options['password'], options['timeout'])
+            try:
+                return test.run()
+            except loadtest.LoadTestError as e:
+                raise CommandError(str(e))
+
+        results = []
+        if options['url']:
+            results.append({'url': options['url'], **shoot(options['url'])})
+            self._print(results[-1])
+        else:
+            log_path = Path(tempfile.gettempdir()) / 'easinvoice-loadtest-gunicorn.log'
+            log_path.write_bytes(b'')
+            self.stdout.write(f"Journal de gunicorn : {log_path}")
+            for worker_count, thread_count in product(workers, threads):
+                self.stdout.write(f"\ngunicorn --workers {worker_count} --threads {thread_count}, "
+                                  f"{options['concurrency']} utilisateurs, {options['duration']:g} s")
+                try:
+                    with loadtest.run_server(worker_count, thread_count, log_path) as base_url:
+                        result = shoot(base_url)
+                except loadtest.LoadTestError as e:
+                    raise CommandError(f"{e} (voir {log_path})")
+                results.append({'workers': worker_count, 'threads': thread_count, **result})
+                self._print(result)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2, ensure_ascii=False) + '\n')
+        if len(results) > 1:
+            self.stdout.write("\nworkers threads   req/s    p50 ms    p95 ms    p99 ms  erreurs")
+            for result in results:
+                self.stdout.write(f"{result['workers']:>7} {result['threads']:>7} {result['throughput_rps']:>7} "
+                                  f"{result.get('p50_ms', '-'):>9} {result.get('p95_ms', '-'):>9} "
+                                  f"{result.get('p99_ms', '-'):>9} {result['error_rate']:>8.1%}")
+
+    def _print(self, result):
+        for name, scenario in [('total', result), *result['scenarios'].items()]:
+            line = (f"{name:>15}: {scenario['requests']:6d} req  {scenario['throughput_rps']:7.1f} req/s  "
+                    f"p50 {scenario.get('p50_ms', 0):7.1f}  p95 {scenario.get('p95_ms', 0):7.1f}  "
+                    f"p99 {scenario.get('p99_ms', 0):7.1f} ms  erreurs {scenario['error_rate']:.1%}")
+            self.stdout.write(self.style.ERROR(line) if scenario['errors'] else line)
+        if result['client_cpu'] > 0.8:
+            self.stdout.write(self.style.WARNING(
+                f"Le générateur a utilisé {result['client_cpu']:.0%} d'un CPU : latences probablement surestimées."))
+        for error in result['error_samples']:
+            self.stdout.write(self.style.WARNING(f"  {error}"))
@@ -0,0 +1,31 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE.services import mark_overdue
+
+
+class Command(BaseCommand):
+    help = ("Passe en retard les factures envoyées dont l'échéance est dépassée "
+            "(idempotent, prévu pour être lancé par cron toutes les quelques minutes)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Date de référence AAAA-MM-JJ (défaut : aujourd'hui)")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Nombre de factures modifiées par UPDATE (défaut : 1000)")
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError("Date invalide, format attendu : AAAA-MM-JJ.")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size doit être positif.")
+
+        started = time.monotonic()
+        updated = mark_overdue(today, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{updated} facture(s) passée(s) en retard en {(time.monotonic() - started) * 1000:.0f} ms."))
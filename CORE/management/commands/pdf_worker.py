@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from CORE.pdf_jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Traite la file des rendus PDF asynchrones avec un pool local de processus"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.PDF_WORKER_PROCESSES,
+                            help="Nombre de rendus simultanés (défaut: PDF_WORKER_PROCESSES)")
+        parser.add_argument('--poll-interval', type=float, default=settings.PDF_WORKER_POLL_INTERVAL,
+                            help="Délai en secondes entre deux lectures de la file")
+        parser.add_argument('--once', action='store_true',
+                            help="Vide la file puis s'arrête")
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        self.stdout.write(f"pdf_worker: {processes} processus")
+        run_worker(processes, poll_interval=options['poll_interval'], once=options['once'],
+                   log=self.stdout.write)
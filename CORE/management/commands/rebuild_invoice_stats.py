@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE import stats
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les statistiques mensuelles des factures ou vérifie leur cohérence"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames',
+                            help="Limiter à cet utilisateur (option répétable)")
+        parser.add_argument('--check', action='store_true',
+                            help="Signale les écarts sans rien modifier (code de sortie non nul si écart)")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            user_ids = list(User.objects.filter(username__in=options['usernames']).values_list('id', flat=True))
+            if len(user_ids) != len(set(options['usernames'])):
+                raise CommandError("Utilisateur inconnu.")
+
+        if options['check']:
+            drift = stats.find_drift(user_ids)
+            for (user_id, month, status), stored, expected in drift:
+                self.stdout.write(f"user={user_id} mois={month:%Y-%m} statut={status}: "
+                                  f"stocké={stored} attendu={expected}")
+            if drift:
+                raise CommandError(f"{len(drift)} écart(s) détecté(s).")
+            self.stdout.write(self.style.SUCCESS("Statistiques cohérentes."))
+            return
+
+        stats.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS("Statistiques reconstruites."))
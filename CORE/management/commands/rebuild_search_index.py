@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE import search
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des factures"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help="Tranche d'identifiants de factures indexée par requête (défaut : 10000)")
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            raise CommandError("L'index plein texte n'est disponible qu'avec SQLite (FTS5).")
+        started = time.monotonic()
+        indexed = search.rebuild(options['chunk_size'],
+                                 progress=lambda count: self.stdout.write(f"... {count} factures indexées"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{indexed} factures indexées en {time.monotonic() - started:.1f} s."))
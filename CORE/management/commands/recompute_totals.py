@@ -0,0 +1,44 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE.models import Invoice
+from CORE.services import recompute_totals
+
+
+class Command(BaseCommand):
+    help = "Recalcule les totaux des factures à partir de leurs lignes et corrige les écarts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames',
+                            help="Limiter à cet utilisateur (option répétable)")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Nombre de factures traitées par lot (défaut : 500)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Affiche les écarts sans rien modifier")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size doit être positif.")
+        invoices = Invoice.objects.all()
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+            if users.count() != len(set(options['usernames'])):
+                raise CommandError("Utilisateur inconnu.")
+            invoices = invoices.filter(user__in=users)
+
+        started = time.monotonic()
+        seen = changed = 0
+        for count, changes in recompute_totals(invoices, options['chunk_size'], options['dry_run']):
+            seen += count
+            changed += len(changes)
+            for invoice, (subtotal, vat_amount, total) in changes:
+                self.stdout.write(f"{invoice.invoice_number} (id {invoice.id}): "
+                                  f"HT {subtotal} -> {invoice.subtotal}, TVA {vat_amount} -> {invoice.vat_amount}, "
+                                  f"TTC {total} -> {invoice.total}")
+            self.stdout.write(f"... {seen} factures traitées, {changed} écart(s)")
+
+        verb = "à corriger" if options['dry_run'] else "corrigée(s)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{seen} factures traitées, {changed} {verb} en {time.monotonic() - started:.1f} s."))
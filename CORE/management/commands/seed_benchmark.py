@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE import seeding
+
+
+class Command(BaseCommand):
+    help = "Génère un jeu de données synthétique (utilisateurs, profils, clients, factures, lignes) pour les mesures"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help="Nombre d'utilisateurs (défaut : 10)")
+        parser.add_argument('--invoices', type=int, default=200,
+                            help="Factures par utilisateur, en moyenne ; exactement pour le premier (défaut : 200)")
+        parser.add_argument('--clients', type=int, default=50, help="Clients par utilisateur (défaut : 50)")
+        parser.add_argument('--months', type=int, default=24, help="Période couverte en mois (défaut : 24)")
+        parser.add_argument('--prefix', default=seeding.DEFAULT_PREFIX,
+                            help=f"Préfixe des noms d'utilisateur (défaut : {seeding.DEFAULT_PREFIX})")
+        parser.add_argument('--seed', type=int, default=0, help="Graine du générateur (défaut : 0)")
+        parser.add_argument('--flush', action='store_true',
+                            help="Supprime d'abord les utilisateurs existants portant le préfixe")
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['invoices'], options['months']) < 1 or options['clients'] < 0:
+            raise CommandError("Les volumes doivent être positifs.")
+        prefix = options['prefix']
+        if options['flush']:
+            self.stdout.write(f"{seeding.flush(prefix)} utilisateur(s) '{prefix}-*' supprimé(s).")
+        elif seeding.existing_users(prefix).exists():
+            raise CommandError(f"Des utilisateurs '{prefix}-*' existent déjà : utiliser --flush ou --prefix.")
+
+        started = time.monotonic()
+
+        def progress(report):
+            self.stdout.write(f"  {report.users}/{options['users']} utilisateurs, {report.invoices} factures")
+
+        report = seeding.seed(options['users'], options['invoices'], options['clients'], options['months'],
+                              prefix, options['seed'], progress=progress if options['verbosity'] > 1 else None)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{report.users} utilisateur(s), {report.clients} client(s), {report.invoices} facture(s), "
+            f"{report.items} ligne(s) créés en {elapsed:.1f} s. "
+            f"Mot de passe : {seeding.DEFAULT_PASSWORD} ; compte mesuré : {prefix}-0001."))
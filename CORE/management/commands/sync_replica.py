@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from CORE import replica
+
+
+class Command(BaseCommand):
+    help = ("Copie la base principale dans la réplique en lecture (DATABASE_REPLICA), "
+            "une fois ou en boucle")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, nargs='?', const=settings.REPLICA_SYNC_INTERVAL,
+                            help="Recopie toutes les N secondes jusqu'à interruption "
+                                 "(sans valeur : REPLICA_SYNC_INTERVAL)")
+
+    def handle(self, *args, **options):
+        if not replica.is_configured():
+            raise CommandError("Aucune réplique configurée : définir DATABASE_REPLICA.")
+        interval = options['interval']
+        if interval is not None and interval <= 0:
+            raise CommandError("--interval doit être positif.")
+
+        while True:
+            elapsed = replica.sync()
+            self.stdout.write(f"Réplique à jour en {elapsed * 1000:.0f} ms.")
+            if interval is None:
+                return
+            time.sleep(max(0.0, interval - elapsed))
@@ -0,0 +1,149 @@
+"""Middlewares de l'application CORE"""
+import json
+import logging
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import replica, timing
+
+logger = logging.getLogger('CORE.timing')
+query_logger = logging.getLogger('CORE.queries')
+
+
+class ServerTimingMiddleware:
+    """
+    Mesure chaque requête : nombre et durée des requêtes SQL, rendu des
+    templates, rendu PDF et durée totale. Ajoute un en-tête ``Server-Timing``
+    et écrit une ligne JSON dans le logger ``CORE.timing``. Au-delà de
+    ``SLOW_REQUEST_MS``, la ligne (niveau WARNING) détaille les requêtes SQL
+    les plus coûteuses et la pile d'appel des requêtes lentes.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        timing.instrument_templates()
+
+    def __call__(self, request):
+        metrics = timing.RequestMetrics()
+        token = timing.activate(metrics)
+        start = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.sql_wrapper))
+                response = self.get_response(request)
+        finally:
+            timing.deactivate(token)
+        total = perf_counter() - start
+
+        response['Server-Timing'] = metrics.server_timing(total)
+        self.log(request, response, metrics, total)
+        return response
+
+    def log(self, request, response, metrics, total):
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'sql_count': metrics.sql_count,
+            **{f'{name}_ms': round(metrics.durations[name] * 1000, 2)
+               for name in timing.METRICS if name in metrics.durations},
+        }
+        if total * 1000 < settings.SLOW_REQUEST_MS:
+            logger.info(json.dumps(record))
+            return
+        record['slow'] = True
+        record['top_queries'] = metrics.top_queries()
+        record['slow_queries'] = metrics.slow_queries
+        logger.warning(json.dumps(record))
+
+
+class RepeatedQueryMiddleware:
+    """
+    Développement : signale dans le logger ``CORE.queries`` les requêtes SQL de
+    même forme exécutées au moins ``N_PLUS_ONE_THRESHOLD`` fois pendant une
+    requête HTTP (symptôme d'un N+1), avec la pile d'appel de la répétition,
+    et ajoute l'en-tête ``X-Repeated-Queries``.
+    """
+
+    def __init__(self, get_response):
+        if not settings.N_PLUS_ONE_DETECTION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        detector = timing.RepeatedQueryDetector(settings.N_PLUS_ONE_THRESHOLD)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(detector))
+            response = self.get_response(request)
+
+        repeated = detector.repeated()
+        if repeated:
+            response['X-Repeated-Queries'] = str(len(repeated))
+            match = request.resolver_match
+            for entry in repeated:
+                query_logger.warning(json.dumps({
+                    'path': request.path,
+                    'view': match.view_name if match else None,
+                    **entry,
+                }))
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Envoie les lectures des vues de ``replica.REPLICA_VIEWS`` sur la réplique
+    (``DATABASE_REPLICA``), y compris pendant l'envoi des réponses en flux.
+    Une requête qui écrit pose le cookie ``REPLICA_PIN_COOKIE`` : les requêtes
+    suivantes de l'utilisateur lisent la base principale pendant
+    ``REPLICA_PIN_SECONDS``.
+    """
+
+    def __init__(self, get_response):
+        if not replica.is_configured():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = replica.RoutingState()
+        token = replica.activate(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica.deactivate(token)
+
+        if response.streaming and state.reading_replica:
+            response.streaming_content = self._streamed(response.streaming_content, state)
+        if state.wrote or (request.method not in replica.SAFE_METHODS and not state.read_replica):
+            response.set_cookie(replica.REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = replica.current()
+        state.read_replica = (request.resolver_match.view_name in replica.REPLICA_VIEWS
+                              and replica.REPLICA_PIN_COOKIE not in request.COOKIES)
+
+    @staticmethod
+    def _streamed(content, state):
+        # Contexte réactivé morceau par morceau : le serveur itère hors de __call__
+        chunks = iter(content)
+        while True:
+            token = replica.activate(state)
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                replica.deactivate(token)
+            yield chunk
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def populate_invoice_stats(apps, schema_editor):
+    Invoice = apps.get_model('CORE', 'Invoice')
+    InvoiceStats = apps.get_model('CORE', 'InvoiceStats')
+    rows = (Invoice.objects
+            .annotate(month=TruncMonth('invoice_date'))
+            .values('user_id', 'month', 'status')
+            .annotate(invoice_count=Count('id'), subtotal=Sum('subtotal'),
+                      vat_amount=Sum('vat_amount'), total=Sum('total'))
+            .order_by())
+    InvoiceStats.objects.bulk_create((InvoiceStats(**row) for row in rows.iterator()), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CORE', '0003_pdfrenderjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Mois')),
+                ('status', models.CharField(choices=[('draft', 'Brouillon'), ('sent', 'Envoyée'), ('paid', 'Payée'), ('overdue', 'En retard'), ('cancelled', 'Annulée')], max_length=20, verbose_name='État')),
+                ('invoice_count', models.IntegerField(default=0, verbose_name='Nombre de factures')),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total HT')),
+                ('vat_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Montant TVA')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total TTC')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Statistique mensuelle',
+                'verbose_name_plural': 'Statistiques mensuelles',
+                'ordering': ['-month', 'status'],
+                'unique_together': {('user', 'month', 'status')},
+            },
+        ),
+        migrations.RunPython(populate_invoice_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CORE', '0004_invoicestats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['user', '-created_at'], name='client_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', '-invoice_date', '-created_at', '-id'], name='invoice_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', 'status', '-invoice_date', '-created_at', '-id'], name='invoice_user_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', '-created_at'], name='invoice_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceitem',
+            index=models.Index(fields=['invoice', 'order'], name='invoiceitem_invoice_order_idx'),
+        ),
+    ]
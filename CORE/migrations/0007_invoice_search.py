@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# Index plein texte des factures (voir CORE.search), propre à SQLite
+CREATE_SEARCH_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_invoice_search USING fts5(
+        owner, invoice_number, client, items, notes,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+POPULATE_SEARCH_TABLE = """
+    INSERT INTO core_invoice_search (rowid, owner, invoice_number, client, items, notes)
+    SELECT i.id, 'u' || i.user_id, i.invoice_number,
+           i.to_name || ' ' || i.to_address || ' ' || i.to_city || ' ' || i.to_email,
+           COALESCE((SELECT group_concat(it.description, ' ') FROM "CORE_invoiceitem" it WHERE it.invoice_id = i.id), ''),
+           i.notes
+    FROM "CORE_invoice" i
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SEARCH_TABLE)
+    schema_editor.execute(POPULATE_SEARCH_TABLE)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS core_invoice_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CORE', '0006_invoice_status_due_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
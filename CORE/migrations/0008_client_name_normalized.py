@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:37
+
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize_name(value):
+    # Copie figée de CORE.models.normalize_name : une migration ne dépend pas du code courant
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().split())
+
+
+def fill_name_normalized(apps, schema_editor):
+    Client = apps.get_model('CORE', 'Client')
+    clients = list(Client.objects.only('id', 'name'))
+    for client in clients:
+        client.name_normalized = normalize_name(client.name)
+    Client.objects.bulk_update(clients, ['name_normalized'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CORE', '0007_invoice_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='name_normalized',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(fill_name_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['user', 'name_normalized'], name='client_user_name_idx'),
+        ),
+    ]
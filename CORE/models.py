@@ -2,6 +2,33 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal, ROUND_HALF_UP
+import unicodedata
+
+CENT = Decimal('0.01')
+
+
+def quantize_money(value):
+    """Règle d'arrondi unique des montants : au centime, demi-centime arrondi au supérieur"""
+    return Decimal(str(value or 0)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def compute_totals(subtotal, vat_rate, is_vat_exempt=False):
+    """
+    Retourne ``(total HT, montant TVA, total TTC)`` arrondis. La TVA est
+    calculée sur le total HT arrondi puis arrondie elle-même.
+    """
+    subtotal = quantize_money(subtotal)
+    if is_vat_exempt:
+        vat_amount = quantize_money(0)
+    else:
+        vat_amount = quantize_money(subtotal * Decimal(str(vat_rate or 0)) / 100)
+    return subtotal, vat_amount, subtotal + vat_amount
+
+
+def normalize_name(value):
+    """Forme de recherche d'un nom : minuscules, sans accents, espaces réduits"""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().split())
 
 
 class UserProfile(models.Model):
@@ -35,16 +62,29 @@ class Client(models.Model):
     email = models.EmailField(verbose_name="Email", blank=True)
     phone = models.CharField(max_length=20, verbose_name="Téléphone", blank=True)
     notes = models.TextField(verbose_name="Notes", blank=True)
+    # Renseigné par save() ; à fournir explicitement avec bulk_create (voir normalize_name)
+    name_normalized = models.CharField(max_length=200, blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Tient à jour la forme normalisée du nom"""
+        self.name_normalized = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Client"
         verbose_name_plural = "Clients"
         ordering = ['-created_at']
+        indexes = [
+            # client_list : clients d'un utilisateur, plus récents d'abord
+            models.Index(fields=['user', '-created_at'], name='client_user_created_idx'),
+            # Autocomplétion : recherche par intervalle sur le préfixe normalisé
+            models.Index(fields=['user', 'name_normalized'], name='client_user_name_idx'),
+        ]
 
 
 class Invoice(models.Model):
@@ -107,14 +147,9 @@ class Invoice(models.Model):
         return f"Facture {self.invoice_number} - {self.to_name}"
 
     def calculate_totals(self):
-        """Recalcule les totaux à partir des items"""
-        items = self.items.all()
-        self.subtotal = sum([item.line_total for item in items])
-        if self.is_vat_exempt:
-            self.vat_amount = Decimal('0.00')
-        else:
-            self.vat_amount = self.subtotal * (self.vat_rate / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        self.total = (self.subtotal + self.vat_amount).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        """Recalcule les totaux à partir des items (somme faite par la base)"""
+        subtotal = self.items.aggregate(subtotal=models.Sum('line_total'))['subtotal']
+        self.subtotal, self.vat_amount, self.total = compute_totals(subtotal, self.vat_rate, self.is_vat_exempt)
         self.save()
 
     def is_overdue(self):
@@ -139,6 +174,17 @@ class Invoice(models.Model):
         verbose_name_plural = "Factures"
         ordering = ['-invoice_date', '-created_at']
         unique_together = [['user', 'invoice_number']]
+        indexes = [
+            # invoice_list (pagination par curseur), exports, agrégats mensuels
+            models.Index(fields=['user', '-invoice_date', '-created_at', '-id'], name='invoice_user_date_idx'),
+            # invoice_list filtrée par statut
+            models.Index(fields=['user', 'status', '-invoice_date', '-created_at', '-id'],
+                         name='invoice_user_status_date_idx'),
+            # dashboard : dernières factures créées
+            models.Index(fields=['user', '-created_at'], name='invoice_user_created_idx'),
+            # mark_overdue : factures envoyées échues
+            models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+        ]
 
 
 class InvoiceItem(models.Model):
@@ -152,7 +198,7 @@ class InvoiceItem(models.Model):
 
     def save(self, *args, **kwargs):
         """Calcule automatiquement le total de ligne"""
-        self.line_total = self.quantity * self.unit_price
+        self.line_total = quantize_money(Decimal(str(self.quantity)) * Decimal(str(self.unit_price)))
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -162,6 +208,87 @@ class InvoiceItem(models.Model):
         verbose_name = "Ligne de facture"
         verbose_name_plural = "Lignes de facture"
         ordering = ['order', 'id']
+        indexes = [
+            models.Index(fields=['invoice', 'order'], name='invoiceitem_invoice_order_idx'),
+        ]
+
+
+class CatalogItem(models.Model):
+    """Prestation ou produit récurrent d'un utilisateur, avec son prix"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='catalog_items')
+    description = models.CharField(max_length=500, verbose_name="Description")
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Prix unitaire HT")
+    # Renseigné par save() ; à fournir explicitement avec bulk_create (voir normalize_name)
+    description_normalized = models.CharField(max_length=500, blank=True, default='', editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.description} - {self.unit_price}€"
+
+    def save(self, *args, **kwargs):
+        """Tient à jour la forme normalisée de la description"""
+        self.description_normalized = normalize_name(self.description)
+        super().save(*args, **kwargs)
+
+    class Meta:
+        verbose_name = "Article du catalogue"
+        verbose_name_plural = "Catalogue"
+        ordering = ['description_normalized', 'id']
+        indexes = [
+            # Recherche par intervalle sur le préfixe normalisé (lignes de facture)
+            models.Index(fields=['user', 'description_normalized'], name='catalogitem_user_desc_idx'),
+        ]
+
+
+class InvoiceStats(models.Model):
+    """Agrégats mensuels des factures d'un utilisateur par statut (voir CORE.stats)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='invoice_stats')
+    month = models.DateField(verbose_name="Mois")
+    status = models.CharField(max_length=20, choices=Invoice.STATUS_CHOICES, verbose_name="État")
+    invoice_count = models.IntegerField(default=0, verbose_name="Nombre de factures")
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Total HT", default=0)
+    vat_amount = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Montant TVA", default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Total TTC", default=0)
+
+    def __str__(self):
+        return f"{self.user} - {self.month:%Y-%m} - {self.status}"
+
+    class Meta:
+        verbose_name = "Statistique mensuelle"
+        verbose_name_plural = "Statistiques mensuelles"
+        ordering = ['-month', 'status']
+        unique_together = [['user', 'month', 'status']]
+
+
+class PdfRenderJob(models.Model):
+    """Rendu PDF en attente, traité par la commande ``pdf_worker``"""
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('done', 'Terminé'),
+        ('failed', 'Échec'),
+    ]
+
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='pdf_jobs')
+    cache_key = models.CharField(max_length=64, verbose_name="Clé de cache")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="État")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Tentatives")
+    error = models.TextField(verbose_name="Erreur", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Rendu PDF {self.invoice_id} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Rendu PDF"
+        verbose_name_plural = "Rendus PDF"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='core_pdfjob_status_idx'),
+        ]
 
 
 class ContactMessage(models.Model):
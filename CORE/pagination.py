@@ -0,0 +1,55 @@
+"""
+Pagination par curseur (keyset) de la liste des factures.
+
+L'ordre suit ``Invoice.Meta.ordering`` (``-invoice_date``, ``-created_at``)
+complété par ``-id`` pour départager les ex aequo. Le curseur encode la clé
+de la dernière ligne servie : chaque page est une recherche bornée par
+l'index, quelle que soit sa profondeur (pas d'OFFSET).
+"""
+import base64
+from datetime import date, datetime
+
+from django.db.models import Q
+
+INVOICE_ORDERING = ['-invoice_date', '-created_at', '-id']
+
+
+def encode_cursor(invoice):
+    raw = f"{invoice.invoice_date.isoformat()}|{invoice.created_at.isoformat()}|{invoice.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Retourne (invoice_date, created_at, id) ou None si le curseur est invalide"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        invoice_date, created_at, pk = raw.split('|')
+        return date.fromisoformat(invoice_date), datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_queryset(invoices, cursor):
+    """Factures triées qui suivent ``cursor`` (toutes si le curseur est vide ou invalide)"""
+    invoices = invoices.order_by(*INVOICE_ORDERING)
+    key = decode_cursor(cursor) if cursor else None
+    if key:
+        invoice_date, created_at, pk = key
+        invoices = invoices.filter(
+            Q(invoice_date__lt=invoice_date)
+            | Q(invoice_date=invoice_date, created_at__lt=created_at)
+            | Q(invoice_date=invoice_date, created_at=created_at, id__lt=pk)
+        )
+    return invoices
+
+
+def keyset_page(invoices, cursor, page_size):
+    """
+    Retourne ``(factures, curseur suivant)`` pour la page qui suit ``cursor``.
+    Le curseur suivant vaut None sur la dernière page.
+    """
+    page = list(keyset_queryset(invoices, cursor)[:page_size + 1])
+    if len(page) > page_size:
+        page = page[:page_size]
+        return page, encode_cursor(page[-1])
+    return page, None
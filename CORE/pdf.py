@@ -0,0 +1,310 @@
+"""
+Rendu PDF des factures et cache disque adressé par contenu.
+
+Le PDF d'une facture ne dépend que de son contenu (en-tête, lignes), du
+template ``CORE/invoice.html`` et de la feuille ``invoice.css`` : la clé de
+cache est une empreinte SHA-256 de ces éléments. Les fichiers sont stockés
+dans ``settings.PDF_CACHE_DIR`` et évincés du moins récemment utilisé au plus
+récent dès que ``settings.PDF_CACHE_MAX_BYTES`` est dépassé.
+
+Le rendu passe par un ``InvoicePdfRenderer`` unique par processus
+(``get_renderer``), qui garde la feuille de style pré-analysée entre deux
+requêtes. WeasyPrint (cairo/pango, fonttools...) n'est importé qu'au premier
+rendu ; ``warm_up`` permet de payer ce coût au démarrage d'un worker.
+"""
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template, render_to_string
+
+from .models import quantize_money
+from .timing import measure
+
+logger = logging.getLogger(__name__)
+
+# Détection sans import : le chargement réel est différé à _load_weasyprint(),
+# qui repasse ce drapeau à False si les bibliothèques natives manquent
+WEASYPRINT_AVAILABLE = importlib.util.find_spec('weasyprint') is not None
+if not WEASYPRINT_AVAILABLE:
+    logger.warning("WeasyPrint non disponible: No module named 'weasyprint'")
+
+HTML = CSS = FontConfiguration = None
+
+
+INVOICE_TEMPLATE = 'CORE/invoice.html'
+INVOICE_CSS = Path(__file__).resolve().parent.parent / 'static' / 'CORE' / 'css' / 'invoice.css'
+
+
+class PdfUnavailable(RuntimeError):
+    """WeasyPrint n'est pas utilisable dans ce processus"""
+
+
+def _load_weasyprint():
+    """Importe WeasyPrint au premier besoin"""
+    global HTML, CSS, FontConfiguration, WEASYPRINT_AVAILABLE
+    if HTML is not None:
+        return
+    if not WEASYPRINT_AVAILABLE:
+        raise PdfUnavailable("WeasyPrint n'est pas installé.")
+    try:
+        from weasyprint import HTML as _HTML, CSS as _CSS
+        from weasyprint.text.fonts import FontConfiguration as _FontConfiguration
+    except (ImportError, OSError) as e:
+        WEASYPRINT_AVAILABLE = False
+        logger.warning("WeasyPrint non disponible: %s", e)
+        raise PdfUnavailable(f"WeasyPrint non disponible: {e}")
+    HTML, CSS, FontConfiguration = _HTML, _CSS, _FontConfiguration
+
+
+def weasyprint_available():
+    """
+    État courant de WeasyPrint, à lire au moment de la requête : installé et
+    sans échec de chargement dans ce processus jusqu'ici.
+    """
+    return WEASYPRINT_AVAILABLE
+
+
+# Empreinte de invoice.css mémorisée par mtime pour éviter de relire le fichier
+_css_digest = {'mtime': None, 'digest': ''}
+
+
+def build_invoice_context(invoice, items=None):
+    """Construit le contexte du template PDF à partir d'une facture enregistrée"""
+    if items is None:
+        items = invoice.items.all()
+
+    vat_note = "TVA non applicable, art. 293 B du CGI" if invoice.is_vat_exempt else None
+    penalties_note = f"Pénalités de retard: {invoice.late_fee_rate}%/an à compter du lendemain de la date d'échéance." if invoice.late_fee_rate else None
+    recovery_note = "Indemnité forfaitaire de recouvrement: 40 € due en cas de retard de paiement." if invoice.recovery_fee else None
+
+    return {
+        'from_name': invoice.from_name,
+        'from_address': invoice.from_address,
+        'from_city': invoice.from_city,
+        'from_email': invoice.from_email,
+        'siret': invoice.siret,
+        'rcs': invoice.rcs,
+        'is_ei': invoice.is_ei,
+        'to_name': invoice.to_name,
+        'to_address': invoice.to_address,
+        'to_city': invoice.to_city,
+        'to_email': invoice.to_email,
+        'invoice_number': invoice.invoice_number,
+        'invoice_date': invoice.invoice_date,
+        'service_date_start': invoice.service_date_start,
+        'service_date_end': invoice.service_date_end,
+        'due_date': invoice.due_date,
+        'items': [{
+            'description': item.description,
+            'quantity': float(item.quantity),
+            'unit_price': float(item.unit_price),
+            'line_total': quantize_money(item.line_total),
+        } for item in items],
+        'is_vat_exempt': invoice.is_vat_exempt,
+        'vat_rate': float(invoice.vat_rate),
+        'subtotal': quantize_money(invoice.subtotal),
+        'vat_amount': quantize_money(invoice.vat_amount),
+        'total': quantize_money(invoice.total),
+        'vat_note': vat_note,
+        'payment_terms': invoice.payment_terms,
+        'penalties_note': penalties_note,
+        'recovery_note': recovery_note,
+        'autoliquidation': invoice.autoliquidation,
+    }
+
+
+class InvoicePdfRenderer:
+    """
+    Moteur de rendu partagé par le processus : la feuille de style est analysée
+    une seule fois avec une ``FontConfiguration`` commune, et rechargée
+    uniquement si le mtime de ``invoice.css`` change.
+    """
+
+    def __init__(self, css_path=INVOICE_CSS):
+        self.css_path = Path(css_path)
+        self.font_config = None
+        self._stylesheets = []
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _css_mtime(self):
+        try:
+            return self.css_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def stylesheets(self):
+        """Feuilles de style pré-analysées, rechargées si le fichier a changé"""
+        mtime = self._css_mtime()
+        if self.font_config is None or mtime != self._mtime:
+            with self._lock:
+                if self.font_config is None or mtime != self._mtime:
+                    font_config = FontConfiguration()
+                    self._stylesheets = [CSS(filename=str(self.css_path), font_config=font_config)] if mtime else []
+                    self.font_config = font_config
+                    self._mtime = mtime
+        return self._stylesheets
+
+    def render(self, context):
+        """Mise en page d'une facture (document WeasyPrint)"""
+        stylesheets = self.stylesheets()
+        html_string = render_to_string(INVOICE_TEMPLATE, context)
+        return HTML(string=html_string, base_url=None).render(
+            stylesheets=stylesheets, font_config=self.font_config)
+
+    def write_pdf(self, context):
+        return self.render(context).write_pdf()
+
+    def write_batch_pdf(self, contexts):
+        """Un seul PDF contenant les pages de toutes les factures"""
+        documents = [self.render(context) for context in contexts]
+        pages = [page for document in documents for page in document.pages]
+        return documents[0].copy(pages).write_pdf()
+
+
+_renderer = None
+
+
+def get_renderer():
+    """Instance unique du moteur de rendu pour ce processus"""
+    global _renderer
+    _load_weasyprint()
+    if _renderer is None:
+        _renderer = InvoicePdfRenderer()
+    return _renderer
+
+
+def warm_up():
+    """
+    Charge WeasyPrint, analyse la feuille de style et rend une facture fictive,
+    pour que la première vraie requête PDF ne paie pas le démarrage à froid.
+    """
+    today = date.today()
+    context = {
+        'from_name': 'EasyInvoice', 'from_address': '-', 'to_name': '-', 'to_address': '-',
+        'invoice_number': 'WARMUP', 'invoice_date': today, 'due_date': today,
+        'items': [{'description': '-', 'quantity': 1.0, 'unit_price': 0.0, 'line_total': 0.0}],
+        'vat_rate': 20.0, 'subtotal': 0.0, 'vat_amount': 0.0, 'total': 0.0,
+    }
+    render_invoice_pdf(context)
+
+
+def render_invoice_pdf(context):
+    """Génère le PDF (bytes) à partir d'un contexte de facture"""
+    with measure('pdf'):
+        return get_renderer().write_pdf(context)
+
+
+def render_invoices_batch_pdf(invoices):
+    """Rend plusieurs factures dans un seul document PDF"""
+    with measure('pdf'):
+        return get_renderer().write_batch_pdf(build_invoice_context(invoice) for invoice in invoices)
+
+
+def _stylesheet_digest():
+    try:
+        mtime = INVOICE_CSS.stat().st_mtime_ns
+    except FileNotFoundError:
+        return ''
+    if _css_digest['mtime'] != mtime:
+        _css_digest['digest'] = hashlib.sha256(INVOICE_CSS.read_bytes()).hexdigest()
+        _css_digest['mtime'] = mtime
+    return _css_digest['digest']
+
+
+def invoice_cache_key(context):
+    """Empreinte du contenu de la facture, du template et de la feuille de style"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(context, sort_keys=True, default=str).encode('utf-8'))
+    digest.update(get_template(INVOICE_TEMPLATE).template.source.encode('utf-8'))
+    digest.update(_stylesheet_digest().encode('ascii'))
+    return digest.hexdigest()
+
+
+class PdfCache:
+    """Cache disque des PDF, borné en taille avec éviction LRU (via mtime)"""
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = Path(directory or settings.PDF_CACHE_DIR)
+        self.max_bytes = settings.PDF_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    def path_for(self, invoice_id, key):
+        return self.directory / f'{invoice_id}-{key}.pdf'
+
+    def get(self, invoice_id, key):
+        """Retourne le chemin du PDF en cache (et le marque comme récent) ou None"""
+        path = self.path_for(invoice_id, key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, invoice_id, key, data):
+        """Écrit le PDF de façon atomique puis applique la limite de taille"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path_for(invoice_id, key)
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_name, path)
+        self.invalidate(invoice_id, keep=path.name)
+        self.evict()
+        return path
+
+    def invalidate(self, invoice_id, keep=None):
+        """Supprime les PDF en cache d'une facture"""
+        for path in self.directory.glob(f'{invoice_id}-*.pdf'):
+            if path.name != keep:
+                path.unlink(missing_ok=True)
+
+    def evict(self):
+        """Supprime les fichiers les moins récemment utilisés au-delà de max_bytes"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.pdf'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            Path(path).unlink(missing_ok=True)
+            total -= size
+
+
+def invoice_pdf_key(invoice):
+    """Retourne le contexte de rendu d'une facture et sa clé de cache"""
+    context = build_invoice_context(invoice)
+    return context, invoice_cache_key(context)
+
+
+def get_invoice_pdf(invoice):
+    """
+    Retourne le chemin du PDF d'une facture, rendu uniquement en cas d'absence
+    dans le cache.
+    """
+    cache = PdfCache()
+    context, key = invoice_pdf_key(invoice)
+    path = cache.get(invoice.id, key)
+    if path is None:
+        if not weasyprint_available():
+            raise PdfUnavailable("WeasyPrint n'est pas installé.")
+        path = cache.put(invoice.id, key, render_invoice_pdf(context))
+    return path
@@ -0,0 +1,158 @@
+"""
+Rendu PDF asynchrone : file d'attente en base (``PdfRenderJob``) consommée
+par un pool local de processus (commande ``manage.py pdf_worker``).
+
+Aucun broker externe : les workers web se contentent d'insérer un job, le
+processus ``pdf_worker`` réclame les jobs en attente par un UPDATE
+conditionnel et les rend dans le cache disque partagé (voir ``CORE.pdf``).
+"""
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Invoice, PdfRenderJob
+from .pdf import PdfCache, get_invoice_pdf
+
+
+def enqueue_pdf_job(invoice, cache_key):
+    """Crée (ou réutilise) le job de rendu correspondant à cette version de la facture"""
+    job = (PdfRenderJob.objects
+           .filter(invoice=invoice, cache_key=cache_key)
+           .exclude(status='failed')
+           .order_by('-created_at')
+           .first())
+    if job is None:
+        job = PdfRenderJob.objects.create(invoice=invoice, cache_key=cache_key)
+    return job
+
+
+def pdf_job_status(invoice, cache_key):
+    """Retourne le dernier job de cette version de la facture, en le relançant si son PDF a été évincé"""
+    job = (PdfRenderJob.objects
+           .filter(invoice=invoice, cache_key=cache_key)
+           .order_by('-created_at')
+           .first())
+    if job is None:
+        return enqueue_pdf_job(invoice, cache_key)
+    if job.status == 'done' and PdfCache().get(invoice.id, cache_key) is None:
+        PdfRenderJob.objects.filter(id=job.id).update(status='pending', finished_at=None)
+        job.status = 'pending'
+    return job
+
+
+def render_invoice_job(invoice_id):
+    """Exécuté dans un processus du pool : rend la facture dans le cache disque"""
+    try:
+        invoice = Invoice.objects.get(id=invoice_id)
+        return str(get_invoice_pdf(invoice))
+    finally:
+        connections.close_all()
+
+
+def _claim_jobs(limit):
+    """Réclame jusqu'à ``limit`` jobs en attente (sûr avec plusieurs workers)"""
+    claimed = []
+    candidates = (PdfRenderJob.objects
+                  .filter(status='pending')
+                  .order_by('created_at')
+                  .values_list('id', 'invoice_id')[:limit])
+    for job_id, invoice_id in candidates:
+        updated = PdfRenderJob.objects.filter(id=job_id, status='pending').update(
+            status='running', started_at=timezone.now(), attempts=F('attempts') + 1)
+        if updated:
+            claimed.append((job_id, invoice_id))
+    return claimed
+
+
+def requeue_stale_jobs():
+    """Remet en attente les jobs restés 'running' au-delà de PDF_JOB_TIMEOUT (worker arrêté)"""
+    limit = timezone.now() - timedelta(seconds=settings.PDF_JOB_TIMEOUT)
+    return (PdfRenderJob.objects
+            .filter(status='running', started_at__lt=limit)
+            .update(status='pending', started_at=None))
+
+
+def _render_pool(processes):
+    """
+    Pool de rendu. 'spawn' : les enfants n'héritent pas des connexions SQLite
+    du parent ; django.setup est importable avant que les applications soient chargées.
+    """
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=django.setup)
+
+
+def _requeue(job_ids):
+    """Remet en attente des jobs réclamés dont le rendu a été perdu"""
+    return (PdfRenderJob.objects
+            .filter(id__in=job_ids, status='running')
+            .update(status='pending', started_at=None))
+
+
+def run_worker(processes, poll_interval=1.0, once=False, log=None):
+    """
+    Boucle principale : garde au plus ``processes`` rendus en cours et met à
+    jour l'état des jobs à leur terminaison. ``once`` traite la file puis rend la main.
+    Si un processus de rendu meurt, le pool est inutilisable : les jobs en cours
+    sont remis en attente (ce n'est pas leur facture qui est en cause) et le
+    pool est recréé.
+    """
+    log = log or (lambda message: None)
+    connections.close_all()
+    in_flight = {}
+    pool = _render_pool(processes)
+    try:
+        while True:
+            requeue_stale_jobs()
+            claimed = _claim_jobs(processes - len(in_flight))
+            try:
+                for job_id, invoice_id in claimed:
+                    in_flight[pool.submit(render_invoice_job, invoice_id)] = job_id
+            except BrokenProcessPool:
+                lost = {*in_flight.values(), *(job_id for job_id, _ in claimed)}
+                pool = _restart_pool(pool, processes, lost, in_flight, log)
+                continue
+
+            if not in_flight:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                job_id = in_flight.pop(future)
+                try:
+                    future.result()
+                except BrokenProcessPool:
+                    _requeue([job_id])
+                    broken = True
+                except Exception as e:
+                    PdfRenderJob.objects.filter(id=job_id).update(
+                        status='failed', error=str(e), finished_at=timezone.now())
+                    log(f"Job {job_id} en échec: {e}")
+                else:
+                    PdfRenderJob.objects.filter(id=job_id).update(
+                        status='done', error='', finished_at=timezone.now())
+                    log(f"Job {job_id} terminé")
+            if broken:
+                pool = _restart_pool(pool, processes, set(in_flight.values()), in_flight, log)
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def _restart_pool(pool, processes, lost, in_flight, log):
+    """Remet en attente les jobs ``lost``, oublie les rendus en cours et recrée le pool"""
+    _requeue(lost)
+    in_flight.clear()
+    pool.shutdown(wait=False, cancel_futures=True)
+    log("Processus de rendu arrêté brutalement : jobs en cours remis en attente, pool recréé")
+    return _render_pool(processes)
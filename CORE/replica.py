@@ -0,0 +1,134 @@
+"""
+Réplique en lecture optionnelle (``DATABASE_REPLICA``).
+
+Les vues de consultation lourdes (``REPLICA_VIEWS`` : tableau de bord, listes,
+recherche, détail, PDF, exports) et les commandes de reporting lisent la base
+``replica`` ; tout le reste reste sur ``default``, qui seule reçoit les
+écritures. Le choix est porté par une ``ContextVar`` (voir
+``CORE.middleware.ReplicaRoutingMiddleware`` et ``use_replica``) :
+``PrimaryReplicaRouter`` n'envoie une lecture sur la réplique que dans ce
+contexte, jamais pour les applications et modèles de ``PRIMARY_ONLY_*``.
+
+Lire ses propres écritures : dès qu'une écriture a lieu dans le contexte, les
+lectures suivantes repassent sur ``default`` ; après une requête d'écriture,
+un cookie ``REPLICA_PIN_COOKIE`` garde l'utilisateur sur ``default`` pendant
+``REPLICA_PIN_SECONDS``, le temps que la réplique rattrape son retard.
+
+La réplique est une copie du fichier SQLite principal mise à jour par
+``sync`` (commande ``sync_replica``) ; elle doit être rafraîchie plus souvent
+que ``REPLICA_PIN_SECONDS``.
+"""
+import contextvars
+import sqlite3
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from time import perf_counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_ALIAS = 'replica'
+REPLICA_PIN_COOKIE = 'replica_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+# Vues en lecture seule servies par la réplique (noms d'URL)
+REPLICA_VIEWS = frozenset({
+    'CORE:dashboard',
+    'CORE:invoice_list',
+    'CORE:invoice_list_more',
+    'CORE:invoice_search',
+    'CORE:invoice_detail',
+    'CORE:invoice_download_pdf',
+    'CORE:invoice_batch_pdf',
+    'CORE:invoice_export_zip',
+    'CORE:invoice_export_ledger',
+    'CORE:client_list',
+    'CORE:catalog_list',
+})
+# Toujours lus sur la base principale : sessions et comptes (connexion
+# immédiate après écriture), file des rendus PDF (état interrogé en boucle)
+PRIMARY_ONLY_APPS = frozenset({'admin', 'auth', 'contenttypes', 'sessions'})
+PRIMARY_ONLY_MODELS = frozenset({'CORE.PdfRenderJob'})
+
+_current = contextvars.ContextVar('replica_routing', default=None)
+
+
+@dataclass
+class RoutingState:
+    """Routage du contexte en cours : lectures sur la réplique tant que rien n'est écrit"""
+    read_replica: bool = False
+    wrote: bool = False
+
+    @property
+    def reading_replica(self):
+        return self.read_replica and not self.wrote
+
+
+def is_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def activate(state):
+    return _current.set(state)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def use_replica():
+    """Lectures du bloc sur la réplique si elle est configurée (commandes de reporting)"""
+    state = RoutingState(read_replica=is_configured())
+    token = activate(state)
+    try:
+        yield state
+    finally:
+        deactivate(token)
+
+
+class PrimaryReplicaRouter:
+    """Écritures sur ``default`` ; lectures sur la réplique seulement dans un contexte ``RoutingState``"""
+
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if (state is None or not state.reading_replica
+                or model._meta.app_label in PRIMARY_ONLY_APPS or model._meta.label in PRIMARY_ONLY_MODELS):
+            return DEFAULT_DB_ALIAS
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Les deux bases ont le même contenu : une relation entre elles est valide
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def sync(source=None, target=None, timeout=None):
+    """
+    Copie la base principale dans la réplique par l'API de sauvegarde de
+    SQLite ; retourne la durée (secondes). La copie s'écrit dans le fichier de
+    la réplique, en une transaction : les connexions persistantes ouvertes
+    dessus voient le nouveau contenu à leur prochaine lecture, sans lecture
+    d'un état intermédiaire. En WAL, la lecture de la base principale ne
+    bloque pas ses écrivains.
+    """
+    source = source or settings.DATABASES[DEFAULT_DB_ALIAS]['NAME']
+    target = target or settings.DATABASES[REPLICA_ALIAS]['NAME']
+    timeout = settings.SQLITE_BUSY_TIMEOUT if timeout is None else timeout
+    start = perf_counter()
+    with closing(sqlite3.connect(source, timeout=timeout)) as primary, \
+            closing(sqlite3.connect(target, timeout=timeout)) as replica:
+        primary.backup(replica)
+    return perf_counter() - start
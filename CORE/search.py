@@ -0,0 +1,185 @@
+"""
+Recherche plein texte des factures : numéro, client (nom, adresse, ville,
+email), descriptions des lignes et notes.
+
+Sous SQLite, l'index est une table FTS5 (``core_invoice_search``, rowid =
+id de la facture, accents ignorés, préfixes indexés). Il est tenu à jour par
+les signaux de ``Invoice`` / ``InvoiceItem`` et par les écritures en masse
+(``create_invoice``, import) via ``index_invoices`` ; ``manage.py
+rebuild_search_index`` le reconstruit. Le propriétaire est indexé comme un
+jeton (``u<id>``) pour que la restriction à un utilisateur soit résolue par
+l'index lui-même. Sur un autre SGBD, la recherche retombe sur ``icontains``.
+
+``suggest_clients`` et ``suggest_catalog_items`` servent l'autocomplétion
+(clients, lignes de facture) : recherche par intervalle sur le préfixe
+normalisé, résolue par les index ``client_user_name_idx`` et
+``catalogitem_user_desc_idx``.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import CatalogItem, Client, Invoice, InvoiceItem, normalize_name
+from .pagination import INVOICE_ORDERING
+
+SEARCH_TABLE = 'core_invoice_search'
+SEARCH_PAGE_SIZE = 20
+SEARCHED_COLUMNS = '{invoice_number client items notes}'
+# Pondération bm25 : owner, invoice_number, client, items, notes
+RANK_WEIGHTS = (0, 10.0, 5.0, 2.0, 1.0)
+MAX_TERMS = 8
+INDEX_BATCH_SIZE = 500
+SUGGESTIONS = 8
+# Champs de Invoice repris dans le document indexé (voir _index_select)
+INDEXED_FIELDS = ['user_id', 'invoice_number', 'to_name', 'to_address', 'to_city', 'to_email', 'notes']
+
+
+def is_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def _index_select(where):
+    invoice = connection.ops.quote_name(Invoice._meta.db_table)
+    item = connection.ops.quote_name(InvoiceItem._meta.db_table)
+    return f"""
+        INSERT INTO {SEARCH_TABLE} (rowid, owner, invoice_number, client, items, notes)
+        SELECT i.id, 'u' || i.user_id, i.invoice_number,
+               i.to_name || ' ' || i.to_address || ' ' || i.to_city || ' ' || i.to_email,
+               COALESCE((SELECT group_concat(it.description, ' ') FROM {item} it WHERE it.invoice_id = i.id), ''),
+               i.notes
+        FROM {invoice} i
+        WHERE {where}
+    """
+
+
+def index_invoices(invoice_ids):
+    """(Ré)indexe les factures ``invoice_ids`` ; une facture disparue est retirée"""
+    if not is_enabled():
+        return
+    invoice_ids = list(invoice_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(invoice_ids), INDEX_BATCH_SIZE):
+            batch = invoice_ids[start:start + INDEX_BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", batch)
+            cursor.execute(_index_select(f"i.id IN ({placeholders})"), batch)
+
+
+def needs_reindex(previous, invoice):
+    """Vrai si ``invoice`` est nouvelle ou si un champ indexé diffère de ``previous`` (valeurs en base)"""
+    return previous is None or any(previous[name] != getattr(invoice, name) for name in INDEXED_FIELDS)
+
+
+def remove_invoices(invoice_ids):
+    if not is_enabled():
+        return
+    invoice_ids = list(invoice_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(invoice_ids), INDEX_BATCH_SIZE):
+            batch = invoice_ids[start:start + INDEX_BATCH_SIZE]
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(batch))})", batch)
+
+
+def rebuild(chunk_size=10000, progress=None):
+    """Reconstruit tout l'index par tranches d'identifiants ; retourne le nombre de factures indexées"""
+    if not is_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        last_id = Invoice.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        indexed = 0
+        for start in range(0, last_id, chunk_size):
+            cursor.execute(_index_select("i.id > %s AND i.id <= %s"), [start, start + chunk_size])
+            indexed += cursor.rowcount
+            if progress:
+                progress(indexed)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def match_expression(user, query):
+    """
+    Requête FTS5 à partir de la saisie : chaque mot devient un préfixe entre
+    guillemets (aucune syntaxe FTS5 n'est interprétée), tous requis.
+    """
+    terms = re.findall(r'\w+', query)[:MAX_TERMS]
+    if not terms:
+        return None
+    phrases = ' '.join(f'"{term}"*' for term in terms)
+    return f'owner:u{user.pk} AND {SEARCHED_COLUMNS} : ({phrases})'
+
+
+def search_invoices(user, query, page=1):
+    """
+    Factures de ``user`` correspondant à ``query``, les plus pertinentes
+    d'abord. Retourne ``(factures de la page, page suivante ?)``.
+    """
+    page = max(1, page)
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    if not is_enabled():
+        return _search_fallback(user, query, offset)
+
+    expression = match_expression(user, query)
+    if expression is None:
+        return [], False
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s OFFSET %s",
+            [expression, SEARCH_PAGE_SIZE + 1, offset])
+        ids = [row[0] for row in cursor.fetchall()]
+    has_next = len(ids) > SEARCH_PAGE_SIZE
+    ids = ids[:SEARCH_PAGE_SIZE]
+    invoices = Invoice.objects.filter(user=user, id__in=ids).in_bulk()
+    return [invoices[pk] for pk in ids if pk in invoices], has_next
+
+
+def _search_fallback(user, query, offset):
+    terms = re.findall(r'\w+', query)[:MAX_TERMS]
+    if not terms:
+        return [], False
+    invoices = Invoice.objects.filter(user=user)
+    for term in terms:
+        invoices = invoices.filter(
+            Q(invoice_number__icontains=term) | Q(to_name__icontains=term) | Q(to_address__icontains=term)
+            | Q(to_city__icontains=term) | Q(notes__icontains=term) | Q(items__description__icontains=term))
+    page = list(invoices.distinct().order_by(*INVOICE_ORDERING)[offset:offset + SEARCH_PAGE_SIZE + 1])
+    return page[:SEARCH_PAGE_SIZE], len(page) > SEARCH_PAGE_SIZE
+
+
+def prefix_range(field, query):
+    """
+    Filtre ``field`` commence par ``query`` normalisé, sous forme d'intervalle :
+    sous SQLite, LIKE ignore la casse et n'utilise donc pas l'index.
+    """
+    prefix = normalize_name(query)
+    if not prefix:
+        return None
+    return {f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'}
+
+
+def suggest_clients(user, query, limit=SUGGESTIONS):
+    """
+    Clients de ``user`` dont le nom commence par ``query`` (casse et accents
+    ignorés), par ordre alphabétique.
+    """
+    prefix = prefix_range('name_normalized', query)
+    if prefix is None:
+        return []
+    return list(Client.objects
+                .filter(user=user, **prefix)
+                .order_by('name_normalized', 'id')
+                .only('id', 'name', 'address', 'city', 'email')[:limit])
+
+
+def suggest_catalog_items(user, query, limit=SUGGESTIONS):
+    """Articles du catalogue de ``user`` dont la description commence par ``query``"""
+    prefix = prefix_range('description_normalized', query)
+    if prefix is None:
+        return []
+    return list(CatalogItem.objects
+                .filter(user=user, **prefix)
+                .order_by('description_normalized', 'id')
+                .only('id', 'description', 'unit_price')[:limit])
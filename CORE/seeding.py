@@ -0,0 +1,207 @@
+"""
+Jeu de données synthétique pour les mesures de performance
+(``manage.py seed_benchmark``, ``manage.py benchmark``).
+
+Les volumes sont paramétrables et les distributions imitent un parc réel :
+nombre de factures par utilisateur log-normal (quelques gros comptes), clients
+sollicités selon une loi de Zipf, lignes par facture concentrées entre 1 et 5,
+montants log-normaux, statut déduit de l'ancienneté de l'échéance. Le premier
+utilisateur (``<préfixe>-0001``) reçoit exactement ``invoices`` factures : c'est
+le compte mesuré par ``benchmark``.
+
+Tout est inséré par ``bulk_create`` dans une transaction par utilisateur ; les
+statistiques mensuelles et l'index de recherche sont mis à jour ensuite, comme
+pour un import. Le générateur est déterministe pour une graine donnée.
+"""
+import math
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from . import search, stats
+from .models import (
+    Client, Invoice, InvoiceItem, PdfRenderJob, UserProfile, compute_totals, normalize_name, quantize_money,
+)
+
+DEFAULT_PREFIX = 'bench'
+DEFAULT_PASSWORD = 'benchmark'
+INSERT_BATCH_SIZE = 500
+
+CITIES = ['Paris', 'Lyon', 'Marseille', 'Toulouse', 'Nantes', 'Lille', 'Bordeaux', 'Rennes', 'Strasbourg', 'Nice']
+STREETS = ['rue de la République', 'avenue Jean Jaurès', 'boulevard Voltaire', 'rue Victor Hugo', 'place du Marché']
+COMPANY_FORMS = ['SARL', 'SAS', 'EURL', 'SA', 'SCI', '']
+COMPANY_WORDS = ['Atelier', 'Boulangerie', 'Cabinet', 'Garage', 'Studio', 'Agence', 'Pharmacie', 'Librairie',
+                 'Menuiserie', 'Électricité', 'Conseil', 'Transports', 'Société', 'Hôtel', 'Café']
+SURNAMES = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+            'Simon', 'Laurent', 'Lefèvre', 'Michel', 'Garcia', 'Bertrand', 'Roux', 'Fournier', 'Girard', 'Bonnet']
+SERVICES = ['Développement', 'Maintenance', 'Conseil', 'Formation', 'Intervention', 'Audit', 'Rédaction',
+            'Installation', 'Dépannage', 'Conception graphique', 'Gestion de projet', 'Hébergement']
+UNITS = ['heure', 'jour', 'forfait', 'mois', 'page', 'déplacement']
+# Quantités et poids : surtout des unités, parfois des heures ou des jours fractionnés
+QUANTITIES = [(Decimal('1'), 50), (Decimal('2'), 12), (Decimal('3'), 8), (Decimal('0.5'), 6),
+              (Decimal('1.5'), 5), (Decimal('4'), 5), (Decimal('5'), 5), (Decimal('7.5'), 4),
+              (Decimal('10'), 3), (Decimal('20'), 2)]
+ITEM_COUNTS = [(1, 30), (2, 22), (3, 16), (4, 10), (5, 8), (6, 5), (8, 4), (10, 3), (15, 1), (25, 1)]
+VAT_RATES = [(Decimal('20'), 85), (Decimal('10'), 8), (Decimal('5.5'), 5), (Decimal('2.1'), 2)]
+
+
+@dataclass
+class SeedReport:
+    users: int = 0
+    clients: int = 0
+    invoices: int = 0
+    items: int = 0
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _company_name(rng, index):
+    form = rng.choice(COMPANY_FORMS)
+    name = f"{rng.choice(COMPANY_WORDS)} {rng.choice(SURNAMES)}"
+    # Le suffixe garde les noms distincts tout en partageant des préfixes réalistes
+    return f"{name} {form} {index}".replace('  ', ' ')
+
+
+def _address(rng):
+    return f"{rng.randint(1, 180)} {rng.choice(STREETS)}\n{rng.randint(10, 95)}{rng.randint(0, 999):03d}"
+
+
+def _invoice_count(rng, mean):
+    # Log-normale de moyenne ``mean`` (sigma 0,8) : beaucoup de petits comptes, quelques gros
+    sigma = 0.8
+    return max(1, round(mean * rng.lognormvariate(-sigma ** 2 / 2, sigma)))
+
+
+def _zipf_weights(count):
+    return [1 / rank for rank in range(1, count + 1)]
+
+
+def _status(rng, due_date, today):
+    draw = rng.random()
+    if draw < 0.02:
+        return 'cancelled'
+    if due_date >= today:
+        return 'draft' if draw < 0.25 else 'paid' if draw < 0.35 else 'sent'
+    return 'overdue' if draw < 0.12 else 'sent' if draw < 0.15 else 'paid'
+
+
+def existing_users(prefix=DEFAULT_PREFIX):
+    return User.objects.filter(username__startswith=f'{prefix}-')
+
+
+def seed(users=10, invoices=200, clients=50, months=24, prefix=DEFAULT_PREFIX, seed=0, today=None,
+         password=DEFAULT_PASSWORD, progress=None):
+    """
+    Crée ``users`` utilisateurs ``<prefix>-NNNN`` avec profil, ``clients``
+    clients chacun et en moyenne ``invoices`` factures réparties sur les
+    ``months`` derniers mois. Retourne un ``SeedReport``.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    start = today - timedelta(days=round(months * 30.44))
+    password = make_password(password)
+    report = SeedReport()
+
+    for index in range(1, users + 1):
+        count = invoices if index == 1 else _invoice_count(rng, invoices)
+        with transaction.atomic():
+            _seed_user(rng, report, f'{prefix}-{index:04d}', password, count, clients, start, today)
+        if progress:
+            progress(report)
+    return report
+
+
+def _seed_user(rng, report, username, password, invoice_count, client_count, start, today):
+    user = User.objects.create(username=username, password=password, email=f'{username}@example.com')
+    company = _company_name(rng, report.users + 1)
+    is_vat_exempt = rng.random() < 0.15
+    profile = UserProfile.objects.create(
+        user=user, company_name=company, address=_address(rng), city=rng.choice(CITIES),
+        email=user.email, siret=f'{rng.randrange(10 ** 13, 10 ** 14)}', is_ei=is_vat_exempt,
+    )
+    clients = Client.objects.bulk_create([
+        Client(user=user, name=name, name_normalized=normalize_name(name), address=_address(rng),
+               city=rng.choice(CITIES), email=f'contact{number}@client.example')
+        for number, name in ((number, _company_name(rng, number)) for number in range(1, client_count + 1))
+    ], batch_size=INSERT_BATCH_SIZE)
+    client_weights = _zipf_weights(len(clients))
+
+    days = (today - start).days
+    dates = sorted(start + timedelta(days=rng.randrange(days + 1)) for _ in range(invoice_count))
+    pending = []
+    for number, invoice_date in enumerate(dates, start=1):
+        client = rng.choices(clients, client_weights)[0] if clients else None
+        vat_rate = Decimal('0') if is_vat_exempt else _weighted(rng, VAT_RATES)
+        due_date = invoice_date + timedelta(days=rng.choice([0, 15, 30, 30, 30, 45, 60]))
+        lines = []
+        for _ in range(_weighted(rng, ITEM_COUNTS)):
+            quantity = _weighted(rng, QUANTITIES)
+            unit_price = quantize_money(math.exp(rng.gauss(4.2, 1.0)))
+            lines.append((f"{rng.choice(SERVICES)} ({rng.choice(UNITS)})", quantity, unit_price,
+                          quantize_money(quantity * unit_price)))
+        subtotal, vat_amount, total = compute_totals(sum(line[3] for line in lines), vat_rate, is_vat_exempt)
+        invoice = Invoice(
+            user=user, client=client,
+            from_name=company, from_address=profile.address, from_city=profile.city, from_email=profile.email,
+            siret=profile.siret, is_ei=profile.is_ei,
+            to_name=client.name if client else 'Client', to_address=client.address if client else '',
+            to_city=client.city if client else '', to_email=client.email if client else '',
+            invoice_number=f'F-{invoice_date.year}-{number:05d}', invoice_date=invoice_date, due_date=due_date,
+            subtotal=subtotal, vat_rate=vat_rate, vat_amount=vat_amount, total=total,
+            is_vat_exempt=is_vat_exempt, status=_status(rng, due_date, today),
+            payment_terms='Virement à 30 jours', late_fee_rate=Decimal('10.00'),
+        )
+        pending.append((invoice, lines))
+        if len(pending) >= INSERT_BATCH_SIZE:
+            _flush(report, pending)
+            pending = []
+    _flush(report, pending)
+    report.users += 1
+    report.clients += len(clients)
+
+
+def _flush(report, pending):
+    if not pending:
+        return
+    invoices = Invoice.objects.bulk_create([invoice for invoice, _ in pending])
+    items = [InvoiceItem(invoice=invoice, description=description, quantity=quantity, unit_price=unit_price,
+                         line_total=line_total, order=order)
+             for invoice, lines in pending
+             for order, (description, quantity, unit_price, line_total) in enumerate(lines)]
+    InvoiceItem.objects.bulk_create(items, batch_size=INSERT_BATCH_SIZE)
+    stats.record_created(invoices)
+    search.index_invoices(invoice.id for invoice in invoices)
+    report.invoices += len(invoices)
+    report.items += len(items)
+
+
+def flush(prefix=DEFAULT_PREFIX):
+    """
+    Supprime les utilisateurs ``<prefix>-*`` et leurs données ; retourne leur
+    nombre. Lignes et factures sont effacées par DELETE direct : la cascade de
+    l'ORM enverrait les signaux (statistiques, index) facture par facture.
+    """
+    user_ids = list(existing_users(prefix).values_list('id', flat=True))
+    if not user_ids:
+        return 0
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    invoices = f"SELECT id FROM {quote(Invoice._meta.db_table)} WHERE user_id IN ({placeholders})"
+    with transaction.atomic():
+        search.remove_invoices(Invoice.objects.filter(user_id__in=user_ids).values_list('id', flat=True))
+        with connection.cursor() as cursor:
+            for model in (InvoiceItem, PdfRenderJob):
+                cursor.execute(f"DELETE FROM {quote(model._meta.db_table)} WHERE invoice_id IN ({invoices})",
+                               user_ids)
+            cursor.execute(f"DELETE FROM {quote(Invoice._meta.db_table)} WHERE user_id IN ({placeholders})",
+                           user_ids)
+        User.objects.filter(id__in=user_ids).delete()
+    return len(user_ids)
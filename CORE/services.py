@@ -0,0 +1,194 @@
+"""
+Couche service d'écriture des factures.
+
+``create_invoice`` valide l'en-tête et les lignes avec les formulaires de
+l'application, calcule les totaux en une passe, puis enregistre la facture
+par un INSERT et ses lignes par ``bulk_create`` : le nombre de requêtes ne
+dépend pas du nombre de lignes. Utilisé par la vue de création comme par
+les scripts.
+
+``recompute_totals`` recalcule par lots les totaux enregistrés à partir des
+lignes (somme faite par la base) selon la règle d'arrondi de ``CORE.models``.
+``mark_overdue`` fait passer en retard les factures envoyées échues.
+``reprice_catalog`` révise les prix du catalogue en un seul UPDATE.
+"""
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import BigIntegerField, DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from . import caching, search, stats
+from .forms import InvoiceForm, ItemForm
+from .models import CENT, CatalogItem, Client, Invoice, InvoiceItem, compute_totals, quantize_money
+
+HEADER_FIELDS = [
+    'from_name', 'from_address', 'from_city', 'from_email', 'siret', 'rcs', 'is_ei',
+    'to_name', 'to_address', 'to_city', 'to_email',
+    'invoice_number', 'invoice_date', 'service_date_start', 'service_date_end', 'due_date',
+    'payment_terms', 'late_fee_rate', 'recovery_fee', 'autoliquidation',
+]
+
+
+def _validate(user, header, items, status):
+    """Retourne ``(en-tête nettoyé, lignes nettoyées)`` ou lève ValidationError"""
+    errors = {}
+    form = InvoiceForm(data=header)
+    if not form.is_valid():
+        errors.update({field: list(messages) for field, messages in form.errors.items()})
+
+    cleaned_items = []
+    for index, item in enumerate(items, start=1):
+        item_form = ItemForm(data=item)
+        if not item_form.is_valid():
+            for field, field_errors in item_form.errors.items():
+                errors.setdefault('items', []).extend(
+                    f"Ligne {index} ({field}) : {message}" for message in field_errors)
+            continue
+        cleaned_items.append(item_form.cleaned_data)
+
+    if status not in dict(Invoice.STATUS_CHOICES):
+        errors['status'] = [f"État inconnu : {status}"]
+
+    client_id = form.cleaned_data.get('client_id')
+    if client_id and not Client.objects.filter(user=user, pk=client_id).exists():
+        errors['client_id'] = ["Client introuvable."]
+
+    number = form.cleaned_data.get('invoice_number')
+    if number and Invoice.objects.filter(user=user, invoice_number=number).exists():
+        errors.setdefault('invoice_number', []).append(f"La facture {number} existe déjà.")
+
+    if errors:
+        raise ValidationError(errors)
+    return form.cleaned_data, cleaned_items
+
+
+def create_invoice(user, header, items, status='draft'):
+    """
+    Crée une facture de ``user`` à partir de ``header`` (champs de InvoiceForm,
+    ``client_id`` facultatif) et de ``items`` (dicts description / quantity /
+    unit_price).
+    Lève ValidationError (dict champ -> messages, lignes sous 'items').
+    """
+    data, items = _validate(user, header, items, status)
+
+    lines = []
+    subtotal = Decimal('0')
+    for item in items:
+        line_total = quantize_money(item['quantity'] * item['unit_price'])
+        subtotal += line_total
+        lines.append((item, line_total))
+
+    is_vat_exempt = bool(data.get('is_vat_exempt'))
+    vat_rate = Decimal('0') if is_vat_exempt else Decimal(str(data.get('vat_rate') or 0))
+    subtotal, vat_amount, total = compute_totals(subtotal, vat_rate, is_vat_exempt)
+
+    with transaction.atomic():
+        invoice = Invoice.objects.create(
+            user=user,
+            client_id=data.get('client_id'),
+            subtotal=subtotal,
+            vat_rate=vat_rate,
+            vat_amount=vat_amount,
+            total=total,
+            is_vat_exempt=is_vat_exempt,
+            status=status,
+            **{field: data[field] for field in HEADER_FIELDS},
+        )
+        # bulk_create ne passe pas par InvoiceItem.save() : line_total est calculé ci-dessus.
+        # Django découpe en lots selon la limite de paramètres du SGBD (999 sous SQLite).
+        InvoiceItem.objects.bulk_create(
+            [InvoiceItem(invoice=invoice, description=item['description'], quantity=item['quantity'],
+                         unit_price=item['unit_price'], line_total=line_total, order=index)
+             for index, (item, line_total) in enumerate(lines)]
+        )
+        # Le signal post_save a indexé la facture avant ses lignes
+        search.index_invoices([invoice.pk])
+    return invoice
+
+
+def recompute_totals(invoices=None, chunk_size=500, dry_run=False):
+    """
+    Générateur : recalcule les totaux de ``invoices`` (toutes par défaut) par
+    lots de ``chunk_size`` en parcourant les identifiants, et produit pour
+    chaque lot ``(nombre de factures lues, [(facture, anciens totaux), ...])``.
+    Les factures modifiées sont enregistrées par un UPDATE groupé par lot,
+    sauf avec ``dry_run``.
+    """
+    invoices = (Invoice.objects.all() if invoices is None else invoices).order_by('id').only(
+        'id', 'user_id', 'invoice_number', 'invoice_date', 'subtotal', 'vat_rate', 'vat_amount',
+        'total', 'is_vat_exempt')
+    last_id = 0
+    while True:
+        chunk = list(invoices.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        last_id = chunk[-1].id
+        sums = dict(InvoiceItem.objects
+                    .filter(invoice_id__in=[invoice.id for invoice in chunk])
+                    .values_list('invoice_id')
+                    .annotate(Sum('line_total'))
+                    .order_by())
+
+        changes = []
+        now = timezone.now()
+        for invoice in chunk:
+            old = (invoice.subtotal, invoice.vat_amount, invoice.total)
+            new = compute_totals(sums.get(invoice.id), invoice.vat_rate, invoice.is_vat_exempt)
+            if new != old:
+                invoice.subtotal, invoice.vat_amount, invoice.total = new
+                invoice.updated_at = now
+                changes.append((invoice, old))
+
+        if changes and not dry_run:
+            changed = [invoice for invoice, _ in changes]
+            with transaction.atomic():
+                Invoice.objects.bulk_update(changed, ['subtotal', 'vat_amount', 'total', 'updated_at'])
+                stats.refresh_months({(invoice.user_id, invoice.invoice_date) for invoice in changed})
+        yield len(chunk), changes
+
+
+def mark_overdue(today=None, chunk_size=1000):
+    """
+    Passe à 'overdue' les factures 'sent' dont l'échéance est dépassée, par
+    UPDATE groupés de ``chunk_size`` lignes, et met à jour les statistiques
+    des mois touchés. Idempotent ; retourne le nombre de factures modifiées.
+    """
+    today = today or timezone.localdate()
+    eligible = Invoice.objects.filter(status='sent', due_date__lt=today)
+    updated = 0
+    while True:
+        chunk = list(eligible.order_by().values_list('id', 'user_id', 'invoice_date')[:chunk_size])
+        if not chunk:
+            return updated
+        with transaction.atomic():
+            # La condition sur le statut est rejouée : une facture payée entre-temps reste payée
+            count = eligible.filter(id__in=[pk for pk, _, _ in chunk]).update(
+                status='overdue', updated_at=timezone.now())
+            stats.refresh_months({(user_id, day) for _, user_id, day in chunk})
+        updated += count
+
+
+def reprice_catalog(user, percent, prefix=''):
+    """
+    Applique ``percent`` % (négatif pour une baisse) aux prix du catalogue de
+    ``user``, limité aux descriptions commençant par ``prefix``. Un seul
+    UPDATE ; retourne le nombre d'articles modifiés.
+    """
+    # Calcul en centimes entiers pour suivre exactement quantize_money (demi-centime au supérieur)
+    basis_points = int((Decimal(str(percent)) * 100).to_integral_value())
+    cents = Cast(Round(F('unit_price') * 100), output_field=BigIntegerField())
+    new_price = ExpressionWrapper(
+        (cents * (10000 + basis_points) + 5000) / 10000 * Value(CENT),
+        output_field=DecimalField(max_digits=10, decimal_places=2))
+
+    catalog = CatalogItem.objects.filter(user=user)
+    bounds = search.prefix_range('description_normalized', prefix)
+    if bounds:
+        catalog = catalog.filter(**bounds)
+    count = catalog.update(unit_price=new_price, updated_at=timezone.now())
+    # UPDATE ne passe pas par les signaux
+    caching.bump('catalog', user.pk)
+    return count
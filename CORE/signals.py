@@ -0,0 +1,93 @@
+"""Signaux de l'application CORE"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, search, stats
+from .models import CatalogItem, Client, Invoice, InvoiceItem
+from .pdf import PdfCache
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_invoice_pdf(sender, instance, **kwargs):
+    """
+    Supprime les PDF en cache d'une facture supprimée. Une modification n'a
+    rien à invalider : la clé du cache est une empreinte du contenu, et le
+    rendu suivant remplace l'ancien fichier.
+    """
+    PdfCache().invalidate(instance.pk)
+
+
+@receiver(pre_save, sender=Invoice)
+def remember_invoice_previous(sender, instance, raw=False, **kwargs):
+    """
+    Mémorise les valeurs en base avant modification (une seule requête) : delta
+    des agrégats mensuels et décision de réindexation
+    """
+    if raw:
+        return
+    previous = None
+    if instance.pk is not None:
+        fields = dict.fromkeys([*stats.TRACKED_FIELDS, *search.INDEXED_FIELDS])
+        previous = Invoice.objects.filter(pk=instance.pk).values(*fields).first()
+    instance._previous = previous
+
+
+@receiver(post_save, sender=Invoice)
+def update_invoice_stats(sender, instance, raw=False, **kwargs):
+    """Met à jour les agrégats mensuels après création ou modification"""
+    if raw:
+        return
+    stats.record_change(getattr(instance, '_previous', None), instance)
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_invoice_stats(sender, instance, **kwargs):
+    """Retire la facture supprimée des agrégats mensuels"""
+    stats.record_delete(instance)
+
+
+@receiver(post_save, sender=Invoice)
+def index_invoice(sender, instance, raw=False, **kwargs):
+    """Met à jour l'index plein texte de la facture si un champ indexé a changé (pas pour un statut)"""
+    if raw or not search.needs_reindex(getattr(instance, '_previous', None), instance):
+        return
+    search.index_invoices([instance.pk])
+
+
+@receiver(post_delete, sender=Invoice)
+def unindex_invoice(sender, instance, **kwargs):
+    search.remove_invoices([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=InvoiceItem)
+def index_invoice_item(sender, instance, raw=False, origin=None, **kwargs):
+    """Les descriptions des lignes font partie du document indexé de la facture"""
+    if raw or isinstance(origin, Invoice):
+        # Suppression en cascade : la facture est retirée de l'index par unindex_invoice
+        return
+    search.index_invoices([instance.invoice_id])
+
+
+@receiver([post_save, post_delete], sender=InvoiceItem)
+def invalidate_invoice_fragments(sender, instance, raw=False, origin=None, **kwargs):
+    """Une ligne modifiée ne change pas Invoice.updated_at : les fragments de l'utilisateur sont périmés"""
+    if raw or isinstance(origin, Invoice):
+        return
+    if InvoiceItem.invoice.is_cached(instance):
+        user_id = instance.invoice.user_id
+    else:
+        user_id = Invoice.objects.filter(pk=instance.invoice_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        caching.bump('invoices', user_id)
+
+
+@receiver([post_save, post_delete], sender=Client)
+def invalidate_client_suggestions(sender, instance, **kwargs):
+    """Les suggestions de clients en cache ne sont plus à jour"""
+    caching.bump('clients', instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=CatalogItem)
+def invalidate_catalog_suggestions(sender, instance, **kwargs):
+    """Les suggestions du catalogue en cache ne sont plus à jour"""
+    caching.bump('catalog', instance.user_id)
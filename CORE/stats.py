@@ -0,0 +1,157 @@
+"""
+Statistiques de facturation agrégées par utilisateur, mois et statut.
+
+La table ``InvoiceStats`` est tenue à jour de façon incrémentale par les
+signaux de ``Invoice`` (création, changement de statut ou de montants,
+suppression, y compris depuis l'admin). Les traitements de masse qui
+contournent ``save()`` appellent ``record_created`` (``bulk_create``) ou
+``refresh_months`` (``QuerySet.update``) sur les mois touchés. Le dashboard
+lit ces agrégats au lieu de parcourir l'historique des factures.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import Invoice, InvoiceStats, quantize_money
+
+TRACKED_FIELDS = ['user_id', 'invoice_date', 'status', 'subtotal', 'vat_amount', 'total']
+AMOUNT_FIELDS = ['subtotal', 'vat_amount', 'total']
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def contribution(values):
+    """Clé (utilisateur, mois, statut) et montants d'une facture (dict ou instance)"""
+    get = values.get if isinstance(values, dict) else lambda name: getattr(values, name)
+    key = (get('user_id'), month_of(get('invoice_date')), get('status'))
+    amounts = [Decimal(str(get(name) or 0)) for name in AMOUNT_FIELDS]
+    return key, amounts
+
+
+def apply_delta(key, count, amounts):
+    """
+    Ajoute ``count`` factures (retire si négatif) et les montants ``amounts``
+    (déjà signés et sommés) à la ligne d'agrégats correspondante.
+    """
+    user_id, month, status = key
+    changes = {'invoice_count': F('invoice_count') + count}
+    for name, amount in zip(AMOUNT_FIELDS, amounts):
+        changes[name] = F(name) + amount
+    rows = InvoiceStats.objects.filter(user_id=user_id, month=month, status=status)
+    if rows.update(**changes) or count < 0:
+        return
+    with transaction.atomic():
+        _, created = InvoiceStats.objects.select_for_update().get_or_create(
+            user_id=user_id, month=month, status=status,
+            defaults={'invoice_count': count, **dict(zip(AMOUNT_FIELDS, amounts))})
+        if not created:
+            rows.update(**changes)
+
+
+def record_change(previous, invoice):
+    """Répercute le passage de ``previous`` (valeurs en base ou None) à ``invoice``"""
+    new = contribution(invoice)
+    if previous is not None:
+        old = contribution(previous)
+        if old == new:
+            return
+        apply_delta(old[0], -1, [-amount for amount in old[1]])
+    apply_delta(new[0], 1, new[1])
+
+
+def record_created(invoices):
+    """Répercute des factures insérées sans save() (bulk_create), une mise à jour par clé"""
+    deltas = {}
+    for invoice in invoices:
+        key, amounts = contribution(invoice)
+        count, totals = deltas.get(key, (0, [Decimal('0')] * len(AMOUNT_FIELDS)))
+        deltas[key] = (count + 1, [total + amount for total, amount in zip(totals, amounts)])
+    for key, (count, totals) in deltas.items():
+        apply_delta(key, count, totals)
+
+
+def record_delete(invoice):
+    key, amounts = contribution(invoice)
+    apply_delta(key, -1, [-amount for amount in amounts])
+
+
+def _aggregate(invoices):
+    """Agrégats recalculés depuis la table des factures"""
+    return (invoices
+            .annotate(month=TruncMonth('invoice_date'))
+            .values('user_id', 'month', 'status')
+            .annotate(invoice_count=Count('id'),
+                      subtotal=Sum('subtotal'),
+                      vat_amount=Sum('vat_amount'),
+                      total=Sum('total'))
+            .order_by())
+
+
+def rebuild(user_ids=None):
+    """Reconstruit les agrégats (de tous les utilisateurs ou de ``user_ids``)"""
+    invoices = Invoice.objects.all()
+    stats = InvoiceStats.objects.all()
+    if user_ids is not None:
+        invoices = invoices.filter(user_id__in=user_ids)
+        stats = stats.filter(user_id__in=user_ids)
+    with transaction.atomic():
+        stats.delete()
+        InvoiceStats.objects.bulk_create(
+            (InvoiceStats(**row) for row in _aggregate(invoices).iterator()), batch_size=500)
+
+
+def refresh_months(pairs):
+    """Recalcule les agrégats des couples (utilisateur, mois) touchés par un traitement de masse"""
+    pairs = {(user_id, month_of(day)) for user_id, day in pairs}
+    with transaction.atomic():
+        for user_id, month in pairs:
+            InvoiceStats.objects.filter(user_id=user_id, month=month).delete()
+            next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+            invoices = Invoice.objects.filter(user_id=user_id, invoice_date__gte=month,
+                                              invoice_date__lt=next_month)
+            InvoiceStats.objects.bulk_create(InvoiceStats(**row) for row in _aggregate(invoices))
+
+
+def find_drift(user_ids=None):
+    """Liste des écarts (clé, agrégat stocké, agrégat recalculé) entre la table et les factures"""
+    invoices = Invoice.objects.all()
+    stats = InvoiceStats.objects.all()
+    if user_ids is not None:
+        invoices = invoices.filter(user_id__in=user_ids)
+        stats = stats.filter(user_id__in=user_ids)
+
+    def normalize(row):
+        # Les sommes SQLite reviennent en flottants : comparaison au centime
+        return (row['invoice_count'],) + tuple(quantize_money(row[name]) for name in AMOUNT_FIELDS)
+
+    expected = {(r['user_id'], r['month'], r['status']): normalize(r) for r in _aggregate(invoices).iterator()}
+    stored = {(r['user_id'], r['month'], r['status']): normalize(r)
+              for r in stats.values('user_id', 'month', 'status', 'invoice_count', *AMOUNT_FIELDS).iterator()}
+    empty = (0,) + (Decimal('0'),) * len(AMOUNT_FIELDS)
+    drift = []
+    for key in sorted(expected.keys() | stored.keys(), key=str):
+        if expected.get(key, empty) != stored.get(key, empty):
+            drift.append((key, stored.get(key), expected.get(key)))
+    return drift
+
+
+def dashboard_stats(user):
+    """Compteurs et montants du dashboard, lus depuis la table d'agrégats (une requête)"""
+    zero = Value(Decimal('0.00'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    paid = Q(status='paid')
+    pending = Q(status__in=['draft', 'sent'])
+    unpaid = Q(status__in=['draft', 'sent', 'overdue'])
+    overdue = Q(status='overdue')
+    return InvoiceStats.objects.filter(user=user).aggregate(
+        total_invoices=Coalesce(Sum('invoice_count'), 0),
+        paid_invoices=Coalesce(Sum('invoice_count', filter=paid), 0),
+        pending_invoices=Coalesce(Sum('invoice_count', filter=pending), 0),
+        overdue_invoices=Coalesce(Sum('invoice_count', filter=overdue), 0),
+        total_revenue=Coalesce(Sum('total', filter=paid), zero),
+        pending_amount=Coalesce(Sum('total', filter=unpaid), zero),
+    )
@@ -1,3 +1,1434 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import logging
+import os
+import re
+import runpy
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import zipfile
+from collections import Counter
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.core.servers.basehttp import WSGIServer
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.test.testcases import LiveServerThread, QuietWSGIRequestHandler
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from . import benchmarks, caching, exports, loadtest, pdf, pdf_jobs, replica, search, seeding, stats, timing
+from .models import (
+    CatalogItem, Client, ContactMessage, Invoice, InvoiceItem, InvoiceStats, PdfRenderJob, UserProfile, compute_totals,
+)
+from .importers import import_invoices
+from .pagination import INVOICE_ORDERING, encode_cursor, keyset_queryset
+from .services import create_invoice, mark_overdue, reprice_catalog
+from .urls import urlpatterns
+
+# Réglages imposés à tous les tests, quel que soit le lanceur (manage.py test, pytest...) :
+# - cache en mémoire, isolé du cache fichier partagé (fragment_cache/) de l'application ;
+# - pas de routage vers une réplique (DATABASE_REPLICA) : elle ne verrait pas les
+#   transactions des tests, ReplicaRoutingTests installe son propre routeur.
+TEST_SETTINGS = override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    DATABASE_ROUTERS=[],
+)
+
+
+# Une ligne de log par requête (CORE.timing) : réduite aux requêtes lentes pendant les tests
+TIMING_LOGGER = logging.getLogger('CORE.timing')
+_timing_level = None
+
+
+def setUpModule():
+    global _timing_level
+    TEST_SETTINGS.enable()
+    _timing_level = TIMING_LOGGER.level
+    TIMING_LOGGER.setLevel(logging.WARNING)
+
+
+def tearDownModule():
+    TIMING_LOGGER.setLevel(_timing_level)
+    TEST_SETTINGS.disable()
+
+
+def make_invoice(user, number='FACT-001', **kwargs):
+    fields = {
+        'from_name': 'Émetteur',
+        'from_address': '1 rue de Paris',
+        'to_name': 'Client',
+        'to_address': '2 avenue de Lyon',
+        'invoice_number': number,
+        'invoice_date': date(2025, 1, 15),
+        'due_date': date(2025, 2, 15),
+        'subtotal': Decimal('100.00'),
+        'vat_amount': Decimal('20.00'),
+        'total': Decimal('120.00'),
+    }
+    fields.update(kwargs)
+    invoice = Invoice.objects.create(user=user, **fields)
+    InvoiceItem.objects.create(invoice=invoice, description='Prestation', quantity=1, unit_price=Decimal('100.00'))
+    return invoice
+
+
+class CreateInvoiceTests(TestCase):
+    header = {
+        'from_name': 'Émetteur',
+        'from_address': '1 rue de Paris',
+        'to_name': 'Client',
+        'to_address': '2 avenue de Lyon',
+        'invoice_number': 'FACT-001',
+        'invoice_date': date(2025, 1, 15),
+        'due_date': date(2025, 2, 15),
+        'vat_rate': Decimal('20'),
+    }
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+
+    def _items(self, count):
+        return [{'description': f'Ligne {i}', 'quantity': Decimal('2'), 'unit_price': Decimal('12.50')}
+                for i in range(count)]
+
+    def test_totals_and_items(self):
+        invoice = create_invoice(self.user, self.header, self._items(3))
+        self.assertEqual(invoice.subtotal, Decimal('75.00'))
+        self.assertEqual(invoice.vat_amount, Decimal('15.00'))
+        self.assertEqual(invoice.total, Decimal('90.00'))
+        items = list(invoice.items.all())
+        self.assertEqual([item.order for item in items], [0, 1, 2])
+        self.assertEqual({item.line_total for item in items}, {Decimal('25.00')})
+
+    def test_query_count_does_not_depend_on_items(self):
+        # Première facture du mois : crée la ligne d'agrégats
+        create_invoice(self.user, self.header, self._items(1))
+        with CaptureQueriesContext(connection) as small:
+            create_invoice(self.user, {**self.header, 'invoice_number': 'FACT-002'}, self._items(1))
+        with CaptureQueriesContext(connection) as large:
+            create_invoice(self.user, {**self.header, 'invoice_number': 'FACT-003'}, self._items(200))
+        # 200 lignes : deux INSERT groupés sous SQLite (limite de 999 paramètres)
+        self.assertLessEqual(len(large), len(small) + 1)
+        self.assertEqual(InvoiceItem.objects.count(), 202)
+
+    def test_validation_errors(self):
+        create_invoice(self.user, self.header, self._items(1))
+        items = self._items(2)
+        items[1]['unit_price'] = 'abc'
+        with self.assertRaises(ValidationError) as raised:
+            create_invoice(self.user, {**self.header, 'to_name': ''}, items)
+        errors = raised.exception.message_dict
+        self.assertEqual(set(errors), {'to_name', 'invoice_number', 'items'})
+        self.assertIn('Ligne 2', errors['items'][0])
+        self.assertEqual(Invoice.objects.count(), 1)
+
+    def test_form_view_uses_service(self):
+        self.client.force_login(self.user)
+        data = {
+            **{name: value.isoformat() if isinstance(value, date) else value for name, value in self.header.items()},
+            'items-TOTAL_FORMS': 2, 'items-INITIAL_FORMS': 0,
+            'items-0-description': 'A', 'items-0-quantity': '1', 'items-0-unit_price': '10',
+            'items-1-description': 'B', 'items-1-quantity': '3', 'items-1-unit_price': '5',
+        }
+        response = self.client.post(reverse('CORE:generate_invoice'), data)
+        invoice = Invoice.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('CORE:invoice_detail', args=[invoice.id]), fetch_redirect_response=False)
+        self.assertEqual(invoice.total, Decimal('30.00'))
+        self.assertEqual(invoice.items.count(), 2)
+
+        response = self.client.post(reverse('CORE:generate_invoice'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'existe déjà')
+
+
+class PdfCacheTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(PDF_CACHE_DIR=Path(self.tmp.name), PDF_CACHE_MAX_BYTES=10 * 1024)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user('alice', password='secret')
+        self.invoice = make_invoice(self.user)
+        self.client.force_login(self.user)
+
+    def _download(self):
+        return self.client.get(reverse('CORE:invoice_download_pdf', args=[self.invoice.id]))
+
+    @mock.patch.object(pdf, 'WEASYPRINT_AVAILABLE', True)
+    @mock.patch.object(pdf, 'render_invoice_pdf', return_value=b'%PDF-1.7 test')
+    def test_cache_hit_skips_rendering(self, render):
+        first = self._download()
+        second = self._download()
+        self.assertEqual(b''.join(first.streaming_content), b'%PDF-1.7 test')
+        self.assertEqual(b''.join(second.streaming_content), b'%PDF-1.7 test')
+        self.assertEqual(render.call_count, 1)
+
+    @mock.patch.object(pdf, 'WEASYPRINT_AVAILABLE', True)
+    @mock.patch.object(pdf, 'render_invoice_pdf', return_value=b'%PDF-1.7 test')
+    def test_invoice_or_item_change_invalidates(self, render):
+        self._download()
+        # La clé est une empreinte du contenu : une modification change de clé,
+        # le nouveau rendu remplace l'ancien fichier
+        self.invoice.to_name = 'Autre client'
+        self.invoice.save()
+        self._download()
+        item = self.invoice.items.first()
+        item.description = 'Maintenance'
+        item.save()
+        self._download()
+        self.assertEqual(render.call_count, 3)
+        self.assertEqual(len(list(Path(self.tmp.name).glob('*.pdf'))), 1)
+        # Sans changement de contenu, un enregistrement ne coûte pas de rendu
+        item.save()
+        self._download()
+        self.assertEqual(render.call_count, 3)
+
+        self.invoice.delete()
+        self.assertEqual(list(Path(self.tmp.name).glob('*.pdf')), [])
+
+    def test_lru_eviction_respects_size_cap(self):
+        cache = pdf.PdfCache(max_bytes=3500)
+        paths = [cache.put(i, 'k', b'x' * 1000) for i in range(3)]
+        os.utime(paths[1], ns=(0, 0))
+        cache.put(3, 'k', b'x' * 1000)
+        remaining = sorted(p.name for p in Path(self.tmp.name).glob('*.pdf'))
+        self.assertEqual(remaining, ['0-k.pdf', '2-k.pdf', '3-k.pdf'])
+
+
+@override_settings(PDF_ASYNC_RENDERING=True)
+class AsyncPdfTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(PDF_CACHE_DIR=Path(self.tmp.name))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user('bob', password='secret')
+        self.invoice = make_invoice(self.user)
+        self.client.force_login(self.user)
+
+    def test_download_enqueues_single_job(self):
+        url = reverse('CORE:invoice_download_pdf', args=[self.invoice.id])
+        self.assertEqual(self.client.get(url).status_code, 202)
+        self.assertEqual(self.client.get(url).status_code, 202)
+        self.assertEqual(PdfRenderJob.objects.filter(invoice=self.invoice, status='pending').count(), 1)
+
+    def test_status_reports_done_once_rendered(self):
+        status_url = reverse('CORE:invoice_pdf_status', args=[self.invoice.id])
+        self.assertEqual(self.client.get(status_url).json()['status'], 'pending')
+        _, key = pdf.invoice_pdf_key(self.invoice)
+        pdf.PdfCache().put(self.invoice.id, key, b'%PDF-1.7 test')
+        self.assertEqual(self.client.get(status_url).json()['status'], 'done')
+        response = self.client.get(reverse('CORE:invoice_download_pdf', args=[self.invoice.id]))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.7 test')
+
+
+class InlinePool:
+    """Pool de rendu de test : exécute chaque rendu à la soumission"""
+
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.shutdowns = 0
+
+    def submit(self, fn, *args):
+        future = Future()
+        if self.broken:
+            # Comme un pool dont un processus enfant est mort
+            future.set_exception(BrokenProcessPool('processus de rendu arrêté'))
+            return future
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shutdowns += 1
+
+
+class PdfWorkerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bob')
+        self.ok = make_invoice(self.user, 'OK-1')
+        self.bad = make_invoice(self.user, 'KO-1')
+
+    def job(self, invoice, **fields):
+        return PdfRenderJob.objects.create(invoice=invoice, cache_key='k', **fields)
+
+    def render(self, invoice_id):
+        if invoice_id == self.bad.id:
+            raise RuntimeError('rendu impossible')
+        return f'/pdf/{invoice_id}.pdf'
+
+    def test_command_marks_jobs_done_or_failed(self):
+        done, failed = self.job(self.ok), self.job(self.bad)
+        with mock.patch.object(pdf_jobs, '_render_pool', return_value=InlinePool()), \
+                mock.patch.object(pdf_jobs, 'render_invoice_job', side_effect=self.render):
+            call_command('pdf_worker', processes=1, once=True, stdout=io.StringIO())
+        done.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual((done.status, done.error, done.attempts), ('done', '', 1))
+        self.assertIsNotNone(done.finished_at)
+        self.assertEqual((failed.status, failed.error), ('failed', 'rendu impossible'))
+
+    @override_settings(PDF_JOB_TIMEOUT=60)
+    def test_stale_running_job_is_requeued(self):
+        stale = self.job(self.ok, status='running', started_at=timezone.now() - timedelta(minutes=5))
+        recent = self.job(self.ok, status='running', started_at=timezone.now())
+        self.assertEqual(pdf_jobs.requeue_stale_jobs(), 1)
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((stale.status, stale.started_at), ('pending', None))
+        self.assertEqual(recent.status, 'running')
+
+    def test_broken_pool_requeues_jobs_and_is_rebuilt(self):
+        job = self.job(self.ok)
+        broken, healthy = InlinePool(broken=True), InlinePool()
+        with mock.patch.object(pdf_jobs, '_render_pool', side_effect=[broken, healthy]) as pool, \
+                mock.patch.object(pdf_jobs, 'render_invoice_job', side_effect=self.render):
+            pdf_jobs.run_worker(1, once=True)
+        job.refresh_from_db()
+        # Remis en attente après la panne du pool, puis rendu par le nouveau pool
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+        self.assertEqual(pool.call_count, 2)
+        self.assertEqual((broken.shutdowns, healthy.shutdowns), (1, 1))
+
+    def test_submit_on_broken_pool_requeues_claimed_jobs(self):
+        job = self.job(self.ok)
+        broken, healthy = mock.Mock(), InlinePool()
+        broken.submit.side_effect = BrokenProcessPool('processus de rendu arrêté')
+        with mock.patch.object(pdf_jobs, '_render_pool', side_effect=[broken, healthy]), \
+                mock.patch.object(pdf_jobs, 'render_invoice_job', side_effect=self.render):
+            pdf_jobs.run_worker(1, once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+        broken.shutdown.assert_called_once()
+
+
+class InvoiceExportZipTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(PDF_CACHE_DIR=Path(self.tmp.name))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user('carol', password='secret')
+        self.client.force_login(self.user)
+
+    def test_streams_cached_pdfs_matching_filters(self):
+        cache = pdf.PdfCache()
+        for number, day, status in [('A-1', 5, 'paid'), ('A-2', 20, 'paid'), ('A-3', 20, 'draft')]:
+            invoice = make_invoice(self.user, number, invoice_date=date(2025, 3, day), status=status)
+            _, key = pdf.invoice_pdf_key(invoice)
+            cache.put(invoice.id, key, f'%PDF {number}'.encode())
+
+        response = self.client.get(reverse('CORE:invoice_export_zip'), {
+            'date_from': '2025-03-10', 'date_to': '2025-03-31', 'status': 'paid',
+        })
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), ['facture_A-2.pdf'])
+        self.assertEqual(archive.read('facture_A-2.pdf'), b'%PDF A-2')
+
+    def test_parallel_rendering_is_bounded_ordered_and_propagates_errors(self):
+        invoices = [make_invoice(self.user, f'P-{i}') for i in range(6)]
+        submitted, shutdowns = [], []
+
+        class LazyFuture(Future):
+            # En cours jusqu'à ce que le résultat soit demandé
+            def __init__(self, fn, *args):
+                super().__init__()
+                self.call = (fn, args)
+
+            def result(self, timeout=None):
+                if not self.done():
+                    try:
+                        self.set_result(self.call[0](*self.call[1]))
+                    except Exception as e:
+                        self.set_exception(e)
+                return super().result(timeout)
+
+        class FakePool:
+            def submit(self, fn, *args):
+                submitted.append(args[0])
+                return LazyFuture(fn, *args)
+
+            def shutdown(self, cancel_futures=False):
+                shutdowns.append(cancel_futures)
+
+        def render(invoice_id):
+            if invoice_id == invoices[4].id:
+                raise RuntimeError('rendu impossible')
+            return f'/pdf/{invoice_id}.pdf'
+
+        with mock.patch.object(exports, '_render_pool', return_value=FakePool()) as pool, \
+                mock.patch.object(exports, 'render_invoice_job', side_effect=render):
+            results = exports.iter_invoice_pdfs(iter(invoices), workers=2)
+            first = next(results)
+            # Fenêtre bornée : 2 × workers rendus soumis avant le premier résultat
+            self.assertEqual(len(submitted), 4)
+            self.assertEqual(first, (invoices[0], f'/pdf/{invoices[0].id}.pdf'))
+            self.assertEqual([invoice for invoice, _ in [next(results) for _ in range(3)]], invoices[1:4])
+            with self.assertRaisesMessage(RuntimeError, 'rendu impossible'):
+                next(results)
+        pool.assert_called_once_with(2)
+        self.assertEqual(shutdowns, [True])
+
+
+class InvoiceBatchPdfTests(TestCase):
+    def test_renders_only_own_invoices_in_one_document(self):
+        user = User.objects.create_user('dave', password='secret')
+        other = User.objects.create_user('eve', password='secret')
+        own = [make_invoice(user, f'D-{i}') for i in range(3)]
+        foreign = make_invoice(other, 'E-1')
+        self.client.force_login(user)
+
+        with mock.patch('CORE.views.render_invoices_batch_pdf', return_value=b'%PDF batch') as render:
+            response = self.client.post(reverse('CORE:invoice_batch_pdf'), {
+                'invoice_ids': [own[0].id, own[2].id, foreign.id],
+            })
+        self.assertEqual(response.content, b'%PDF batch')
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual({invoice.id for invoice in render.call_args.args[0]}, {own[0].id, own[2].id})
+
+    @mock.patch.object(pdf, 'WEASYPRINT_AVAILABLE', True)
+    def test_benchmark_command(self):
+        with self.assertRaisesMessage(CommandError, 'Utilisateur inconnu: nobody'):
+            call_command('benchmark_pdf_batch', user='nobody', stdout=io.StringIO())
+
+        user = User.objects.create_user('dave')
+        for i in range(3):
+            make_invoice(user, f'D-{i}')
+        command = 'CORE.management.commands.benchmark_pdf_batch'
+        with mock.patch(f'{command}.InvoicePdfRenderer') as renderer_class, \
+                mock.patch(f'{command}.render_invoice_pdf') as shared, \
+                mock.patch(f'{command}.render_invoices_batch_pdf') as batch:
+            call_command('benchmark_pdf_batch', user='dave', repeat=1, stdout=io.StringIO())
+        # Référence « separate » : un moteur neuf par facture, sans le moteur partagé
+        self.assertEqual(renderer_class.call_count, 3)
+        self.assertEqual(shared.call_count, 3)
+        self.assertEqual(batch.call_count, 2)
+
+
+class InvoicePdfRendererTests(TestCase):
+    def test_stylesheet_parsed_once_until_file_changes(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.css', delete=False) as css:
+            css.write('body { color: black; }')
+        self.addCleanup(os.unlink, css.name)
+        with mock.patch.object(pdf, 'CSS', create=True) as css_class, \
+                mock.patch.object(pdf, 'FontConfiguration', create=True) as font_class:
+            renderer = pdf.InvoicePdfRenderer(css.name)
+            renderer.stylesheets()
+            renderer.stylesheets()
+            self.assertEqual(css_class.call_count, 1)
+            stat = os.stat(css.name)
+            os.utime(css.name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+            renderer.stylesheets()
+            self.assertEqual(css_class.call_count, 2)
+            self.assertEqual(font_class.call_count, 2)
+
+
+class PdfLoadingTests(TestCase):
+    def test_views_import_does_not_load_weasyprint(self):
+        # Processus neuf : les autres tests ont pu importer WeasyPrint dans celui-ci
+        code = ('import sys, django; django.setup(); import CORE.views; '
+                'print("weasyprint" in sys.modules)')
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                                env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'EasInvoice.settings'}, check=True)
+        self.assertEqual(result.stdout.strip(), 'False')
+
+    @mock.patch.object(pdf, 'HTML', None)
+    @mock.patch.object(pdf, 'WEASYPRINT_AVAILABLE', True)
+    def test_failed_load_is_seen_by_form(self):
+        user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(user)
+        self.assertTrue(self.client.get(reverse('CORE:generate_invoice')).context['weasyprint_available'])
+        # Paquet installé mais bibliothèques natives absentes
+        with mock.patch.dict(sys.modules, {'weasyprint': None}), self.assertLogs('CORE.pdf', 'WARNING'):
+            with self.assertRaises(pdf.PdfUnavailable):
+                pdf._load_weasyprint()
+        self.assertFalse(self.client.get(reverse('CORE:generate_invoice')).context['weasyprint_available'])
+
+    @mock.patch.object(pdf, '_renderer', None)
+    @mock.patch.object(pdf, '_load_weasyprint')
+    @mock.patch.object(pdf.InvoicePdfRenderer, 'write_pdf', return_value=b'%PDF-1.7 warmup')
+    def test_gunicorn_post_fork_warms_shared_renderer(self, write_pdf, load):
+        # django.setup() réappliquerait LOGGING au processus de test : déjà fait
+        with mock.patch.dict(os.environ, {'PDF_WARMUP': '1', 'GUNICORN_PRELOAD': ''}), \
+                mock.patch('django.setup') as setup:
+            config = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+            config['post_fork'](mock.Mock(), mock.Mock(pid=1234))
+        setup.assert_called_once()
+        load.assert_called()
+        self.assertIsInstance(pdf._renderer, pdf.InvoicePdfRenderer)
+        self.assertIs(pdf.get_renderer(), pdf._renderer)
+        write_pdf.assert_called_once()
+
+
+class RecomputeTotalsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+
+    def test_rounding_policy(self):
+        # TVA calculée sur le HT puis arrondie (et non HT x taux arrondi)
+        self.assertEqual(compute_totals(Decimal('10.10'), Decimal('5.5')),
+                         (Decimal('10.10'), Decimal('0.56'), Decimal('10.66')))
+        self.assertEqual(compute_totals(Decimal('10.10'), Decimal('20'), is_vat_exempt=True),
+                         (Decimal('10.10'), Decimal('0.00'), Decimal('10.10')))
+
+    def test_calculate_totals(self):
+        invoice = make_invoice(self.user, vat_rate=Decimal('5.5'))
+        InvoiceItem.objects.create(invoice=invoice, description='Vis', quantity=Decimal('3'), unit_price=Decimal('0.35'))
+        invoice.calculate_totals()
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.subtotal, invoice.vat_amount, invoice.total),
+                         (Decimal('101.05'), Decimal('5.56'), Decimal('106.61')))
+
+    def test_command_fixes_drifted_totals(self):
+        invoices = [make_invoice(self.user, f'FACT-{i:03}') for i in range(5)]
+        Invoice.objects.filter(id__in=[invoices[1].id, invoices[3].id]).update(total=Decimal('999.99'))
+
+        out = io.StringIO()
+        call_command('recompute_totals', '--dry-run', stdout=out)
+        self.assertEqual(Invoice.objects.filter(total=Decimal('999.99')).count(), 2)
+        self.assertIn('2 à corriger', out.getvalue())
+
+        out = io.StringIO()
+        call_command('recompute_totals', '--chunk-size', '2', stdout=out)
+        self.assertFalse(Invoice.objects.exclude(total=Decimal('120.00')).exists())
+        self.assertIn('FACT-001', out.getvalue())
+        self.assertIn('FACT-003', out.getvalue())
+        self.assertIn('5 factures traitées, 2 corrigée(s)', out.getvalue())
+        self.assertEqual(stats.find_drift(), [])
+
+
+class MarkOverdueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.late = [make_invoice(self.user, f'LATE-{i}', status='sent', due_date=date(2025, 2, 1)) for i in range(3)]
+        self.not_due = make_invoice(self.user, 'SENT', status='sent', due_date=date(2025, 3, 1))
+        self.paid = make_invoice(self.user, 'PAID', status='paid', due_date=date(2025, 2, 1))
+
+    def test_marks_sent_invoices_past_due(self):
+        self.assertEqual(mark_overdue(today=date(2025, 2, 15), chunk_size=2), 3)
+        statuses = dict(Invoice.objects.values_list('invoice_number', 'status'))
+        self.assertEqual(statuses, {'LATE-0': 'overdue', 'LATE-1': 'overdue', 'LATE-2': 'overdue',
+                                    'SENT': 'sent', 'PAID': 'paid'})
+        self.assertEqual(stats.dashboard_stats(self.user)['overdue_invoices'], 3)
+        self.assertEqual(stats.find_drift(), [])
+
+    def test_idempotent_command(self):
+        out = io.StringIO()
+        call_command('mark_overdue', '--date', '2025-02-15', stdout=out)
+        self.assertIn('3 facture(s)', out.getvalue())
+        out = io.StringIO()
+        call_command('mark_overdue', '--date', '2025-02-15', stdout=out)
+        self.assertIn('0 facture(s)', out.getvalue())
+
+
+class InvoiceImportTests(TestCase):
+    csv_data = (
+        "invoice_number,invoice_date,due_date,status,to_name,to_address,vat_rate,description,quantity,unit_price\n"
+        "H-1,2024-03-01,2024-04-01,paid,ACME,1 rue A,20,Audit,2,100\n"
+        "H-1,2024-03-01,2024-04-01,paid,ACME,1 rue A,20,Frais,1,10.50\n"
+        "H-2,2024-13-01,,sent,ACME,1 rue A,20,Audit,1,100\n"
+        "H-3,2024-03-05,,sent,Globex,,5.5,Conseil,3,0.35\n"
+        "EXIST,2024-03-05,,sent,Globex,,20,Conseil,1,1\n"
+    )
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        make_invoice(self.user, 'EXIST')
+
+    def test_csv_import(self):
+        report = import_invoices(self.user, io.StringIO(self.csv_data), 'csv', chunk_size=2)
+        self.assertEqual((report.invoices, report.items, report.clients), (2, 3, 2))
+        self.assertEqual([(line, number) for line, number, _ in report.errors], [(4, 'H-2'), (6, 'EXIST')])
+
+        h1 = Invoice.objects.get(invoice_number='H-1')
+        self.assertEqual((h1.subtotal, h1.vat_amount, h1.total), (Decimal('210.50'), Decimal('42.10'), Decimal('252.60')))
+        self.assertEqual(list(h1.items.values_list('description', flat=True)), ['Audit', 'Frais'])
+        self.assertEqual(h1.client.name, 'ACME')
+        h3 = Invoice.objects.get(invoice_number='H-3')
+        self.assertEqual(h3.due_date, date(2024, 3, 5))
+        self.assertEqual(h3.total, Decimal('1.11'))
+        self.assertEqual(stats.find_drift(), [])
+
+    def test_upload_jsonl_dry_run(self):
+        self.client.force_login(self.user)
+        lines = [
+            '{"invoice_number": "J-1", "invoice_date": "2024-05-01", "to_name": "ACME", '
+            '"items": [{"description": "Audit", "quantity": 1.5, "unit_price": 80}]}',
+            '{"invoice_number": "J-2", "invoice_date": "2024-05-02", "to_name": "ACME", "items": []}',
+            'pas du json',
+        ]
+        upload = io.BytesIO('\n'.join(lines).encode('utf-8'))
+        upload.name = 'factures.jsonl'
+        response = self.client.post(reverse('CORE:invoice_import'), {'file': upload, 'dry_run': 'on'})
+        self.assertContains(response, '1 facture(s) importable(s)')
+        self.assertContains(response, 'aucune ligne de facture')
+        self.assertContains(response, 'JSON invalide')
+        self.assertFalse(Invoice.objects.filter(invoice_number='J-1').exists())
+        self.assertFalse(Client.objects.exists())
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write(self.csv_data)
+        self.addCleanup(os.unlink, handle.name)
+        out = io.StringIO()
+        call_command('import_invoices', handle.name, '--user', 'alice', stdout=out)
+        self.assertIn('2 facture(s) importées', out.getvalue())
+        self.assertIn('ligne 4 H-2', out.getvalue())
+        self.assertEqual(Invoice.objects.filter(user=self.user).count(), 3)
+
+
+class LedgerExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        first = make_invoice(self.user, 'FACT-001', status='paid', invoice_date=date(2025, 1, 10))
+        InvoiceItem.objects.create(invoice=first, description='Déplacement, "Paris"', quantity=2, unit_price=Decimal('15.00'))
+        make_invoice(self.user, 'FACT-002', status='sent', invoice_date=date(2025, 2, 10))
+        make_invoice(User.objects.create_user('bob'), 'BOB-001')
+
+    def _export(self, **params):
+        return self.client.get(reverse('CORE:invoice_export_ledger'), params)
+
+    def test_csv_streams_header_before_query(self):
+        response = self._export(format='csv')
+        self.assertTrue(response.streaming)
+        chunks = iter(response.streaming_content)
+        with CaptureQueriesContext(connection) as queries:
+            header = next(chunks)
+        self.assertEqual(len(queries), 0)
+        self.assertTrue(header.startswith('\ufeffinvoice_number,invoice_date'.encode('utf-8')))
+
+        content = (header + b''.join(chunks)).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual([(row[0], row[13]) for row in rows[1:]],
+                         [('FACT-002', 'Prestation'), ('FACT-001', 'Prestation'), ('FACT-001', 'Déplacement, "Paris"')])
+
+    def test_filters_and_reimport(self):
+        response = self._export(format='csv', status='paid')
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertEqual(content.count('FACT-'), 2)
+        report = import_invoices(User.objects.get(username='bob'), io.StringIO(content), 'csv')
+        self.assertEqual((report.invoices, report.items, report.error_count), (1, 2, 0))
+
+    def test_xlsx(self):
+        response = self._export(format='xlsx', date_from='2025-01-01', date_to='2025-01-31')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = sheet.findall('s:sheetData/s:row', namespace)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1].find('s:c/s:is/s:t', namespace).text, 'FACT-001')
+        self.assertIn('xl/styles.xml', archive.namelist())
+
+    def test_unknown_format(self):
+        self.assertEqual(self._export(format='pdf').status_code, 400)
+
+    def test_command_filters_like_the_web_export(self):
+        customer = Client.objects.create(user=self.user, name='Durand')
+        Invoice.objects.filter(invoice_number='FACT-002').update(client=customer)
+        web = b''.join(self._export(format='csv', client=customer.id).streaming_content)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'ledger.csv'
+            call_command('export_ledger', str(output), user='alice', client=str(customer.id), stdout=io.StringIO())
+            self.assertEqual(output.read_bytes(), web)
+        self.assertIn(b'FACT-002', web)
+        self.assertNotIn(b'FACT-001', web)
+        with self.assertRaises(CommandError):
+            call_command('export_ledger', 'ledger.csv', client='abc', stdout=io.StringIO())
+
+
+class InvoiceSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.other = User.objects.create_user('bob')
+        self.by_number = make_invoice(self.user, 'ELEC-001', to_name='Durand')
+        self.by_client = make_invoice(self.user, 'FACT-002', to_name='Électricité Martin', to_address='3 rue Haute')
+        self.by_item = make_invoice(self.user, 'FACT-003')
+        InvoiceItem.objects.create(invoice=self.by_item, description='Installation électrique', unit_price=Decimal('50'))
+        make_invoice(self.other, 'ELEC-900', to_name='Électricité Bob')
+
+    def _numbers(self, query, user=None):
+        invoices, _ = search.search_invoices(user or self.user, query)
+        return [invoice.invoice_number for invoice in invoices]
+
+    def test_ranked_prefix_accent_insensitive(self):
+        self.assertEqual(self._numbers('elec'), ['ELEC-001', 'FACT-002', 'FACT-003'])
+        self.assertEqual(self._numbers('ELECTRICITE martin'), ['FACT-002'])
+        self.assertEqual(self._numbers('elec', self.other), ['ELEC-900'])
+
+    def test_index_follows_writes(self):
+        item = self.by_item.items.get(description='Installation électrique')
+        item.description = 'Plomberie'
+        item.save()
+        self.assertEqual(self._numbers('plomb'), ['FACT-003'])
+        self.assertNotIn('FACT-003', self._numbers('installation'))
+
+        self.by_client.notes = 'relance téléphonique'
+        self.by_client.save()
+        self.assertEqual(self._numbers('telephonique'), ['FACT-002'])
+
+        # Champ non indexé : l'index n'est pas touché
+        self.by_client.status = 'paid'
+        with CaptureQueriesContext(connection) as queries:
+            self.by_client.save()
+        self.assertFalse([q for q in queries.captured_queries if search.SEARCH_TABLE in q['sql']])
+
+        self.by_client.delete()
+        self.assertEqual(self._numbers('martin'), [])
+
+        invoice = create_invoice(self.user, {**CreateInvoiceTests.header, 'invoice_number': 'NEW-1'},
+                                 [{'description': 'Menuiserie', 'quantity': 1, 'unit_price': 10}])
+        self.assertEqual(self._numbers('menuiserie'), [invoice.invoice_number])
+
+    def test_user_input_is_not_fts_syntax(self):
+        self.assertEqual(self._numbers('"elec OR owner:u*'), [])
+        self.assertEqual(self._numbers('***'), [])
+
+    def test_rebuild_and_view(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.SEARCH_TABLE}")
+        self.assertEqual(self._numbers('elec'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(len(self._numbers('elec')), 3)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('CORE:invoice_search'), {'q': 'martin'})
+        self.assertContains(response, 'FACT-002')
+        self.assertNotContains(response, 'ELEC-900')
+
+
+class ClientSuggestionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.other = User.objects.create_user('bob')
+        for name in ['Électricité Martin', 'Elegance SARL', 'Durand']:
+            Client.objects.create(user=self.user, name=name, address='1 rue Haute', city='Lyon')
+        Client.objects.create(user=self.other, name='Electro Bob', address='-')
+        self.client.force_login(self.user)
+
+    def _suggest(self, query):
+        return self.client.get(reverse('CORE:client_suggestions'), {'to_name': query}).content.decode()
+
+    def test_prefix_is_case_and_accent_insensitive(self):
+        names = [client.name for client in search.suggest_clients(self.user, '  ELE')]
+        self.assertEqual(names, ['Électricité Martin', 'Elegance SARL'])
+        self.assertEqual(search.suggest_clients(self.user, ''), [])
+        html = self._suggest('elec')
+        self.assertIn('Électricité Martin', html)
+        self.assertNotIn('Electro Bob', html)
+
+    def test_fragment_cache_invalidated_by_writes(self):
+        self.assertNotIn('Électro', self._suggest('elec'))
+        with CaptureQueriesContext(connection) as queries:
+            self._suggest('elec')
+        self.assertFalse([q for q in queries.captured_queries if 'CORE_client' in q['sql']])
+
+        Client.objects.create(user=self.user, name='Électro Services', address='-')
+        self.assertIn('Électro Services', self._suggest('elec'))
+
+        import_invoices(self.user, io.StringIO(
+            'invoice_number,invoice_date,due_date,to_name,to_address,description,quantity,unit_price\n'
+            'IMP-1,2025-01-15,2025-02-15,Electrolux,-,Ligne,1,10\n'), 'csv')
+        self.assertIn('Electrolux', self._suggest('elec'))
+
+    def test_invoice_is_linked_to_client(self):
+        client = Client.objects.get(name='Durand')
+        invoice = create_invoice(self.user, {**CreateInvoiceTests.header, 'client_id': client.id}, [])
+        self.assertEqual(invoice.client, client)
+
+        foreign = Client.objects.get(user=self.other)
+        with self.assertRaises(ValidationError) as raised:
+            create_invoice(self.user, {**CreateInvoiceTests.header, 'invoice_number': 'F-2', 'client_id': foreign.id}, [])
+        self.assertEqual(set(raised.exception.message_dict), {'client_id'})
+
+
+class CatalogTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.other = User.objects.create_user('bob')
+        for description, price in [('Heure de conseil', '12.50'), ('Hébergement annuel', '0.05'), ('Audit', '99.99')]:
+            CatalogItem.objects.create(user=self.user, description=description, unit_price=Decimal(price))
+        CatalogItem.objects.create(user=self.other, description='Heure de bob', unit_price=Decimal('1'))
+        self.client.force_login(self.user)
+
+    def _suggest(self, query):
+        response = self.client.get(reverse('CORE:catalog_suggestions'), {'items-3-description': query})
+        return response.content.decode()
+
+    def _prices(self):
+        return dict(CatalogItem.objects.filter(user=self.user).values_list('description', 'unit_price'))
+
+    def test_suggestions(self):
+        html = self._suggest('he')
+        self.assertIn('Heure de conseil', html)
+        self.assertIn('data-unit-price="12.50"', html)
+        self.assertIn('Hébergement annuel', html)
+        self.assertNotIn('Heure de bob', html)
+        self.assertNotIn('Audit', html)
+
+        CatalogItem.objects.create(user=self.user, description='Heure supplémentaire', unit_price=Decimal('15'))
+        self.assertIn('Heure supplémentaire', self._suggest('he'))
+
+    def test_pages(self):
+        response = self.client.post(reverse('CORE:catalog_create'), {'description': 'Forfait', 'unit_price': '80'})
+        self.assertRedirects(response, reverse('CORE:catalog_list'))
+        response = self.client.get(reverse('CORE:catalog_list'))
+        self.assertContains(response, 'Forfait')
+        self.assertNotContains(response, 'Heure de bob')
+
+    def test_reprice_is_one_update_with_money_rounding(self):
+        self.assertIn('12.50', self._suggest('heure'))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(reprice_catalog(self.user, Decimal('3')), 3)
+        self.assertEqual(len([q for q in queries.captured_queries if q['sql'].startswith('UPDATE')]), 1)
+        # 12.875 -> 12.88, 0.0515 -> 0.05, 102.9897 -> 102.99 : arrondi de quantize_money
+        self.assertEqual(self._prices(), {
+            'Heure de conseil': Decimal('12.88'), 'Hébergement annuel': Decimal('0.05'), 'Audit': Decimal('102.99')})
+        self.assertEqual(CatalogItem.objects.get(user=self.other).unit_price, Decimal('1'))
+
+        self.assertIn('12.88', self._suggest('heure'))  # le fragment en cache a été invalidé
+        self.client.post(reverse('CORE:catalog_reprice'), {'percent': '-10', 'prefix': 'heb'})
+        self.assertEqual(self._prices()['Hébergement annuel'], Decimal('0.05'))
+        self.assertEqual(self._prices()['Heure de conseil'], Decimal('12.88'))
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='secret')
+        self.invoice = make_invoice(self.user)
+        self.client.force_login(self.user)
+
+    def _get(self, url_name, *args):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name, args=args))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode(), [q['sql'] for q in queries.captured_queries if 'CORE_invoiceitem' in q['sql']]
+
+    def test_detail_fragments(self):
+        html, item_queries = self._get('CORE:invoice_detail', self.invoice.id)
+        self.assertIn('Prestation', html)
+        self.assertTrue(item_queries)
+        html, item_queries = self._get('CORE:invoice_detail', self.invoice.id)
+        self.assertIn('Prestation', html)
+        self.assertEqual(item_queries, [])
+
+        # Changement de statut : corps re-rendu, lignes servies depuis le cache
+        self.invoice.status = 'paid'
+        self.invoice.save()
+        html, item_queries = self._get('CORE:invoice_detail', self.invoice.id)
+        self.assertIn('Payée', html)
+        self.assertEqual(item_queries, [])
+
+        # Une ligne modifiée ne touche pas updated_at : le compteur de génération invalide
+        item = self.invoice.items.get()
+        item.description = 'Maintenance'
+        item.save()
+        html, _ = self._get('CORE:invoice_detail', self.invoice.id)
+        self.assertIn('Maintenance', html)
+
+    def test_rows_follow_updated_at(self):
+        for url_name in ['CORE:invoice_list', 'CORE:dashboard']:
+            self.assertRegex(self._get(url_name)[0], r'badge[^>]*>\s*Brouillon')
+        self.invoice.status = 'sent'
+        self.invoice.save()
+        for url_name in ['CORE:invoice_list', 'CORE:dashboard']:
+            self.assertRegex(self._get(url_name)[0], r'badge[^>]*>\s*Envoyée')
+        # UPDATE en masse : updated_at est mis à jour avec le statut
+        mark_overdue(today=date(2025, 3, 1))
+        for url_name in ['CORE:invoice_list', 'CORE:dashboard']:
+            self.assertRegex(self._get(url_name)[0], r'badge[^>]*>\s*En retard')
+
+    def test_generation_is_shared_between_processes(self):
+        # Deux instances du cache fichier sur le même répertoire : deux workers gunicorn
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        worker_a, worker_b = FileBasedCache(tmp.name, {}), FileBasedCache(tmp.name, {})
+        with mock.patch.object(caching, 'cache', worker_a):
+            key = caching.fragment_key('clients', self.user.pk, 'Cli')
+        with mock.patch.object(caching, 'cache', worker_b):
+            self.assertEqual(caching.fragment_key('clients', self.user.pk, 'Cli'), key)
+            caching.bump('clients', self.user.pk)
+        with mock.patch.object(caching, 'cache', worker_a):
+            self.assertNotEqual(caching.fragment_key('clients', self.user.pk, 'Cli'), key)
+
+
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        make_invoice(self.user)
+        self.client.force_login(self.user)
+
+    def test_header_and_log_line(self):
+        with self.assertLogs('CORE.timing', 'INFO') as logs:
+            response = self.client.get(reverse('CORE:invoice_list'))
+        header = response['Server-Timing']
+        self.assertRegex(header, r'^sql;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['view'], 'CORE:invoice_list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['sql_count'], 0)
+        self.assertEqual(logs.records[-1].levelname, 'INFO')
+
+    @override_settings(SLOW_REQUEST_MS=0, SLOW_QUERY_MS=0)
+    def test_slow_request_details(self):
+        with self.assertLogs('CORE.timing', 'WARNING') as logs:
+            self.client.get(reverse('CORE:invoice_list'))
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertTrue(record['slow'])
+        self.assertTrue(any('CORE_invoice' in query['sql'] for query in record['top_queries']))
+        self.assertTrue(any(line.startswith('CORE/views.py') for query in record['slow_queries']
+                            for line in query['stack']))
+
+    def test_measure_outside_request_is_noop(self):
+        with timing.measure('pdf'):
+            pass
+        metrics = timing.RequestMetrics()
+        token = timing.activate(metrics)
+        try:
+            with timing.measure('pdf'), timing.measure('pdf'):
+                pass
+        finally:
+            timing.deactivate(token)
+        self.assertIn('pdf;dur=', metrics.server_timing(0.01))
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('frank', password='secret')
+        self.client.force_login(self.user)
+
+    def _dashboard_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('CORE:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_independent_of_invoice_count(self):
+        make_invoice(self.user, 'F-0', status='paid')
+        _, baseline = self._dashboard_queries()
+        for i in range(1, 40):
+            make_invoice(self.user, f'F-{i}', status=['paid', 'sent', 'overdue', 'draft'][i % 4])
+        _, queries = self._dashboard_queries()
+        self.assertEqual(queries, baseline)
+
+    def test_totals_use_decimals(self):
+        make_invoice(self.user, 'F-1', status='paid', total=Decimal('10.10'))
+        make_invoice(self.user, 'F-2', status='paid', total=Decimal('0.20'))
+        make_invoice(self.user, 'F-3', status='sent', total=Decimal('5.05'))
+        make_invoice(self.user, 'F-4', status='overdue', total=Decimal('1.00'))
+        make_invoice(self.user, 'F-5', status='cancelled', total=Decimal('99.00'))
+        response, _ = self._dashboard_queries()
+        context = response.context
+        self.assertEqual(context['total_invoices'], 5)
+        self.assertEqual(context['paid_invoices'], 2)
+        self.assertEqual(context['pending_invoices'], 1)
+        self.assertEqual(context['overdue_invoices'], 1)
+        self.assertEqual(context['total_revenue'], Decimal('10.30'))
+        self.assertEqual(context['pending_amount'], Decimal('6.05'))
+        self.assertIsInstance(context['total_revenue'], Decimal)
+
+
+class InvoiceStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('grace', password='secret')
+
+    def test_rollup_follows_invoice_lifecycle(self):
+        invoice = make_invoice(self.user, 'G-1', status='sent', total=Decimal('50.00'))
+        make_invoice(self.user, 'G-2', status='paid', total=Decimal('20.00'), invoice_date=date(2025, 2, 3))
+        self.assertEqual(stats.find_drift(), [])
+
+        invoice.status = 'paid'
+        invoice.save()
+        self.assertEqual(stats.find_drift(), [])
+        invoice.total = Decimal('55.00')
+        invoice.invoice_date = date(2025, 3, 1)
+        invoice.save()
+        self.assertEqual(stats.find_drift(), [])
+        self.assertEqual(stats.dashboard_stats(self.user)['total_revenue'], Decimal('75.00'))
+
+        invoice.delete()
+        self.assertEqual(stats.find_drift(), [])
+        self.assertEqual(stats.dashboard_stats(self.user)['paid_invoices'], 1)
+
+    def test_rebuild_command_fixes_drift(self):
+        make_invoice(self.user, 'G-1', status='paid')
+        Invoice.objects.update(total=Decimal('999.00'))
+        with self.assertRaises(CommandError):
+            call_command('rebuild_invoice_stats', '--check', stdout=io.StringIO())
+        call_command('rebuild_invoice_stats', stdout=io.StringIO())
+        call_command('rebuild_invoice_stats', '--check', stdout=io.StringIO())
+        self.assertEqual(stats.dashboard_stats(self.user)['total_revenue'], Decimal('999.00'))
+
+
+@override_settings(INVOICE_LIST_PAGE_SIZE=3)
+class InvoiceListPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('heidi', password='secret')
+        self.client.force_login(self.user)
+
+    def _walk(self, params=None):
+        response = self.client.get(reverse('CORE:invoice_list'), params or {})
+        seen = [invoice.id for invoice in response.context['invoices']]
+        more_url = response.context['more_url']
+        while more_url:
+            response = self.client.get(more_url)
+            self.assertTemplateUsed(response, 'CORE/_invoice_rows.html')
+            seen += [invoice.id for invoice in response.context['invoices']]
+            more_url = response.context['more_url']
+        return seen
+
+    def test_cursor_walks_every_invoice_once_in_order(self):
+        # Même date d'émission pour toutes : l'ordre repose sur created_at puis id
+        for i in range(8):
+            make_invoice(self.user, f'H-{i}', invoice_date=date(2025, 4, 1 + i % 2))
+        expected = list(Invoice.objects.filter(user=self.user)
+                        .order_by('-invoice_date', '-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self._walk(), expected)
+
+    def test_filters_are_kept_across_pages(self):
+        for i in range(7):
+            make_invoice(self.user, f'H-{i}', status='paid' if i % 2 else 'sent', total=Decimal(10 * i))
+        seen = self._walk({'status': 'sent', 'amount_min': '10'})
+        expected = set(Invoice.objects.filter(status='sent', total__gte=10).values_list('id', flat=True))
+        self.assertEqual(len(seen), len(expected))
+        self.assertEqual(set(seen), expected)
+
+
+class SqliteProfileTests(TestCase):
+    def test_connections_open_with_wal_pragmas_and_immediate_transactions(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        database = connections['default']
+        wrapper = database.__class__({**database.settings_dict, 'NAME': str(Path(tmp.name) / 'db.sqlite3')}, 'profile')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            pragmas = {name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                       for name in ('journal_mode', 'synchronous', 'cache_size', 'busy_timeout', 'temp_store')}
+        self.assertEqual(pragmas, {
+            'journal_mode': 'wal', 'synchronous': 1, 'cache_size': settings.SQLITE_PRAGMAS['cache_size'],
+            'busy_timeout': int(settings.DATABASES['default']['OPTIONS']['timeout'] * 1000), 'temp_store': 2,
+        })
+        self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+        self.assertGreater(settings.DATABASES['default']['CONN_MAX_AGE'], 0)
+
+
+class RecordingReplicaRouter(replica.PrimaryReplicaRouter):
+    """Relève les décisions du routeur mais lit toujours la base de test unique"""
+    reads = []
+
+    def db_for_read(self, model, **hints):
+        self.reads.append((model._meta.label, super().db_for_read(model, **hints)))
+        return 'default'
+
+
+@override_settings(DATABASE_ROUTERS=['CORE.tests.RecordingReplicaRouter'], REPLICA_PIN_SECONDS=15)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        # Le middleware ne se charge que si une réplique est configurée
+        patcher = mock.patch.object(replica, 'is_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('alice', password='secret')
+        self.invoice = make_invoice(self.user)
+        self.client.force_login(self.user)
+        RecordingReplicaRouter.reads = []
+
+    def reads(self, label):
+        return {alias for model, alias in RecordingReplicaRouter.reads if model == label}
+
+    def test_read_views_use_replica_except_accounts(self):
+        response = self.client.get(reverse('CORE:invoice_detail', args=[self.invoice.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.reads('CORE.Invoice'), {'replica'})
+        self.assertEqual(self.reads('auth.User'), {'default'})
+        self.assertNotIn(replica.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_streamed_export_reads_replica_while_streaming(self):
+        response = self.client.get(reverse('CORE:invoice_export_ledger'), {'format': 'csv'})
+        RecordingReplicaRouter.reads = []
+        b''.join(response.streaming_content)
+        self.assertEqual(self.reads('CORE.Invoice'), {'replica'})
+
+    def test_write_pins_user_to_primary(self):
+        response = self.client.post(reverse('CORE:generate_invoice'),
+                                    benchmarks.invoice_form_data('FACT-REPLICA', 1))
+        self.assertEqual(response.status_code, 302)
+        pin = response.cookies[replica.REPLICA_PIN_COOKIE]
+        self.assertEqual(pin['max-age'], 15)
+
+        RecordingReplicaRouter.reads = []
+        self.client.get(response['Location'])
+        self.assertEqual(self.reads('CORE.Invoice'), {'default'})
+
+    def test_other_views_and_writes_stay_on_primary(self):
+        self.client.get(reverse('CORE:client_suggestions'), {'q': 'Cli'})
+        self.assertEqual({alias for _, alias in RecordingReplicaRouter.reads}, {'default'})
+
+        router = replica.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Invoice), 'default')
+        with replica.use_replica():
+            self.assertEqual(router.db_for_read(PdfRenderJob), 'default')
+            self.assertEqual(router.db_for_read(Invoice), 'replica')
+            self.assertEqual(router.db_for_write(Invoice), 'default')
+            # Lire ses écritures : la suite du bloc lit la base principale
+            self.assertEqual(router.db_for_read(Invoice), 'default')
+        self.assertFalse(router.allow_migrate(replica.REPLICA_ALIAS, 'CORE'))
+
+    def test_sync_copies_primary_into_open_replica(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        primary_path, replica_path = Path(tmp.name) / 'primary.sqlite3', Path(tmp.name) / 'replica.sqlite3'
+        with closing(sqlite3.connect(primary_path)) as primary:
+            primary.execute('PRAGMA journal_mode=WAL')
+            primary.execute('CREATE TABLE invoice (number TEXT)')
+            primary.execute("INSERT INTO invoice VALUES ('F-1')")
+            primary.commit()
+            replica.sync(primary_path, replica_path)
+            # Connexion persistante ouverte sur la réplique, comme CONN_MAX_AGE
+            with closing(sqlite3.connect(replica_path)) as reader:
+                self.assertEqual(reader.execute('SELECT count(*) FROM invoice').fetchone(), (1,))
+                primary.execute("INSERT INTO invoice VALUES ('F-2')")
+                primary.commit()
+                replica.sync(primary_path, replica_path)
+                self.assertEqual(reader.execute('SELECT count(*) FROM invoice').fetchone(), (2,))
+
+
+class QueryPlanTests(TestCase):
+    """Les requêtes des vues doivent passer par un index, jamais par un parcours complet de table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'plan{i}') for i in range(3)]
+        for user in cls.users:
+            clients = Client.objects.bulk_create(
+                Client(user=user, name=f'Client {i}', name_normalized=f'client {i}', address='-') for i in range(20))
+            invoices = Invoice.objects.bulk_create(
+                Invoice(user=user, client=clients[i % 20], from_name='-', from_address='-', to_name='-',
+                        to_address='-', invoice_number=f'P-{i}', invoice_date=date(2024, 1 + i % 12, 1 + i % 28),
+                        due_date=date(2025, 1, 1), status=['draft', 'sent', 'paid', 'overdue'][i % 4],
+                        total=Decimal(i))
+                for i in range(300))
+            InvoiceItem.objects.bulk_create(
+                InvoiceItem(invoice=invoice, description='-', unit_price=1, order=n)
+                for invoice in invoices for n in range(3))
+        stats.rebuild()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def hot_queries(self):
+        user = self.users[1]
+        invoice = Invoice.objects.filter(user=user).first()
+        invoices = Invoice.objects.filter(user=user)
+        cursor = encode_cursor(invoices.order_by(*INVOICE_ORDERING)[50])
+        return {
+            'dashboard: dernières factures': invoices.order_by('-created_at')[:10],
+            'dashboard: agrégats': InvoiceStats.objects.filter(user=user).values('status').annotate(n=Sum('invoice_count')),
+            'invoice_list: première page': invoices.order_by(*INVOICE_ORDERING)[:51],
+            'invoice_list: page suivante': keyset_queryset(invoices, cursor)[:51],
+            'invoice_list: filtre statut': invoices.filter(status='paid').order_by(*INVOICE_ORDERING)[:51],
+            'invoice_list: filtre client': invoices.filter(client=invoice.client_id).order_by(*INVOICE_ORDERING)[:51],
+            'invoice_list: filtre période': invoices.filter(
+                invoice_date__gte=date(2024, 3, 1), invoice_date__lte=date(2024, 5, 31)).order_by(*INVOICE_ORDERING)[:51],
+            'invoice_detail': Invoice.objects.filter(id=invoice.id, user=user),
+            'invoice_detail: lignes': invoice.items.all(),
+            'client_list': Client.objects.filter(user=user),
+            'client_suggestions': Client.objects.filter(
+                user=user, name_normalized__gte='client 1', name_normalized__lt='client 1\U0010ffff',
+            ).order_by('name_normalized', 'id')[:8],
+            'catalog_suggestions': CatalogItem.objects.filter(
+                user=user, description_normalized__gte='heure', description_normalized__lt='heure\U0010ffff',
+            ).order_by('description_normalized', 'id')[:8],
+            'pdf: jobs de la facture': PdfRenderJob.objects.filter(invoice=invoice, cache_key='x'),
+            'mark_overdue: factures échues': Invoice.objects.filter(
+                status='sent', due_date__lt=date(2024, 6, 1)).order_by().values_list('id')[:1000],
+        }
+
+    def test_hot_queries_use_indexes(self):
+        failures = []
+        for name, queryset in self.hot_queries().items():
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = [row[-1] for row in cursor.fetchall()]
+            scans = [step for step in plan if re.match(r'SCAN (?!.*USING (COVERING )?INDEX)', step)]
+            if scans:
+                failures.append(f"{name}: {' / '.join(plan)}")
+        self.assertEqual(failures, [], '\n' + '\n'.join(failures))
+
+
+@mock.patch.object(pdf, 'WEASYPRINT_AVAILABLE', True)
+@mock.patch.object(pdf, 'render_invoice_pdf', return_value=b'%PDF-1.7 budget')
+@mock.patch('CORE.views.render_invoices_batch_pdf', return_value=b'%PDF-1.7 budget')
+class QueryBudgetTests(TestCase):
+    """
+    Nombre maximal de requêtes SQL par URL, sur des données réalistes et cache
+    vide. Toute URL de CORE/urls.py doit avoir un budget ; un dépassement ou
+    une requête répétée (N+1) affiche les formes de requêtes en cause.
+    """
+    BUDGETS = {
+        'home': 2,
+        'contact_submit': 1,
+        'register': 2,
+        'login': 2,
+        'logout': 4,
+        'dashboard': 4,
+        'generate_invoice': 3,
+        'invoice_list': 3,
+        'invoice_search': 4,
+        'invoice_list_more': 3,
+        'invoice_batch_pdf': 4,
+        'invoice_export_zip': 4,
+        'invoice_export_ledger': 3,
+        'invoice_import': 2,
+        'invoice_detail': 4,
+        'invoice_download_pdf': 4,
+        'invoice_pdf_status': 4,
+        # statistiques mensuelles et index plein texte mis à jour par les signaux
+        'invoice_update_status': 13,
+        'invoice_delete': 3,
+        'add_item_row': 0,
+        'client_list': 3,
+        'client_create': 2,
+        'client_suggestions': 3,
+        'catalog_list': 3,
+        'catalog_create': 2,
+        'catalog_reprice': 3,
+        'catalog_suggestions': 3,
+        'profile_edit': 3,
+        'privacy_policy': 0,
+    }
+    ADMIN_CHANGELIST_BUDGET = 6
+    REPEAT_THRESHOLD = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budget', password='secret')
+        UserProfile.objects.create(user=cls.user, company_name='Budget SARL')
+        cls.admin = User.objects.create_superuser('root', password='secret')
+        clients = [Client.objects.create(user=cls.user, name=f'Client {i}', address='1 rue', city='Lyon')
+                   for i in range(30)]
+        for i in range(60):
+            create_invoice(cls.user, {
+                **CreateInvoiceTests.header, 'invoice_number': f'BUD-{i:03}', 'client_id': clients[i % 30].id,
+                'to_name': clients[i % 30].name, 'invoice_date': date(2025, 1 + i % 12, 1 + i % 28),
+            }, [{'description': f'Prestation {n}', 'quantity': 1 + n, 'unit_price': Decimal('12.50')} for n in range(5)],
+                status=['draft', 'sent', 'paid', 'overdue'][i % 4])
+        CatalogItem.objects.bulk_create(
+            CatalogItem(user=cls.user, description=f'Article {i}', description_normalized=f'article {i}',
+                        unit_price=Decimal(i)) for i in range(20))
+        cls.invoice = Invoice.objects.filter(user=cls.user).order_by('id').first()
+        PdfRenderJob.objects.create(invoice=cls.invoice, cache_key='x')
+        ContactMessage.objects.bulk_create(
+            ContactMessage(first_name='A', last_name='B', email='a@example.com', message='-') for _ in range(10))
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(PDF_CACHE_DIR=Path(self.tmp.name))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # PDF déjà en cache : l'export ZIP ne lance pas de rendu dans des threads
+        cache = pdf.PdfCache()
+        for invoice in Invoice.objects.filter(user=self.user):
+            cache.put(invoice.id, pdf.invoice_pdf_key(invoice)[1], b'%PDF-1.7 budget')
+
+    def requests(self):
+        """(méthode, URL, données) de chaque route, avec des paramètres réalistes"""
+        invoice = self.invoice.id
+        ids = list(Invoice.objects.filter(user=self.user).values_list('id', flat=True)[:20])
+        return {
+            'home': ('get', reverse('CORE:home'), {}),
+            'contact_submit': ('post', reverse('CORE:contact_submit'), {
+                'first_name': 'A', 'last_name': 'B', 'email': 'a@example.com', 'message': 'Bonjour'}),
+            'register': ('get', reverse('CORE:register'), {}),
+            'login': ('get', reverse('CORE:login'), {}),
+            'logout': ('get', reverse('CORE:logout'), {}),
+            'dashboard': ('get', reverse('CORE:dashboard'), {}),
+            'generate_invoice': ('get', reverse('CORE:generate_invoice'), {}),
+            'invoice_list': ('get', reverse('CORE:invoice_list'), {'status': 'paid'}),
+            'invoice_search': ('get', reverse('CORE:invoice_search'), {'q': 'prestation'}),
+            'invoice_list_more': ('get', reverse('CORE:invoice_list_more'), {}),
+            'invoice_batch_pdf': ('post', reverse('CORE:invoice_batch_pdf'), {'invoice_ids': ids}),
+            'invoice_export_zip': ('get', reverse('CORE:invoice_export_zip'), {}),
+            'invoice_export_ledger': ('get', reverse('CORE:invoice_export_ledger'), {'format': 'csv'}),
+            'invoice_import': ('get', reverse('CORE:invoice_import'), {}),
+            'invoice_detail': ('get', reverse('CORE:invoice_detail', args=[invoice]), {}),
+            'invoice_download_pdf': ('get', reverse('CORE:invoice_download_pdf', args=[invoice]), {}),
+            'invoice_pdf_status': ('get', reverse('CORE:invoice_pdf_status', args=[invoice]), {}),
+            'invoice_update_status': ('post', reverse('CORE:invoice_update_status', args=[invoice]), {'status': 'paid'}),
+            'invoice_delete': ('get', reverse('CORE:invoice_delete', args=[invoice]), {}),
+            'add_item_row': ('post', reverse('CORE:add_item_row'), {'items-TOTAL_FORMS': '3'}),
+            'client_list': ('get', reverse('CORE:client_list'), {}),
+            'client_create': ('get', reverse('CORE:client_create'), {}),
+            'client_suggestions': ('get', reverse('CORE:client_suggestions'), {'to_name': 'cli'}),
+            'catalog_list': ('get', reverse('CORE:catalog_list'), {}),
+            'catalog_create': ('get', reverse('CORE:catalog_create'), {}),
+            'catalog_reprice': ('post', reverse('CORE:catalog_reprice'), {'percent': '2'}),
+            'catalog_suggestions': ('get', reverse('CORE:catalog_suggestions'), {'items-0-description': 'art'}),
+            'profile_edit': ('get', reverse('CORE:profile_edit'), {}),
+            'privacy_policy': ('get', reverse('CORE:privacy_policy'), {}),
+        }
+
+    def measure(self, method, url, data):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, url)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def check(self, name, sqls, budget):
+        """Message d'échec (ou None) : dépassement du budget ou formes répétées"""
+        shapes = Counter(timing.query_shape(sql) for sql in sqls)
+        repeated = {shape: count for shape, count in shapes.items() if count >= self.REPEAT_THRESHOLD}
+        if len(sqls) <= budget and not repeated:
+            return None
+        lines = [f'{name}: {len(sqls)} requêtes (budget {budget})']
+        lines += [f'    {count}× {shape}' for shape, count in shapes.most_common() if count > 1]
+        return '\n'.join(lines)
+
+    def test_every_url_has_a_budget(self, *mocks):
+        names = {pattern.name for pattern in urlpatterns if isinstance(pattern, URLPattern)}
+        self.assertEqual(names - self.BUDGETS.keys(), set())
+        self.assertEqual(set(self.requests()), names)
+
+    def test_url_query_budgets(self, *mocks):
+        self.client.force_login(self.user)
+        failures = []
+        for name, (method, url, data) in self.requests().items():
+            with self.subTest(name):
+                failure = self.check(name, self.measure(method, url, data), self.BUDGETS[name])
+                if failure:
+                    failures.append(failure)
+            self.client.force_login(self.user)
+        self.assertEqual(failures, [], '\n' + '\n'.join(failures))
+
+    def test_admin_changelist_budgets(self, *mocks):
+        self.client.force_login(self.admin)
+        failures = []
+        for model in admin.site._registry:
+            url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+            failure = self.check(url, self.measure('get', url, {}), self.ADMIN_CHANGELIST_BUDGET)
+            if failure:
+                failures.append(failure)
+        self.assertEqual(failures, [], '\n' + '\n'.join(failures))
+
+    def test_detector_reports_repeated_shapes_with_stack(self, *mocks):
+        detector = timing.RepeatedQueryDetector(threshold=3)
+        with connection.execute_wrapper(detector):
+            for invoice in Invoice.objects.filter(user=self.user)[:4]:
+                list(invoice.items.all())
+        [repeated] = detector.repeated()
+        self.assertEqual(repeated['count'], 4)
+        self.assertIn('"CORE_invoiceitem"."invoice_id" = ?', repeated['sql'])
+        self.assertTrue(any('test_detector_reports_repeated_shapes_with_stack' in frame for frame in repeated['stack']))
+
+
+class SeedBenchmarkTests(TestCase):
+    def test_seed_is_consistent_and_flushable(self):
+        report = seeding.seed(users=3, invoices=40, clients=5, seed=1, today=date(2025, 6, 30))
+        self.assertEqual((report.users, report.clients), (3, 15))
+        first = User.objects.get(username='bench-0001')
+        self.assertEqual(first.invoices.count(), 40)
+        self.assertTrue(first.check_password(seeding.DEFAULT_PASSWORD))
+        self.assertEqual(Invoice.objects.count(), report.invoices)
+        self.assertEqual(InvoiceItem.objects.count(), report.items)
+        for invoice in Invoice.objects.annotate(lines=Sum('items__line_total')):
+            self.assertEqual(invoice.subtotal, invoice.lines)
+            self.assertEqual(compute_totals(invoice.lines, invoice.vat_rate, invoice.is_vat_exempt)[2], invoice.total)
+        self.assertEqual(stats.find_drift(), [])
+        invoice = first.invoices.first()
+        self.assertIn(invoice, search.search_invoices(first, invoice.invoice_number)[0])
+
+        with self.assertRaises(CommandError):
+            call_command('seed_benchmark', '--users', '1', stdout=io.StringIO())
+        self.assertEqual(seeding.flush(), 3)
+        self.assertFalse(Invoice.objects.exists())
+        self.assertFalse(InvoiceStats.objects.exists())
+
+    def test_benchmark_command_writes_results_and_flags_regressions(self):
+        seeding.seed(users=1, invoices=15, clients=3)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        baseline, output = Path(tmp.name) / 'baseline.json', Path(tmp.name) / 'latest.json'
+        options = ['--scenario', 'dashboard', '--scenario', 'invoice_detail', '--scenario', 'invoice_create',
+                   '--iterations', '3', '--warmup', '1', '--baseline', str(baseline)]
+        call_command('benchmark', *options, '--save-baseline', stdout=io.StringIO())
+        call_command('benchmark', *options, '--output', str(output), '--tolerance', '1000', stdout=io.StringIO())
+
+        results = json.loads(output.read_text())
+        self.assertEqual(set(results['scenarios']), {'dashboard', 'invoice_detail', 'invoice_create'})
+        self.assertEqual(results['scenarios']['invoice_create']['statuses'], [302])
+        self.assertLessEqual(results['scenarios']['invoice_detail']['queries'], 4)
+        # Les factures créées pendant la mesure sont supprimées
+        self.assertEqual(Invoice.objects.count(), 15)
+
+        saved = json.loads(baseline.read_text())
+        saved['scenarios']['dashboard']['queries'] -= 1
+        baseline.write_text(json.dumps(saved))
+        with self.assertRaisesMessage(CommandError, '1 régression'):
+            call_command('benchmark', *options, '--tolerance', '1000', stdout=io.StringIO())
+
+    def test_compare_ignores_small_latency_changes(self):
+        scenario = {'p50_ms': 10.0, 'p95_ms': 12.0, 'queries': 4}
+        slower = {'scenarios': {'list': {**scenario, 'p50_ms': 14.0, 'p95_ms': 40.0}}}
+        rows = benchmarks.compare(slower, {'scenarios': {'list': scenario}}, tolerance=0.2, min_delta_ms=5)
+        self.assertEqual([(metric, regression) for _, metric, *_, regression in rows],
+                         [('p50_ms', False), ('p95_ms', True), ('queries', False)])
+        self.assertEqual(benchmarks.percentile([5, 1, 4, 2, 3], 0.95), 5)
+        self.assertEqual(benchmarks.percentile([5, 1, 4, 2, 3], 0.5), 3)
+
+
+class SingleThreadedLiveServer(LiveServerThread):
+    # Le serveur multi-thread partage la connexion SQLite en mémoire des tests entre ses threads
+    def _create_server(self, connections_override=None):
+        return WSGIServer((self.host, self.port), QuietWSGIRequestHandler, allow_reuse_address=False)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoadTestHarnessTests(LiveServerTestCase):
+    server_thread_class = SingleThreadedLiveServer
+
+    def test_virtual_users_log_in_and_run_mixed_scenarios(self):
+        seeded = seeding.seed(users=2, invoices=10, clients=3).invoices
+        mix = loadtest.parse_mix('dashboard=2,invoice_detail=1,invoice_create=1')
+        result = loadtest.LoadTest(self.live_server_url, concurrency=3, duration=1, mix=mix, items=2).run()
+
+        self.assertEqual((result['login_errors'], result['errors']), (0, 0), result['error_samples'])
+        self.assertGreater(result['scenarios']['invoice_create']['requests'], 0)
+        self.assertEqual(set(result['scenarios']), {'dashboard', 'invoice_detail', 'invoice_create'})
+        # Factures créées pendant le tir supprimées, jeu de données intact
+        self.assertEqual(Invoice.objects.count(), seeded)
+
+    def test_wrong_password_is_reported_as_login_error(self):
+        seeding.seed(users=1, invoices=2, clients=1)
+        result = loadtest.LoadTest(self.live_server_url, concurrency=1, duration=0.2, password='faux').run()
+        self.assertEqual((result['login_errors'], result['requests']), (1, 0))
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('dashboard=1,inconnu=2')
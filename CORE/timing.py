@@ -0,0 +1,161 @@
+"""
+Mesures de temps par requête (voir ``CORE.middleware.ServerTimingMiddleware``).
+
+Les mesures de la requête en cours sont portées par une ``ContextVar`` :
+``measure('pdf')`` ajoute sa durée à la requête si elle est instrumentée et
+ne coûte presque rien sinon (commandes, workers). Les requêtes SQL sont
+comptées par ``connection.execute_wrapper`` et le rendu des templates par
+``instrument_templates``. Une mesure imbriquée sous le même nom n'est comptée
+qu'une fois ; des noms différents peuvent se recouvrir (le rendu PDF inclut
+celui de son template HTML).
+
+``query_shape`` réduit une requête SQL à sa forme (valeurs et listes IN
+effacées) : ``RepeatedQueryDetector`` et les tests de budget de requêtes s'en
+servent pour repérer les N+1.
+"""
+import contextvars
+import re
+import traceback
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+# Mesures publiées dans l'en-tête Server-Timing, dans cet ordre
+METRICS = ['sql', 'tpl', 'pdf']
+STACK_DEPTH = 6
+_PROJECT_DIR = str(Path(__file__).resolve().parent.parent)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_VALUE_LISTS = re.compile(r"\((?:\?, )*\?\)")
+
+
+def stack_summary(depth=STACK_DEPTH):
+    """Derniers appels du code du projet (hors Django et bibliothèques)"""
+    frames = [frame for frame in traceback.extract_stack()[:-1]
+              if frame.filename.startswith(_PROJECT_DIR) and 'site-packages' not in frame.filename
+              and not frame.filename.endswith('timing.py')]
+    return [f"{Path(frame.filename).relative_to(_PROJECT_DIR)}:{frame.lineno} {frame.name}"
+            for frame in frames[-depth:]]
+
+
+class RequestMetrics:
+    """Durées cumulées (secondes) et requêtes SQL d'une requête HTTP"""
+
+    def __init__(self, max_queries=None, slow_query=None):
+        self.durations = defaultdict(float)
+        self.sql_count = 0
+        self.queries = []
+        self.slow_queries = []
+        self.max_queries = settings.SLOW_REQUEST_MAX_QUERIES if max_queries is None else max_queries
+        self.slow_query = (settings.SLOW_QUERY_MS if slow_query is None else slow_query) / 1000
+        self._depth = defaultdict(int)
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - start
+            self.durations['sql'] += elapsed
+            self.sql_count += 1
+            if len(self.queries) < self.max_queries:
+                self.queries.append((sql, elapsed))
+            # La pile n'est capturée que pour les requêtes lentes : coût nul sinon
+            if elapsed >= self.slow_query and len(self.slow_queries) < self.max_queries:
+                self.slow_queries.append({'sql': sql, 'ms': round(elapsed * 1000, 2), 'stack': stack_summary()})
+
+    def server_timing(self, total):
+        """Valeur de l'en-tête Server-Timing (durées en millisecondes)"""
+        parts = [f'sql;dur={self.durations["sql"] * 1000:.1f};desc="{self.sql_count} queries"']
+        parts += [f'{name};dur={self.durations[name] * 1000:.1f}' for name in METRICS[1:] if name in self.durations]
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+    def top_queries(self, limit=10):
+        """Requêtes identiques regroupées, les plus coûteuses d'abord"""
+        grouped = {}
+        for sql, elapsed in self.queries:
+            entry = grouped.setdefault(sql, {'sql': sql, 'count': 0, 'ms': 0.0})
+            entry['count'] += 1
+            entry['ms'] += elapsed * 1000
+        top = sorted(grouped.values(), key=lambda entry: entry['ms'], reverse=True)[:limit]
+        for entry in top:
+            entry['ms'] = round(entry['ms'], 2)
+        return top
+
+
+def activate(metrics):
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+@contextmanager
+def measure(name):
+    """Ajoute la durée du bloc à la mesure ``name`` de la requête en cours"""
+    metrics = _current.get()
+    if metrics is None or metrics._depth[name]:
+        yield
+        return
+    metrics._depth[name] += 1
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.durations[name] += perf_counter() - start
+        metrics._depth[name] -= 1
+
+
+def instrument_templates():
+    """Mesure le rendu des templates Django ('tpl') ; idempotent"""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, 'timed', False):
+        return
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        with measure('tpl'):
+            return original(self, context, request)
+
+    render.timed = True
+    Template.render = render
+
+
+def query_shape(sql):
+    """
+    Forme d'une requête : valeurs littérales et paramètres remplacés par ``?``,
+    listes ``IN (...)`` réduites, pour que deux requêtes d'une boucle se confondent.
+    """
+    return _VALUE_LISTS.sub('(...)', _LITERALS.sub('?', sql))
+
+
+class RepeatedQueryDetector:
+    """
+    ``execute_wrapper`` comptant les requêtes par forme ; la pile d'appel est
+    capturée une fois par forme, quand elle atteint ``threshold`` exécutions.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = Counter()
+        self.stacks = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = query_shape(sql)
+        self.counts[shape] += 1
+        if self.counts[shape] == self.threshold:
+            self.stacks[shape] = stack_summary()
+        return execute(sql, params, many, context)
+
+    def repeated(self):
+        """Formes exécutées au moins ``threshold`` fois, les plus fréquentes d'abord"""
+        return [{'sql': shape, 'count': count, 'stack': self.stacks[shape]}
+                for shape, count in self.counts.most_common() if count >= self.threshold]
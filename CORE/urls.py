@@ -19,8 +19,15 @@ urlpatterns = [
     # Factures
     path('invoice/new/', views.generate_invoice_form, name='generate_invoice'),
     path('invoice/', views.invoice_list, name='invoice_list'),
+    path('invoice/search/', views.invoice_search, name='invoice_search'),
+    path('invoice/more/', views.invoice_list_more, name='invoice_list_more'),
+    path('invoice/batch-pdf/', views.invoice_batch_pdf, name='invoice_batch_pdf'),
+    path('invoice/export/zip/', views.invoice_export_zip, name='invoice_export_zip'),
+    path('invoice/export/ledger/', views.invoice_export_ledger, name='invoice_export_ledger'),
+    path('invoice/import/', views.invoice_import, name='invoice_import'),
     path('invoice/<int:invoice_id>/', views.invoice_detail, name='invoice_detail'),
     path('invoice/<int:invoice_id>/pdf/', views.invoice_download_pdf, name='invoice_download_pdf'),
+    path('invoice/<int:invoice_id>/pdf/status/', views.invoice_pdf_status, name='invoice_pdf_status'),
     path('invoice/<int:invoice_id>/update-status/', views.invoice_update_status, name='invoice_update_status'),
     path('invoice/<int:invoice_id>/delete/', views.invoice_delete, name='invoice_delete'),
     
@@ -30,6 +37,13 @@ urlpatterns = [
     # Clients
     path('clients/', views.client_list, name='client_list'),
     path('clients/new/', views.client_create, name='client_create'),
+    path('clients/suggestions/', views.client_suggestions, name='client_suggestions'),
+
+    # Catalogue
+    path('catalog/', views.catalog_list, name='catalog_list'),
+    path('catalog/new/', views.catalog_create, name='catalog_create'),
+    path('catalog/reprice/', views.catalog_reprice, name='catalog_reprice'),
+    path('catalog/suggestions/', views.catalog_suggestions, name='catalog_suggestions'),
     
     # Profil utilisateur
     path('profile/edit/', views.profile_edit, name='profile_edit'),
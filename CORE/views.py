@@ -1,11 +1,11 @@
-import json
-import os
-from pathlib import Path
+import io
 from decimal import Decimal
 from datetime import datetime
 
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, Http404
+from django.conf import settings
+from django.http import HttpResponse, Http404, FileResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_protect
 from django.template.loader import render_to_string
 from django.forms import formset_factory
@@ -13,17 +13,25 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib import messages
-from django.db import transaction
-
-try:
-    from weasyprint import HTML, CSS
-    WEASYPRINT_AVAILABLE = True
-except (ImportError, OSError) as e:
-    WEASYPRINT_AVAILABLE = False
-    print(f"WeasyPrint non disponible: {e}")
-
-from .forms import InvoiceForm, ItemForm, UserProfileForm, ClientForm, ContactForm
-from .models import Invoice, InvoiceItem, UserProfile, Client, ContactMessage
+from django.core.exceptions import ValidationError
+
+from .forms import (
+    InvoiceForm, ItemForm, UserProfileForm, ClientForm, ContactForm, InvoiceExportForm, InvoiceFilterForm,
+    InvoiceImportForm, CatalogItemForm, CatalogRepriceForm,
+)
+from .models import Invoice, UserProfile, Client, CatalogItem, ContactMessage, normalize_name
+from .exports import LEDGER_FORMATS, stream_invoices_zip, stream_ledger
+from .importers import detect_format, import_invoices
+from .pdf import (
+    PdfCache, PdfUnavailable, get_invoice_pdf, invoice_pdf_key, render_invoices_batch_pdf,
+    weasyprint_available,
+)
+from .pagination import keyset_page
+from .caching import cached_fragment, fragment_key, template_fragments
+from .search import search_invoices, suggest_catalog_items, suggest_clients
+from .services import create_invoice, reprice_catalog
+from .pdf_jobs import enqueue_pdf_job, pdf_job_status
+from .stats import dashboard_stats
 
 
 def _build_items_from_formset(items_formset):
@@ -40,12 +48,10 @@ def _build_items_from_formset(items_formset):
         qty = cleaned.get('quantity')
         price = cleaned.get('unit_price')
         if desc and qty is not None and price is not None:
-            line_total = Decimal(str(qty)) * Decimal(str(price))
             items.append({
                 'description': desc,
                 'quantity': Decimal(str(qty)),
                 'unit_price': Decimal(str(price)),
-                'line_total': line_total,
             })
     return items
 
@@ -107,48 +113,55 @@ def dashboard(request):
     """Dashboard utilisateur avec statistiques et liste des factures"""
     invoices = Invoice.objects.filter(user=request.user).order_by('-created_at')
     
-    # Statistiques
-    total_invoices = invoices.count()
-    paid_invoices = invoices.filter(status='paid').count()
-    pending_invoices = invoices.filter(status__in=['draft', 'sent']).count()
-    overdue_invoices = invoices.filter(status='overdue').count()
-    
-    # Montants
-    total_revenue = sum([inv.total for inv in invoices.filter(status='paid')])
-    pending_amount = sum([inv.total for inv in invoices.filter(status__in=['draft', 'sent', 'overdue'])])
+    # Statistiques et montants lus depuis les agrégats mensuels (CORE.stats)
+    stats = dashboard_stats(request.user)
     
     context = {
         'invoices': invoices[:10],  # Les 10 dernières
-        'total_invoices': total_invoices,
-        'paid_invoices': paid_invoices,
-        'pending_invoices': pending_invoices,
-        'overdue_invoices': overdue_invoices,
-        'total_revenue': total_revenue,
-        'pending_amount': pending_amount,
+        **stats,
+        **template_fragments(request.user),
     }
     return render(request, 'CORE/dashboard.html', context)
 
 
 # ============== GESTION DES FACTURES ==============
 
-@login_required
-def invoice_list(request):
-    """Liste de toutes les factures de l'utilisateur"""
+def _invoice_list_page(request):
+    """Page de factures filtrées à partir du curseur de la requête"""
+    filter_form = InvoiceFilterForm(request.GET)
     invoices = Invoice.objects.filter(user=request.user)
+    if filter_form.is_valid():
+        invoices = filter_form.filter(invoices)
+    page, next_cursor = keyset_page(invoices, request.GET.get('cursor'), settings.INVOICE_LIST_PAGE_SIZE)
     
-    # Filtres
-    status_filter = request.GET.get('status')
-    if status_filter:
-        invoices = invoices.filter(status=status_filter)
-    
-    return render(request, 'CORE/invoice_list.html', {'invoices': invoices})
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    more_url = None
+    if next_cursor:
+        query['cursor'] = next_cursor
+        more_url = f"{reverse('CORE:invoice_list_more')}?{query.urlencode()}"
+    return {'invoices': page, 'more_url': more_url, 'filter_form': filter_form, **template_fragments(request.user)}
+
+
+@login_required
+def invoice_list(request):
+    """Liste des factures de l'utilisateur (filtrée, paginée par curseur)"""
+    context = _invoice_list_page(request)
+    context['export_form'] = InvoiceExportForm()
+    return render(request, 'CORE/invoice_list.html', context)
+
+
+@login_required
+def invoice_list_more(request):
+    """HTMX endpoint: lignes de la page suivante et nouveau bouton « Charger plus »"""
+    return render(request, 'CORE/_invoice_rows.html', _invoice_list_page(request))
 
 
 @login_required
 def invoice_detail(request, invoice_id):
     """Détail d'une facture"""
     invoice = get_object_or_404(Invoice, id=invoice_id, user=request.user)
-    return render(request, 'CORE/invoice_detail.html', {'invoice': invoice})
+    return render(request, 'CORE/invoice_detail.html', {'invoice': invoice, **template_fragments(request.user)})
 
 
 @login_required
@@ -178,76 +191,144 @@ def invoice_delete(request, invoice_id):
 
 @login_required
 def invoice_download_pdf(request, invoice_id):
-    """Télécharger le PDF d'une facture existante"""
+    """Télécharger le PDF d'une facture existante (servi depuis le cache si possible)"""
     invoice = get_object_or_404(Invoice, id=invoice_id, user=request.user)
+    filename = f"facture_{invoice.invoice_number}_{datetime.now().strftime('%Y%m%d')}.pdf"
     
-    # Préparer les items
-    items = []
-    for item in invoice.items.all():
-        items.append({
-            'description': item.description,
-            'quantity': float(item.quantity),
-            'unit_price': float(item.unit_price),
-            'line_total': float(item.line_total),
-        })
-    
-    # Préparer le contexte
-    vat_note = "TVA non applicable, art. 293 B du CGI" if invoice.is_vat_exempt else None
-    penalties_note = f"Pénalités de retard: {invoice.late_fee_rate}%/an à compter du lendemain de la date d'échéance." if invoice.late_fee_rate else None
-    recovery_note = "Indemnité forfaitaire de recouvrement: 40 € due en cas de retard de paiement." if invoice.recovery_fee else None
-    
-    context = {
-        'from_name': invoice.from_name,
-        'from_address': invoice.from_address,
-        'from_city': invoice.from_city,
-        'from_email': invoice.from_email,
-        'siret': invoice.siret,
-        'rcs': invoice.rcs,
-        'is_ei': invoice.is_ei,
-        'to_name': invoice.to_name,
-        'to_address': invoice.to_address,
-        'to_city': invoice.to_city,
-        'to_email': invoice.to_email,
-        'invoice_number': invoice.invoice_number,
-        'invoice_date': invoice.invoice_date,
-        'service_date_start': invoice.service_date_start,
-        'service_date_end': invoice.service_date_end,
-        'due_date': invoice.due_date,
-        'items': items,
-        'is_vat_exempt': invoice.is_vat_exempt,
-        'vat_rate': float(invoice.vat_rate),
-        'subtotal': float(invoice.subtotal),
-        'vat_amount': float(invoice.vat_amount),
-        'total': float(invoice.total),
-        'vat_note': vat_note,
-        'payment_terms': invoice.payment_terms,
-        'penalties_note': penalties_note,
-        'recovery_note': recovery_note,
-        'autoliquidation': invoice.autoliquidation,
-    }
-    
-    html_string = render_to_string('CORE/invoice.html', context)
-    
-    if not WEASYPRINT_AVAILABLE:
-        return HttpResponse("WeasyPrint n'est pas installé.", status=500)
+    if settings.PDF_ASYNC_RENDERING:
+        # Mode asynchrone : servir le cache ou déléguer le rendu à pdf_worker
+        _, cache_key = invoice_pdf_key(invoice)
+        pdf_path = PdfCache().get(invoice.id, cache_key)
+        if pdf_path is None:
+            enqueue_pdf_job(invoice, cache_key)
+            return render(request, 'CORE/pdf_pending.html', {'invoice': invoice}, status=202)
+        return FileResponse(open(pdf_path, 'rb'), as_attachment=True, filename=filename, content_type='application/pdf')
     
     try:
-        html = HTML(string=html_string, base_url=None)
-        css_file = Path(__file__).resolve().parent.parent / 'static' / 'CORE' / 'css' / 'invoice.css'
-        if css_file.exists():
-            pdf = html.write_pdf(stylesheets=[CSS(css_file)])
-        else:
-            pdf = html.write_pdf()
-        
-        response = HttpResponse(pdf, content_type='application/pdf')
-        filename = f"facture_{invoice.invoice_number}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
+        pdf_path = get_invoice_pdf(invoice)
+        return FileResponse(open(pdf_path, 'rb'), as_attachment=True, filename=filename, content_type='application/pdf')
+    except PdfUnavailable as e:
+        return HttpResponse(str(e), status=500)
     except Exception as e:
         import traceback
         return HttpResponse(f"Erreur: {str(e)}<br><pre>{traceback.format_exc()}</pre>", status=500)
 
 
+@login_required
+def invoice_pdf_status(request, invoice_id):
+    """État du rendu PDF asynchrone (interrogé par la page d'attente)"""
+    invoice = get_object_or_404(Invoice, id=invoice_id, user=request.user)
+    _, cache_key = invoice_pdf_key(invoice)
+    if PdfCache().get(invoice.id, cache_key) is not None:
+        status, error = 'done', ''
+    else:
+        job = pdf_job_status(invoice, cache_key)
+        status, error = job.status, job.error
+    return JsonResponse({
+        'status': status,
+        'error': error,
+        'download_url': reverse('CORE:invoice_download_pdf', args=[invoice.id]),
+    })
+
+
+@login_required
+def invoice_batch_pdf(request):
+    """Un seul PDF multi-pages pour les factures sélectionnées (impression groupée)"""
+    if request.method != 'POST':
+        return redirect('CORE:invoice_list')
+    ids = [int(pk) for pk in request.POST.getlist('invoice_ids') if pk.isdigit()]
+    if not ids:
+        messages.error(request, 'Sélectionnez au moins une facture à imprimer.')
+        return redirect('CORE:invoice_list')
+    if len(ids) > settings.PDF_BATCH_MAX_INVOICES:
+        messages.error(request, f'Impression groupée limitée à {settings.PDF_BATCH_MAX_INVOICES} factures.')
+        return redirect('CORE:invoice_list')
+    
+    invoices = list(Invoice.objects.filter(user=request.user, id__in=ids).prefetch_related('items'))
+    if not invoices:
+        raise Http404("Aucune facture trouvée.")
+    try:
+        pdf = render_invoices_batch_pdf(invoices)
+    except PdfUnavailable as e:
+        return HttpResponse(str(e), status=500)
+    
+    response = HttpResponse(pdf, content_type='application/pdf')
+    filename = f"factures_{datetime.now().strftime('%Y%m%d')}.pdf"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def invoice_export_zip(request):
+    """Archive ZIP (en flux) des PDF des factures filtrées par période et statut"""
+    form = InvoiceExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponse("Filtres d'export invalides.", status=400)
+    invoices = form.filter(Invoice.objects.filter(user=request.user)).prefetch_related('items')
+    response = StreamingHttpResponse(stream_invoices_zip(invoices.iterator(chunk_size=100)),
+                                     content_type='application/zip')
+    filename = f"factures_{datetime.now().strftime('%Y%m%d')}.zip"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def invoice_search(request):
+    """Recherche plein texte dans les factures de l'utilisateur (résultats classés, paginés)"""
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    invoices, has_next = search_invoices(request.user, query, page) if query else ([], False)
+    return render(request, 'CORE/invoice_search.html', {
+        'query': query,
+        'invoices': invoices,
+        'page': page,
+        'has_next': has_next,
+    })
+
+
+@login_required
+def invoice_export_ledger(request):
+    """Grand livre (CSV ou XLSX, en flux) des factures et de leurs lignes, avec les filtres de la liste"""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in LEDGER_FORMATS:
+        return HttpResponse("Format d'export inconnu.", status=400)
+    form = InvoiceFilterForm(request.GET)
+    if not form.is_valid():
+        return HttpResponse("Filtres d'export invalides.", status=400)
+    invoices = form.filter(Invoice.objects.filter(user=request.user))
+    content_type, extension = LEDGER_FORMATS[fmt]
+    response = StreamingHttpResponse(stream_ledger(invoices, fmt), content_type=content_type)
+    filename = f"factures_{datetime.now().strftime('%Y%m%d')}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def invoice_import(request):
+    """Import en masse de factures depuis un fichier CSV ou JSON Lines, avec rapport d'erreurs"""
+    report = None
+    if request.method == 'POST':
+        form = InvoiceImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            # Lecture en flux : au-delà de FILE_UPLOAD_MAX_MEMORY_SIZE le fichier est sur disque
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                report = import_invoices(request.user, stream, detect_format(upload.name),
+                                         dry_run=form.cleaned_data['dry_run'])
+            except UnicodeDecodeError:
+                form.add_error('file', "Le fichier doit être encodé en UTF-8.")
+            else:
+                if report.invoices and not report.dry_run:
+                    messages.success(request, f'{report.invoices} facture(s) importée(s).')
+    else:
+        form = InvoiceImportForm()
+    return render(request, 'CORE/invoice_import.html', {'form': form, 'report': report})
+
+
 # ============== CRÉATION DE FACTURE ==============
 
 @login_required
@@ -299,68 +380,18 @@ def generate_invoice_form(request):
                     'description': data['description'],
                     'quantity': qty,
                     'unit_price': price,
-                    'line_total': qty * price,
                 }]
             
-            # Totaux
-            subtotal = Decimal('0')
-            for it in items:
-                subtotal += it['line_total']
-            
-            # Gestion TVA
-            is_vat_exempt = bool(data.get('is_vat_exempt'))
-            vat_rate_input = data.get('vat_rate') if data.get('vat_rate') is not None else Decimal('0')
-            vat_rate = Decimal('0') if is_vat_exempt else Decimal(str(vat_rate_input))
-            vat_amount = subtotal * (vat_rate / 100)
-            total = subtotal + vat_amount
-            
-            # Sauvegarder la facture dans la base de données
-            with transaction.atomic():
-                invoice = Invoice.objects.create(
-                    user=request.user,
-                    from_name=data['from_name'],
-                    from_address=data['from_address'],
-                    from_city=data.get('from_city', ''),
-                    from_email=data.get('from_email', ''),
-                    siret=data.get('siret', ''),
-                    rcs=data.get('rcs', ''),
-                    is_ei=data.get('is_ei', False),
-                    to_name=data['to_name'],
-                    to_address=data['to_address'],
-                    to_city=data.get('to_city', ''),
-                    to_email=data.get('to_email', ''),
-                    invoice_number=data['invoice_number'],
-                    invoice_date=data['invoice_date'],
-                    service_date_start=data.get('service_date_start'),
-                    service_date_end=data.get('service_date_end'),
-                    due_date=data['due_date'],
-                    subtotal=subtotal,
-                    vat_rate=vat_rate,
-                    vat_amount=vat_amount,
-                    total=total,
-                    is_vat_exempt=is_vat_exempt,
-                    payment_terms=data.get('payment_terms', ''),
-                    late_fee_rate=data.get('late_fee_rate'),
-                    recovery_fee=data.get('recovery_fee', False),
-                    autoliquidation=data.get('autoliquidation', False),
-                    status='draft',
-                )
-                
-                # Sauvegarder les items
-                for idx, item_data in enumerate(items):
-                    InvoiceItem.objects.create(
-                        invoice=invoice,
-                        description=item_data['description'],
-                        quantity=item_data['quantity'],
-                        unit_price=item_data['unit_price'],
-                        line_total=item_data['line_total'],
-                        order=idx,
-                    )
-            
-            messages.success(request, f'Facture {invoice.invoice_number} créée avec succès ! Vous pouvez maintenant la consulter et télécharger le PDF.')
-            
-            # Rediriger vers la page de détail de la facture
-            return redirect('CORE:invoice_detail', invoice_id=invoice.id)
+            try:
+                invoice = create_invoice(request.user, data, items)
+            except ValidationError as e:
+                for field, errors in e.message_dict.items():
+                    form.add_error(field if field in form.fields else None, errors)
+            else:
+                messages.success(request, f'Facture {invoice.invoice_number} créée avec succès ! Vous pouvez maintenant la consulter et télécharger le PDF.')
+
+                # Rediriger vers la page de détail de la facture
+                return redirect('CORE:invoice_detail', invoice_id=invoice.id)
     else:
         form = InvoiceForm(initial=initial_data)
         items_formset = ItemFormSet(prefix='items')
@@ -368,7 +399,7 @@ def generate_invoice_form(request):
     return render(request, 'CORE/form.html', {
         'form': form,
         'items_formset': items_formset,
-        'weasyprint_available': WEASYPRINT_AVAILABLE
+        'weasyprint_available': weasyprint_available()
     })
 
 
@@ -419,6 +450,67 @@ def client_create(request):
     return render(request, 'CORE/client_form.html', {'form': form})
 
 
+@login_required
+def client_suggestions(request):
+    """HTMX endpoint: clients dont le nom commence par la saisie (fragment en cache)"""
+    query = request.GET.get('to_name', '')[:200]
+    key = fragment_key('clients', request.user.pk, 'suggestions', normalize_name(query))
+    return HttpResponse(cached_fragment(key, lambda: render_to_string('CORE/_client_suggestions.html', {
+        'clients': suggest_clients(request.user, query),
+    })))
+
+
+# ============== CATALOGUE ==============
+
+@login_required
+def catalog_list(request):
+    """Catalogue des prestations de l'utilisateur et révision des prix"""
+    catalog = CatalogItem.objects.filter(user=request.user).only('id', 'description', 'unit_price', 'updated_at')
+    return render(request, 'CORE/catalog_list.html', {
+        'catalog': catalog,
+        'reprice_form': CatalogRepriceForm(),
+    })
+
+
+@login_required
+def catalog_create(request):
+    """Ajouter un article au catalogue"""
+    if request.method == 'POST':
+        form = CatalogItemForm(request.POST)
+        if form.is_valid():
+            item = form.save(request.user)
+            messages.success(request, f'« {item.description} » ajouté au catalogue.')
+            return redirect('CORE:catalog_list')
+    else:
+        form = CatalogItemForm()
+    return render(request, 'CORE/catalog_form.html', {'form': form})
+
+
+@login_required
+def catalog_reprice(request):
+    """Applique une variation de prix à tout ou partie du catalogue (un seul UPDATE)"""
+    if request.method != 'POST':
+        return redirect('CORE:catalog_list')
+    form = CatalogRepriceForm(request.POST)
+    if form.is_valid():
+        count = reprice_catalog(request.user, form.cleaned_data['percent'], form.cleaned_data['prefix'])
+        messages.success(request, f'{count} prix mis à jour.')
+    else:
+        messages.error(request, 'Variation de prix invalide.')
+    return redirect('CORE:catalog_list')
+
+
+@login_required
+def catalog_suggestions(request):
+    """HTMX endpoint: articles du catalogue pour le champ description d'une ligne (fragment en cache)"""
+    # Le champ envoyé est celui de la ligne : items-<n>-description
+    query = next((value for name, value in request.GET.items() if name.endswith('description')), '')[:500]
+    key = fragment_key('catalog', request.user.pk, 'suggestions', normalize_name(query))
+    return HttpResponse(cached_fragment(key, lambda: render_to_string('CORE/_catalog_suggestions.html', {
+        'catalog': suggest_catalog_items(request.user, query),
+    })))
+
+
 # ============== PROFIL UTILISATEUR ==============
 
 @login_required
@@ -29,12 +29,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'CORE.middleware.ServerTimingMiddleware',
+    'CORE.middleware.RepeatedQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'CORE.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -69,6 +72,58 @@ DATABASES = {
     }
 }
 
+# Profil SQLite : « wal » (défaut, plusieurs workers gunicorn) ou « default »
+# (réglages d'origine de SQLite et de Django, pour comparer avec `manage.py loadtest`).
+# - journal WAL : les lectures ne bloquent plus l'écriture et inversement ;
+# - synchronous=NORMAL : fsync aux checkpoints seulement, sans risque de corruption en WAL ;
+# - cache_size (Kio, par connexion), mmap_size (octets, partagé par le cache du système) ;
+# - transactions IMMEDIATE : le verrou d'écriture est pris dès BEGIN, un écrivain
+#   concurrent attend (timeout) au lieu d'échouer en « database is locked » lors
+#   de la promotion d'une transaction commencée en lecture ;
+# - connexions persistantes (CONN_MAX_AGE) : pas de réouverture du fichier ni de
+#   PRAGMA à chaque requête.
+DATABASE_PROFILE = os.getenv('DATABASE_PROFILE', 'wal')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -int(os.getenv('SQLITE_CACHE_KB', 20000)),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_BYTES', 256 * 1024 * 1024)),
+    'temp_store': 'MEMORY',
+    'journal_size_limit': 64 * 1024 * 1024,
+}
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 20))
+if DATABASE_PROFILE == 'wal':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_BUSY_TIMEOUT,
+        },
+    })
+elif DATABASE_PROFILE != 'default':
+    raise ValueError(f"DATABASE_PROFILE inconnu : {DATABASE_PROFILE} (wal ou default)")
+
+# Réplique en lecture (optionnelle) : chemin d'une copie de la base, tenue à jour
+# par `manage.py sync_replica --interval REPLICA_SYNC_INTERVAL`. Les vues de
+# consultation lourdes la lisent (CORE.replica.REPLICA_VIEWS) ; les écritures et
+# les lectures d'un utilisateur pendant REPLICA_PIN_SECONDS après une de ses
+# écritures restent sur la base principale. REPLICA_PIN_SECONDS doit dépasser
+# l'intervalle de synchronisation.
+DATABASE_REPLICA = os.getenv('DATABASE_REPLICA', '')
+REPLICA_SYNC_INTERVAL = float(os.getenv('REPLICA_SYNC_INTERVAL', 5))
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 15))
+if DATABASE_REPLICA:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': Path(DATABASE_REPLICA),
+        # Lectures seules : pas de verrou d'écriture pris au BEGIN (transactions IMMEDIATE)
+        'OPTIONS': {name: value for name, value in DATABASES['default'].get('OPTIONS', {}).items()
+                    if name != 'transaction_mode'},
+    }
+    DATABASE_ROUTERS = ['CORE.replica.PrimaryReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -116,6 +171,83 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Nombre de factures par page (pagination par curseur de la liste)
+INVOICE_LIST_PAGE_SIZE = int(os.getenv('INVOICE_LIST_PAGE_SIZE', 50))
+
+# Cache des fragments de templates et des suggestions (clés versionnées par
+# Invoice.updated_at et un compteur de génération par utilisateur, voir CORE.caching).
+# file (défaut) : partagé par les workers gunicorn, une écriture invalide les
+# fragments de tous les processus. locmem reste propre à chaque processus : à
+# réserver à un serveur à un seul worker (les tests l'imposent, voir CORE/tests.py).
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'file')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'fragment_cache') if CACHE_BACKEND == 'file' else ''),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 20000))},
+    }
+}
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FRAGMENT_CACHE_TIMEOUT', 600))
+
+# Cache disque des PDF de factures (clé = empreinte du contenu, éviction LRU)
+PDF_CACHE_DIR = Path(os.getenv('PDF_CACHE_DIR', BASE_DIR / 'pdf_cache'))
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+
+# Rendu PDF asynchrone (opt-in) : les téléchargements déposent un job en base,
+# traité par `python manage.py pdf_worker`. À l'activation, lancer ce processus
+# à côté du serveur web (par ex. `worker: python manage.py pdf_worker` dans le Procfile).
+PDF_ASYNC_RENDERING = os.getenv('PDF_ASYNC_RENDERING', '').lower() in ('1', 'true', 'yes')
+PDF_WORKER_PROCESSES = int(os.getenv('PDF_WORKER_PROCESSES', 2))
+PDF_WORKER_POLL_INTERVAL = float(os.getenv('PDF_WORKER_POLL_INTERVAL', 1.0))
+PDF_JOB_TIMEOUT = int(os.getenv('PDF_JOB_TIMEOUT', 300))
+
+# Nombre maximal de processus de rendu pour les exports ZIP de factures. Chaque
+# export (requête web comprise) démarre son propre pool, jusqu'à PDF_EXPORT_WORKERS
+# processus, dès qu'un PDF manque au cache ; 1 = rendu dans le processus de la requête.
+PDF_EXPORT_WORKERS = int(os.getenv('PDF_EXPORT_WORKERS', 2))
+
+# Nombre maximal de factures par impression groupée (un seul PDF multi-pages)
+PDF_BATCH_MAX_INVOICES = int(os.getenv('PDF_BATCH_MAX_INVOICES', 200))
+
+# Instrumentation des requêtes (CORE.middleware.ServerTimingMiddleware) : en-tête
+# Server-Timing et une ligne JSON par requête dans le logger CORE.timing ; au-delà de
+# SLOW_REQUEST_MS, détail des requêtes SQL (et pile d'appel de celles > SLOW_QUERY_MS)
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', '1').lower() in ('1', 'true', 'yes')
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 1000))
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+SLOW_REQUEST_MAX_QUERIES = int(os.getenv('SLOW_REQUEST_MAX_QUERIES', 200))
+
+# Développement : détection des requêtes SQL répétées (N+1) par CORE.middleware.RepeatedQueryMiddleware,
+# active par défaut quand DEBUG vaut 1/true/yes (DEBUG=False reste une chaîne non vide)
+_DEBUG_ENABLED = (DEBUG or '').lower() in ('1', 'true', 'yes')
+N_PLUS_ONE_DETECTION = os.getenv('N_PLUS_ONE_DETECTION', '1' if _DEBUG_ENABLED else '').lower() in ('1', 'true', 'yes')
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'CORE.timing': {
+            'handlers': ['console'],
+            # Une ligne par requête (INFO) ; WARNING pour ne garder que les requêtes lentes
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        'CORE.queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 # Authentication
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
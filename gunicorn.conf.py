@@ -0,0 +1,44 @@
+"""
+Configuration gunicorn, chargée automatiquement par `gunicorn EasInvoice.wsgi`
+(Procfile) lorsqu'elle se trouve dans le répertoire courant.
+
+Préchauffage PDF (opt-in) :
+- PDF_WARMUP=1 : chaque worker rend une facture fictive juste après le fork,
+  la première vraie requête PDF n'importe donc plus WeasyPrint ;
+- GUNICORN_PRELOAD=1 : l'application et WeasyPrint sont chargés une seule fois
+  dans le processus maître puis partagés (copy-on-write) par les workers.
+"""
+import os
+
+
+def _enabled(name):
+    return os.getenv(name, '').lower() in ('1', 'true', 'yes')
+
+
+preload_app = _enabled('GUNICORN_PRELOAD')
+
+
+def when_ready(server):
+    # Processus maître, avant la création des workers : imports uniquement
+    if preload_app and _enabled('PDF_WARMUP'):
+        from CORE.pdf import _load_weasyprint, PdfUnavailable
+        try:
+            _load_weasyprint()
+        except PdfUnavailable as e:
+            server.log.warning("Préchargement WeasyPrint impossible: %s", e)
+
+
+def post_fork(server, worker):
+    if not _enabled('PDF_WARMUP'):
+        return
+    try:
+        if not preload_app:
+            import django
+            os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EasInvoice.settings')
+            django.setup()
+        from CORE.pdf import warm_up
+        warm_up()
+    except Exception as e:
+        server.log.warning("Préchauffage PDF impossible: %s", e)
+    else:
+        server.log.info("Worker %s: moteur PDF préchauffé", worker.pid)